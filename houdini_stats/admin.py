@@ -67,6 +67,22 @@ class HoudiniCrashAdmin(SelectRelatedModelAdmin):
                         
 #-------------------------------------------------------------------------------
 
+@admin_site_register(HoudiniCrashGroup)
+class HoudiniCrashGroupAdmin(SelectRelatedModelAdmin):
+    """
+    Control how the admin site displays crash groups, sorted on their
+    indexed statistics.
+    """
+    list_filter = ("is_fixed",)
+    list_display = ("id", "num_crashes", "num_machines", "first_seen",
+                    "last_seen", "latest_houdini_version", "is_fixed",
+                    "fixed_in_houdini_build")
+    list_display_links = ("id",)
+    list_per_page = 20
+    ordering = ["-num_crashes"]
+
+#-------------------------------------------------------------------------------
+
 @admin_site_register(HoudiniToolUsage)
 class HoudiniToolUsageAdmin(SelectRelatedModelAdmin):
     """
@@ -85,6 +101,49 @@ class HoudiniToolUsageAdmin(SelectRelatedModelAdmin):
 
 #-------------------------------------------------------------------------------
 
+@admin_site_register(HoudiniToolUsageDaily)
+class HoudiniToolUsageDailyAdmin(admin.ModelAdmin):
+    """
+    Control how the admin site displays the daily tool usage rollup.
+    """
+    list_filter = ("tool_creation_mode", "is_internal",)
+    list_display = ("day", "tool_name", "tool_creation_mode", "is_internal",
+                    "count")
+    list_display_links = list_display
+    list_per_page = 20
+    ordering = ["-day"]
+
+#-------------------------------------------------------------------------------
+
+@admin_site_register(HoudiniMachineActivityDaily)
+class HoudiniMachineActivityDailyAdmin(admin.ModelAdmin):
+    """
+    Control how the admin site displays the daily machine activity rollup.
+    """
+    list_filter = ("is_internal",)
+    list_display = ("day", "machine", "is_internal", "houdini_version",
+                    "num_sessions", "total_seconds", "total_idle_time",
+                    "num_crashes")
+    list_display_links = list_display
+    list_per_page = 20
+    ordering = ["-day"]
+
+#-------------------------------------------------------------------------------
+
+@admin_site_register(HoudiniCrashGroupDaily)
+class HoudiniCrashGroupDailyAdmin(admin.ModelAdmin):
+    """
+    Control how the admin site displays the daily crash group rollup.
+    """
+    list_filter = ("is_internal",)
+    list_display = ("day", "group", "is_internal", "houdini_version",
+                    "num_crashes")
+    list_display_links = list_display
+    list_per_page = 20
+    ordering = ["-day"]
+
+#-------------------------------------------------------------------------------
+
 @admin_site_register(HoudiniUsageCount)
 class HoudiniUsageCountAdmin(SelectRelatedModelAdmin):
     """
@@ -0,0 +1,134 @@
+"""
+Timing of the get_data() methods of every Houdini report, to compare the
+performance of the reports across commits (see the benchmark_reports
+management command, which runs them on synthetic data of several sizes).
+"""
+import datetime
+import inspect
+import os
+import subprocess
+import time
+
+import django.db
+
+from houdini_stats.models import *
+from houdini_stats.reports import houdini as houdini_reports
+
+# Tables whose size drives the time of the reports.
+FACT_MODELS = (Uptime, HoudiniCrash, HoudiniToolUsage, HoudiniUsageCount,
+               HoudiniSumAndCount, HoudiniFlag, HoudiniLog, HoudiniString)
+
+#-------------------------------------------------------------------------------
+
+def iter_report_classes():
+    """
+    Yield the name and class of every report defined in reports/houdini.py
+    that can be created without arguments, leaving out the base classes.
+    """
+    base_classes = (houdini_reports.HoudiniStatsReport,
+                    houdini_reports.HistogramReport)
+    for name, cls in inspect.getmembers(houdini_reports, inspect.isclass):
+        if (not issubclass(cls, houdini_reports.HoudiniStatsReport) or
+                cls in base_classes or
+                cls.__module__ != houdini_reports.__name__):
+            continue
+        try:
+            cls()
+        except TypeError:
+            continue
+        yield name, cls
+
+def get_default_filter_values(report):
+    """
+    The views show the first option of each filter until another one is
+    picked.
+    """
+    return dict((report_filter.name, report_filter.options[0])
+                for report_filter in report.get_filters())
+
+def get_table_rows(using="stats"):
+    """
+    Return the number of rows of each fact table.
+    """
+    cursor = django.db.connections[using].cursor()
+    table_rows = {}
+    for model in FACT_MODELS:
+        cursor.execute("select count(*) from " + model._meta.db_table)
+        table_rows[model._meta.db_table] = cursor.fetchone()[0]
+    return table_rows
+
+def get_commit():
+    """
+    Return the git commit of the checkout being measured, or None.
+    """
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+#-------------------------------------------------------------------------------
+
+def time_report(report, series_range, aggregation, filter_values, repeats):
+    """
+    Run get_data() repeats times and return the wall time of each run, in
+    seconds. The report caches should be disabled, or only the first run
+    queries the database.
+    """
+    times = []
+    for index in range(repeats):
+        started = time.time()
+        report.get_data(series_range, aggregation, filter_values)
+        times.append(time.time() - started)
+    return times
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2 == 1:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+def run_benchmark(report_names, ranges_days, aggregations, repeats,
+                  end_date=None, progress=None):
+    """
+    Time every report for each range length, ending at end_date (today by
+    default), and each aggregation it supports. Return a list with a dict of
+    the times of each run. progress(result) is called after every one.
+    """
+    end_date = end_date or datetime.date.today()
+    results = []
+    for report_name in report_names:
+        report = getattr(houdini_reports, report_name)()
+        filter_values = get_default_filter_values(report)
+        report_aggregations = aggregations
+        if not report.supports_aggregation():
+            report_aggregations = aggregations[:1]
+
+        for num_days in ranges_days:
+            series_range = (
+                datetime.datetime.combine(end_date, datetime.time()) -
+                    datetime.timedelta(days=num_days - 1),
+                datetime.datetime.combine(end_date, datetime.time(23, 59, 59)))
+            for aggregation in report_aggregations:
+                result = {
+                    "report": report_name,
+                    "range_days": num_days,
+                    "aggregation": aggregation,
+                    "seconds": None,
+                    "median_seconds": None,
+                    "error": None,
+                }
+                try:
+                    result["seconds"] = time_report(
+                        report, series_range, aggregation, filter_values,
+                        repeats)
+                    result["median_seconds"] = _median(result["seconds"])
+                except Exception as e:
+                    result["error"] = "%s: %s" % (e.__class__.__name__, e)
+                results.append(result)
+                if progress is not None:
+                    progress(result)
+    return results
@@ -0,0 +1,447 @@
+"""
+Caching of the data computed by the Houdini reports.
+
+Report data is kept in an in-process LRU cache with a TTL, keyed by the
+report name, series range, aggregation and filter values. The ingestion code
+records a watermark every time it saves an upload; cached data for ranges
+that reach into the period still affected by new uploads is recomputed once
+the watermark moves. The watermark is kept in the django cache when its
+backend is shared by the processes, and in the database otherwise.
+
+Report data and finished time series buckets are also stored in the django
+cache, shared by every process serving reports, so results computed by
+another process (ex. the prewarm_reports management command) are found too.
+Data computed by the prewarm_reports management command is served for a
+while even once new uploads invalidate it. Every key includes the cache
+generation, which the management commands that
+rewrite ingested data move to invalidate everything cached before them.
+"""
+import copy
+import datetime
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import django.db
+from django.core.cache import cache
+
+import settings
+from houdini_stats.instrumentation import labelled
+
+WATERMARK_CACHE_KEY = "houdini_stats:ingest_watermark"
+GENERATION_CACHE_KEY = "houdini_stats:cache_generation"
+
+# Cache backends that aren't shared by the processes serving reports.
+PER_PROCESS_CACHE_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+#-------------------------------------------------------------------------------
+
+def _get_setting(name, default):
+    return getattr(settings, name, default)
+
+def _to_datetime(date):
+    if isinstance(date, datetime.datetime):
+        return date
+    return datetime.datetime(date.year, date.month, date.day)
+
+def get_settle_period():
+    """
+    How far back uploads can still add data. Uploads are sent some time after
+    the data was recorded, so data older than this is considered final.
+    """
+    return datetime.timedelta(
+        days=_get_setting("HOUDINI_STATS_SETTLE_DAYS", 3))
+
+#-------------------------------------------------------------------------------
+# Shared cache
+
+def _get_shared_cache_key(prefix, key):
+    # Hash the key, which may be longer or contain characters the cache
+    # backends don't accept.
+    return "houdini_stats:%s:%s" % (
+        prefix, hashlib.md5(repr(key).encode("utf-8")).hexdigest())
+
+def get_shared(prefix, key):
+    """
+    Return the value shared by all the processes for the key, or None.
+    """
+    if _get_setting("HOUDINI_STATS_SHARED_CACHE_TTL", 60 * 60 * 24) <= 0:
+        return None
+    return cache.get(_get_shared_cache_key(prefix, key))
+
+def set_shared(prefix, key, value):
+    """
+    Share a value with all the processes for
+    settings.HOUDINI_STATS_SHARED_CACHE_TTL seconds (0 disables sharing).
+    """
+    ttl = _get_setting("HOUDINI_STATS_SHARED_CACHE_TTL", 60 * 60 * 24)
+    if ttl > 0:
+        cache.set(_get_shared_cache_key(prefix, key), value, ttl)
+
+#-------------------------------------------------------------------------------
+
+def is_cache_shared():
+    """
+    Return whether the default django cache is shared by all the processes.
+    Without settings.CACHES, django uses a LocMemCache, private to each
+    process.
+    """
+    backend = getattr(settings, "CACHES", {}).get("default", {}).get(
+        "BACKEND", PER_PROCESS_CACHE_BACKENDS[0])
+    return backend not in PER_PROCESS_CACHE_BACKENDS
+
+def _set_marker(name, date, using="stats"):
+    # Markers are shared by all the processes serving reports, so they live
+    # in the django cache when every process sees the same one, and in the
+    # database otherwise.
+    if is_cache_shared():
+        cache.set(name, date, 60 * 60 * 24 * 30)
+        return
+
+    cursor = django.db.connections[using].cursor()
+    cursor.execute("""
+        insert into houdini_stats_houdiniwarehousewatermark
+            (table_name, last_id, last_date)
+        values (%s, 0, %s)
+        on duplicate key update last_date = values(last_date)
+        """, [name, date])
+
+def _get_marker(name, using="stats"):
+    if is_cache_shared():
+        return cache.get(name)
+
+    cursor = django.db.connections[using].cursor()
+    cursor.execute("""
+        select last_date from houdini_stats_houdiniwarehousewatermark
+        where table_name = %s""", [name])
+    row = cursor.fetchone()
+    return row[0] if row is not None else None
+
+def record_ingest(date=None, using="stats"):
+    """
+    Move the ingest watermark. Called every time new data is saved.
+    """
+    _set_marker(WATERMARK_CACHE_KEY, date or datetime.datetime.now(), using)
+
+def get_ingest_watermark(using="stats"):
+    """
+    Return when data was last ingested, or None if it is not known.
+    """
+    return _get_marker(WATERMARK_CACHE_KEY, using)
+
+def invalidate_caches(using="stats"):
+    """
+    Move the cache generation, so that every process recomputes the report
+    data and the finished buckets cached before. Called by the management
+    commands that rewrite data that was already ingested, including data
+    older than the settle period.
+    """
+    _set_marker(GENERATION_CACHE_KEY, datetime.datetime.now(), using)
+    _report_data_cache.clear()
+    _closed_bucket_cache.clear()
+
+def get_cache_generation(using="stats"):
+    """
+    Return when the caches were last invalidated, or None.
+    """
+    return _get_marker(GENERATION_CACHE_KEY, using)
+
+def is_affected_by_ingest(series_range, since_watermark):
+    """
+    Return whether data ingested after since_watermark can change the results
+    for the given series range.
+    """
+    watermark = get_ingest_watermark()
+    if watermark is None or watermark == since_watermark:
+        return False
+
+    return _to_datetime(series_range[1]) >= watermark - get_settle_period()
+
+#-------------------------------------------------------------------------------
+
+class ReportDataCache(object):
+    """
+    Thread-safe LRU cache whose entries expire after ttl seconds.
+    """
+
+    def __init__(self, max_entries, ttl, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the (value, watermark) stored for the key, or None if it is
+        missing or expired.
+        """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+
+            value, watermark, expiry_time = entry
+            if self.clock() >= expiry_time:
+                return None
+
+            # Re-insert the entry to mark it as the most recently used.
+            self.entries[key] = entry
+            return value, watermark
+
+    def set(self, key, value, watermark):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, watermark, self.clock() + self.ttl)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+_report_data_cache = ReportDataCache(
+    max_entries=_get_setting("HOUDINI_STATS_REPORT_CACHE_SIZE", 200),
+    ttl=_get_setting("HOUDINI_STATS_REPORT_CACHE_TTL", 60 * 60))
+
+#-------------------------------------------------------------------------------
+
+# Whether this process computes reports for the prewarm_reports command.
+_prewarming = False
+
+def start_prewarming():
+    """
+    Mark the report data computed by this process from now on as prewarmed.
+    Prewarmed data is served for settings.HOUDINI_STATS_PREWARM_STALE_TTL
+    seconds even once new uploads invalidate it, since the ranges computed
+    at night all reach into the settle period, and the first upload of the
+    morning would invalidate every one of them.
+    """
+    global _prewarming
+    _prewarming = True
+
+def get_prewarm_stale_ttl():
+    return _get_setting("HOUDINI_STATS_PREWARM_STALE_TTL", 60 * 60 * 12)
+
+def report_data_cache_key(report, series_range, aggregation, filter_values):
+    return (report.name(), tuple(series_range), aggregation,
+            tuple(sorted((filter_values or {}).items())))
+
+def cached_report_data(get_data):
+    """
+    Decorator for the get_data() methods of the reports that returns cached
+    data when it is still valid.
+    """
+    def _get_cached_report_data(self, series_range, aggregation,
+                                filter_values):
+        if not _get_setting("HOUDINI_STATS_REPORT_CACHE_ENABLED", True):
+            return get_data(self, series_range, aggregation, filter_values)
+
+        key = (get_cache_generation(),) + report_data_cache_key(
+            self, series_range, aggregation, filter_values)
+        # The prewarm_reports command computes every report again.
+        cached = None
+        if not _prewarming:
+            cached = _report_data_cache.get(key)
+            if cached is None:
+                cached = get_shared("report_data", key)
+                if cached is not None:
+                    _report_data_cache.set(key, *cached)
+        if cached is not None:
+            (data, stale_until), watermark = cached
+            if (not is_affected_by_ingest(series_range, watermark) or
+                    (stale_until is not None and time.time() < stale_until)):
+                return copy.deepcopy(data)
+
+        # Read the watermark before running the queries, so data ingested
+        # while they run invalidates the entry.
+        watermark = get_ingest_watermark()
+        data = get_data(self, series_range, aggregation, filter_values)
+        stale_until = None
+        if _prewarming:
+            stale_until = time.time() + get_prewarm_stale_ttl()
+        _report_data_cache.set(
+            key, (copy.deepcopy(data), stale_until), watermark)
+        set_shared("report_data", key, ((data, stale_until), watermark))
+        return data
+
+    @wraps(get_data)
+    def wrapper(self, series_range, aggregation, filter_values):
+        with labelled(report=self.name()):
+            return _get_cached_report_data(
+                self, series_range, aggregation, filter_values)
+
+    return wrapper
+
+#===============================================================================
+# Closed bucket cache
+
+class ClosedBucketCache(object):
+    """
+    Stores the finished buckets of time series, so that only the buckets that
+    can still change (or were never computed) are queried again.
+
+    A series is a list of rows whose first element is the start of the
+    bucket, as returned by get_sql_data_for_report. A bucket is finished when
+    the bucket after it starts before the settle boundary. The bucket
+    boundaries are taken from the rows returned by the database, so they
+    always match how the query aggregates dates.
+
+    At most max_series series are kept, the least recently used being
+    evicted first, and each one expires ttl seconds after it was stored.
+    """
+
+    def __init__(self, now=datetime.datetime.now, shared=False,
+                 max_series=1000, ttl=60 * 60 * 24, clock=time.time):
+        self.now = now
+        # Whether the runs are also stored in the shared cache.
+        self.shared = shared
+        self.max_series = max_series
+        self.ttl = ttl
+        self.clock = clock
+        # Maps a series key to a contiguous run of finished buckets (the list
+        # of bucket starts, the rows, and the start of the bucket that
+        # follows the last one) and the time at which it expires, least
+        # recently used first.
+        self.runs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _get_run(self, key):
+        with self.lock:
+            entry = self.runs.pop(key, None)
+            if entry is None:
+                return None
+
+            run, expiry_time = entry
+            if self.clock() >= expiry_time:
+                return None
+
+            # Re-insert the entry to mark it as the most recently used.
+            self.runs[key] = entry
+            return run
+
+    def _set_run(self, key, run):
+        # Must be called with the lock held.
+        self.runs.pop(key, None)
+        self.runs[key] = (run, self.clock() + self.ttl)
+        while len(self.runs) > self.max_series:
+            self.runs.popitem(last=False)
+
+    def get_series(self, key, series_range, query):
+        """
+        Return the rows of the series for the range, calling query(sub_range)
+        only for the parts of the range that aren't cached.
+        """
+        start = _to_datetime(series_range[0])
+        end = _to_datetime(series_range[1])
+
+        run = self._get_run(key)
+        if run is None and self.shared:
+            run = get_shared("closed_buckets", key)
+            if run is not None:
+                with self.lock:
+                    if key not in self.runs:
+                        self._set_run(key, run)
+
+        # Find the cached buckets that lie entirely inside the range.
+        usable = []
+        if run is not None:
+            bucket_starts, rows, resume_start = run
+            next_starts = bucket_starts[1:] + [resume_start]
+            usable = [i for i, bucket_start in enumerate(bucket_starts)
+                if bucket_start >= start and
+                   next_starts[i] <= end + datetime.timedelta(seconds=1)]
+
+        if len(usable) == 0:
+            result = query(series_range)
+            self._store(key, start, result)
+            return result
+
+        first_start = bucket_starts[usable[0]]
+        after_last_start = next_starts[usable[-1]]
+
+        result = []
+        if start < first_start:
+            result.extend(query(
+                (start, first_start - datetime.timedelta(seconds=1))))
+        result.extend(rows[usable[0]:usable[-1] + 1])
+        if after_last_start <= end:
+            tail = query((after_last_start, end))
+            self._store(key, after_last_start, tail)
+            result.extend(tail)
+        return result
+
+    def _store(self, key, query_start, rows):
+        """
+        Cache the finished buckets of rows returned by a query that started
+        at query_start.
+        """
+        settle_boundary = self.now() - get_settle_period()
+        bucket_starts = [_to_datetime(row[0]) for row in rows]
+
+        # The first bucket may have been cut by the query start, and the last
+        # one may not be finished (or may be cut by the query end).
+        finished = [i for i in range(len(rows) - 1)
+            if bucket_starts[i] >= query_start and
+               bucket_starts[i + 1] <= settle_boundary]
+        if len(finished) == 0:
+            return
+
+        new_run = (bucket_starts[finished[0]:finished[-1] + 1],
+                   list(rows[finished[0]:finished[-1] + 1]),
+                   bucket_starts[finished[-1] + 1])
+
+        with self.lock:
+            old_run, expiry_time = self.runs.get(key, (None, None))
+            if (old_run is not None and self.clock() < expiry_time and
+                    new_run[0][0] <= old_run[2] and
+                    old_run[0][0] <= new_run[2]):
+                # The runs overlap or touch, so their union is contiguous.
+                rows_by_start = dict(zip(old_run[0], old_run[1]))
+                rows_by_start.update(zip(new_run[0], new_run[1]))
+                merged_starts = sorted(rows_by_start)
+                new_run = (merged_starts,
+                           [rows_by_start[bucket_start]
+                               for bucket_start in merged_starts],
+                           max(old_run[2], new_run[2]))
+            self._set_run(key, new_run)
+
+        if self.shared:
+            set_shared("closed_buckets", key, new_run)
+
+    def clear(self):
+        with self.lock:
+            self.runs.clear()
+
+_closed_bucket_cache = ClosedBucketCache(
+    shared=True,
+    max_series=_get_setting("HOUDINI_STATS_CLOSED_BUCKET_CACHE_SIZE", 1000),
+    ttl=_get_setting("HOUDINI_STATS_CLOSED_BUCKET_CACHE_TTL", 60 * 60 * 24))
+
+def cached_closed_buckets(series_name):
+    """
+    Decorator for the functions returning one time series of a report, called
+    as func(series_range, aggregation, **kwargs). The finished buckets of each
+    series (one per aggregation and keyword arguments) are cached, and the
+    database is only queried for the rest of the range.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(series_range, aggregation, **kwargs):
+            with labelled(series=series_name):
+                if not _get_setting("HOUDINI_STATS_REPORT_CACHE_ENABLED",
+                                    True):
+                    return func(series_range, aggregation, **kwargs)
+
+                key = (get_cache_generation(), series_name, aggregation,
+                       tuple(sorted(kwargs.items())))
+                return _closed_bucket_cache.get_series(
+                    key, series_range,
+                    lambda sub_range: func(sub_range, aggregation, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,121 @@
+"""
+Classification of machine configs, done once when the data is ingested so
+that reports can filter and group on the stored result.
+"""
+import re
+import socket
+import struct
+
+import settings
+
+#-------------------------------------------------------------------------------
+
+def _ip_to_int(ip_address):
+    """
+    Convert a dotted IPv4 address to an integer, raising ValueError if it is
+    not a valid address.
+    """
+    try:
+        return struct.unpack("!I", socket.inet_aton(ip_address.strip()))[0]
+    except (socket.error, struct.error, AttributeError):
+        raise ValueError("Invalid ip address: %r" % ip_address)
+
+def parse_network(cidr):
+    """
+    Parse a network in CIDR notation (ex. "192.168.0.0/16") and return its
+    (network address, netmask) as integers.
+    """
+    address, _, prefix_length = cidr.partition("/")
+    prefix_length = int(prefix_length) if prefix_length else 32
+    if not 0 <= prefix_length <= 32:
+        raise ValueError("Invalid network: %r" % cidr)
+
+    netmask = (0xffffffff << (32 - prefix_length)) & 0xffffffff
+    return _ip_to_int(address) & netmask, netmask
+
+def _get_internal_networks():
+    return [parse_network(cidr) for cidr in
+        getattr(settings, "INTERNAL_NETWORKS", [])]
+
+_INTERNAL_NETWORKS = _get_internal_networks()
+
+def is_internal_ip(ip_address, networks=None):
+    """
+    Return whether an ip address belongs to one of the internal networks
+    listed in settings.INTERNAL_NETWORKS. Addresses that can't be parsed are
+    considered external.
+    """
+    if networks is None:
+        networks = _INTERNAL_NETWORKS
+
+    try:
+        ip = _ip_to_int(ip_address)
+    except ValueError:
+        return False
+
+    for network, netmask in networks:
+        if ip & netmask == network:
+            return True
+    return False
+
+#-------------------------------------------------------------------------------
+
+# Substrings of the operating system names sent by each OS family.
+LINUX_NAMES = ['linux', 'mint', 'debian', 'ubuntu', 'fedora', 'centos', 'rhel',
+               'opensuse', 'red hat', '/sid']
+MAC_NAMES = ['mac', 'mavericks', 'mountain lion']
+WINDOWS_NAMES = ['windows']
+
+OS_FAMILIES = ('Linux', 'Mac OS', 'Windows', 'Unknown')
+
+# Family of each operating system name classified so far. There are few
+# distinct names, so they are all kept.
+_os_families = {}
+
+def get_os_family(operating_system):
+    """
+    Return the family of an operating system name sent in the machine
+    configs (ex. "linux-x86_64-gcc4.4" is "Linux"), one of OS_FAMILIES.
+    """
+    try:
+        return _os_families[operating_system]
+    except KeyError:
+        pass
+
+    os_family = "Unknown"
+    lower_operating_system = (operating_system or "").lower()
+    for family, names in (("Linux", LINUX_NAMES),
+                          ("Mac OS", MAC_NAMES),
+                          ("Windows", WINDOWS_NAMES)):
+        if any(name in lower_operating_system for name in names):
+            os_family = family
+            break
+
+    _os_families[operating_system] = os_family
+    return os_family
+
+#-------------------------------------------------------------------------------
+
+_BUILD_NUMBER_RE = re.compile(r"\s*(\d+)")
+
+def parse_build_number(build_number):
+    """
+    Return the Houdini build number sent as a string (ex. "392") as an
+    integer, so builds sort numerically. Build numbers that don't start with
+    digits are 0.
+    """
+    match = _BUILD_NUMBER_RE.match(str(build_number or ""))
+    return int(match.group(1)) if match else 0
+
+_HOUDINI_BUILD_RE = re.compile(r"\s*(\d+)\.(\d+)\.(\d+)")
+
+def parse_houdini_build(houdini_build):
+    """
+    Return the (major version, minor version, build number) of a Houdini
+    build written as major.minor.build (ex. "14.0.201"), or None if it isn't
+    written that way.
+    """
+    match = _HOUDINI_BUILD_RE.match(houdini_build or "")
+    if match is None:
+        return None
+    return tuple(int(number) for number in match.groups())
@@ -0,0 +1,446 @@
+"""
+Grouping of the Houdini crashes by the frames of their stack traces.
+
+The stack trace of a crash is normalized (frame numbers, addresses, offsets,
+line numbers and build specific paths removed, crash handler frames skipped)
+and its top frames are hashed into a fingerprint. Crashes with the same
+fingerprint belong to the same HoudiniCrashGroup, which is found, or
+created, with one lookup on the unique fingerprint index when the crashes
+are ingested.
+
+Inlining, optimization or build changes can alter a few frames of the same
+bug and give it several fingerprints. The groups of those fingerprints are
+merged into one when the MinHash signatures of their frames are similar
+enough, finding the candidates with locality-sensitive hashing instead of
+comparing every pair of groups (see houdini_stats/minhash.py).
+"""
+import hashlib
+import multiprocessing
+import re
+from collections import defaultdict, deque
+
+import django.db
+
+try:
+    from django.db.transaction import atomic
+except ImportError:
+    from django.db.transaction import commit_on_success as atomic
+
+import settings
+from houdini_stats import minhash, rollups
+from houdini_stats.models import HoudiniWarehouseWatermark
+
+#-------------------------------------------------------------------------------
+
+# Pieces of a frame that change between builds, runs or platforms for the
+# same code, replaced by the given text.
+_FRAME_NOISE = [(re.compile(pattern, re.IGNORECASE), replacement)
+                for pattern, replacement in (
+    # Frame numbers: "#3 ", "3: ".
+    (r"^\s*#?\d+[:.]?\s+", ""),
+    # Offsets from a symbol: "+ 0x21", "+33".
+    (r"\+\s*(0x)?[0-9a-f]+\b", ""),
+    # Addresses: "0x7f3a2c1b4e2d", "[0x...]".
+    (r"\[?\b0x[0-9a-f]+\b\]?", ""),
+    # Source line numbers: "GU_Detail.C:123".
+    (r"(\.\w+):\d+\b", r"\1"),
+    # Houdini install directories: "/opt/hfs14.0.201/".
+    (r"\bhfs[\d.]+", "hfs"),
+    # Library versions: "libpthread.so.0", "libHoudiniUT.so.14.0".
+    (r"(\.so|\.dylib)(\.\d+)+\b", r"\1"),
+    # Whitespace, once the rest is gone.
+    (r"\s+", " "),
+)]
+
+# Frames of the signal and crash handlers, the same for every crash.
+_IGNORED_FRAME_RE = re.compile(
+    r"caught signal|signal handler|coredumpchaser|crashhandler|"
+    r"signalcallback|ut_signal|utsignalhandler|_sigtramp|__restore_rt|"
+    r"_l_unlock|^\s*<?unknown>?\s*$", re.IGNORECASE)
+
+def _get_num_frames():
+    """
+    Number of top frames hashed into the fingerprint. Frames further down are
+    usually the event loop, the same for unrelated crashes.
+    """
+    return getattr(settings, "HOUDINI_STATS_CRASH_FINGERPRINT_FRAMES", 8)
+
+def normalize_frame(frame):
+    for pattern, replacement in _FRAME_NOISE:
+        frame = pattern.sub(replacement, frame)
+    return frame.strip()
+
+def get_normalized_frames(stack_trace):
+    """
+    Return the normalized frames of a stack trace, top first, leaving out
+    the crash handler frames and the empty lines.
+    """
+    frames = []
+    for line in (stack_trace or "").splitlines():
+        if _IGNORED_FRAME_RE.search(line):
+            continue
+        frame = normalize_frame(line)
+        if frame != "":
+            frames.append(frame)
+    return frames
+
+def get_fingerprint(stack_trace, num_frames=None):
+    """
+    Return the hex SHA-1 of the top normalized frames of a stack trace, or
+    None if it has no frames.
+    """
+    frames = get_normalized_frames(stack_trace)
+    if len(frames) == 0:
+        return None
+    frames = frames[:num_frames or _get_num_frames()]
+    return hashlib.sha1("\n".join(frames).encode("utf-8")).hexdigest()
+
+#-------------------------------------------------------------------------------
+# Near duplicates
+
+# Number of top frames whose shingles make the MinHash signature of a stack
+# trace. More than the fingerprint, so that traces that only differ in a few
+# frames are still similar.
+NUM_SHINGLE_FRAMES = 30
+
+def _get_similarity_threshold():
+    """
+    Minimum estimated similarity of the frames of two stack traces for their
+    groups to be merged. Below 0.5 most near duplicates aren't found (see
+    houdini_stats/minhash.py).
+    """
+    return getattr(settings, "HOUDINI_STATS_CRASH_SIMILARITY_THRESHOLD", 0.7)
+
+def get_shingles(stack_trace):
+    """
+    Return the shingles of the top frames of a stack trace: each frame, and
+    each pair of consecutive frames, so that both the frames and their order
+    count.
+    """
+    frames = get_normalized_frames(stack_trace)[:NUM_SHINGLE_FRAMES]
+    shingles = set(frames)
+    shingles.update("%s\n%s" % pair for pair in zip(frames, frames[1:]))
+    return shingles
+
+def get_signature(stack_trace):
+    return minhash.get_signature(get_shingles(stack_trace))
+
+def find_similar_group(cursor, signature, threshold, group_id=None):
+    """
+    Return the id of the group most similar to a signature, among the groups
+    sharing a band hash with it, or None if none is at least as similar as
+    the threshold. Groups merged into group_id, if given, are left out.
+    Merged groups are answered with the group they were merged into.
+    """
+    band_hashes = minhash.get_band_hashes(signature)
+    cursor.execute("""
+        select g.id, coalesce(g.merged_into_id, g.id), g.minhash_signature
+        from houdini_stats_houdinicrashgroupband b,
+             houdini_stats_houdinicrashgroup g
+        where g.id = b.group_id
+        and (%s)""" % " or ".join(
+            ["(b.band = %s and b.band_hash = %s)"] * len(band_hashes)),
+        [value for band_hash in band_hashes for value in band_hash])
+
+    similar_group_id = None
+    best_similarity = threshold
+    for candidate_id, root_id, candidate_signature in cursor.fetchall():
+        if root_id == group_id:
+            continue
+        similarity = minhash.get_similarity(
+            signature, minhash.from_string(candidate_signature))
+        if similarity >= best_similarity:
+            similar_group_id = root_id
+            best_similarity = similarity
+    return similar_group_id
+
+def _add_bands(cursor, group_signatures):
+    """
+    Index the band hashes of (group id, signature) pairs.
+    """
+    cursor.executemany("""
+        insert ignore into houdini_stats_houdinicrashgroupband
+            (group_id, band, band_hash)
+        values (%s, %s, %s)
+        """,
+        [(group_id, band, band_hash)
+         for group_id, signature in group_signatures
+         for band, band_hash in minhash.get_band_hashes(signature)])
+
+def merge_group(cursor, group_id, into_group_id):
+    """
+    Merge a group, and the groups merged into it, into another group, moving
+    their crashes and statistics.
+    """
+    rollups.merge_crash_group_stats(cursor, group_id, into_group_id)
+    rollups.merge_crash_group_daily(cursor, group_id, into_group_id)
+    cursor.execute("""
+        update houdini_stats_houdinicrashgroup
+        set merged_into_id = %s
+        where id = %s or merged_into_id = %s""",
+        [into_group_id, group_id, group_id])
+    cursor.execute("""
+        update houdini_stats_houdinicrash
+        set group_id = %s
+        where group_id = %s""", [into_group_id, group_id])
+
+def cluster_crash_groups(threshold=None, chunk_size=1000, from_id=0,
+                         using="stats", progress=None):
+    """
+    Merge the existing groups into the groups they are near duplicates of,
+    chunk_size groups per transaction, in id order from from_id on. Each
+    group is only compared with the groups sharing a band hash, and the
+    signatures and bands missing are computed on the way.
+    progress(last group id, number of groups merged) is called after every
+    chunk. Merges aren't undone when run again with a higher threshold.
+    """
+    threshold = threshold or _get_similarity_threshold()
+    cursor = django.db.connections[using].cursor()
+    last_id = from_id
+    num_merged = 0
+    while True:
+        cursor.execute("""
+            select id, representative_stack_trace, minhash_signature,
+                   merged_into_id
+            from houdini_stats_houdinicrashgroup
+            where id > %s
+            order by id
+            limit %s""", [last_id, chunk_size])
+        groups = cursor.fetchall()
+        if len(groups) == 0:
+            break
+
+        with atomic(using=using):
+            group_signatures = []
+            for group_id, stack_trace, signature, merged_into_id in groups:
+                signature = minhash.from_string(signature)
+                if signature is None:
+                    signature = get_signature(stack_trace)
+                    if signature is None:
+                        continue
+                    cursor.execute("""
+                        update houdini_stats_houdinicrashgroup
+                        set minhash_signature = %s
+                        where id = %s""",
+                        [minhash.to_string(signature), group_id])
+
+                if merged_into_id is None:
+                    similar_group_id = find_similar_group(
+                        cursor, signature, threshold, group_id)
+                    if similar_group_id is not None:
+                        merge_group(cursor, group_id, similar_group_id)
+                        num_merged += 1
+                group_signatures.append((group_id, signature))
+            if len(group_signatures) != 0:
+                _add_bands(cursor, group_signatures)
+
+        last_id = groups[-1][0]
+        if progress is not None:
+            progress(last_id, num_merged)
+
+#-------------------------------------------------------------------------------
+# Assignment of the crashes
+
+def _get_group_ids(cursor, fingerprints):
+    """
+    Return a dictionary with the id of each fingerprint's group and the id
+    of the group it was merged into, if any.
+    """
+    if len(fingerprints) == 0:
+        return {}
+    cursor.execute("""
+        select fingerprint, id, coalesce(merged_into_id, id)
+        from houdini_stats_houdinicrashgroup
+        where fingerprint in (%s)""" % ", ".join(["%s"] * len(fingerprints)),
+        list(fingerprints))
+    return dict((fingerprint, (group_id, root_id))
+                for fingerprint, group_id, root_id in cursor.fetchall())
+
+def get_or_create_groups(stack_traces, signatures=None, using="stats"):
+    """
+    Return a dictionary with the id of the group of each fingerprint of
+    stack_traces, a dictionary of fingerprints and a stack trace with that
+    fingerprint, following the merges of the groups. The groups seen for the
+    first time are created with the given stack trace as their
+    representative, and merged right away into the existing group they are
+    near duplicates of. signatures optionally has the MinHash signatures of
+    the stack traces, already computed.
+    """
+    cursor = django.db.connections[using].cursor()
+    group_ids = _get_group_ids(cursor, list(stack_traces))
+
+    new_fingerprints = [fingerprint for fingerprint in stack_traces
+                        if fingerprint not in group_ids]
+    if len(new_fingerprints) != 0:
+        threshold = _get_similarity_threshold()
+        signatures = dict(signatures or {})
+        new_groups = []
+        for fingerprint in new_fingerprints:
+            if signatures.get(fingerprint) is None:
+                signatures[fingerprint] = get_signature(
+                    stack_traces[fingerprint])
+            signature = signatures[fingerprint]
+            new_groups.append((fingerprint, stack_traces[fingerprint],
+                               minhash.to_string(signature),
+                               find_similar_group(
+                                   cursor, signature, threshold)))
+
+        # Another process may create the same groups concurrently, the
+        # unique index keeps only one of them.
+        cursor.executemany("""
+            insert ignore into houdini_stats_houdinicrashgroup
+                (fingerprint, representative_stack_trace,
+                 fixed_in_houdini_build, is_fixed, minhash_signature,
+                 merged_into_id)
+            values (%s, %s, '', false, %s, %s)
+            """, new_groups)
+        new_group_ids = _get_group_ids(cursor, new_fingerprints)
+        _add_bands(cursor, [(new_group_ids[fingerprint][0],
+                             signatures[fingerprint])
+                            for fingerprint in new_fingerprints])
+        group_ids.update(new_group_ids)
+
+    return dict((fingerprint, root_id)
+                for fingerprint, (group_id, root_id) in group_ids.items())
+
+def assign_crash_groups(crashes, using="stats"):
+    """
+    Set the group of the given (unsaved) HoudiniCrash rows from the
+    fingerprints of their stack traces (see get_or_create_groups). Crashes
+    without frames are left without a group.
+    """
+    crashes_by_fingerprint = {}
+    for crash in crashes:
+        fingerprint = get_fingerprint(crash.stack_trace)
+        if fingerprint is not None:
+            crashes_by_fingerprint.setdefault(fingerprint, []).append(crash)
+    if len(crashes_by_fingerprint) == 0:
+        return
+
+    group_ids = get_or_create_groups(
+        dict((fingerprint, fingerprint_crashes[0].stack_trace)
+             for fingerprint, fingerprint_crashes in
+             crashes_by_fingerprint.items()),
+        using=using)
+    for fingerprint, fingerprint_crashes in crashes_by_fingerprint.items():
+        for crash in fingerprint_crashes:
+            crash.group_id = group_ids[fingerprint]
+
+#-------------------------------------------------------------------------------
+# Regrouping of the crashes already ingested
+
+# Name of the HoudiniWarehouseWatermark row where regroup_crashes stores the
+# id of the last crash regrouped.
+REGROUP_CHECKPOINT = "houdini_stats_houdinicrash.group"
+
+def _get_group_keys(rows):
+    """
+    Return the fingerprint of each (id, stack trace, group id) crash row,
+    and the stack trace and MinHash signature of each fingerprint, in case
+    its group has to be created. Runs in a pool process.
+    """
+    fingerprints = []
+    stack_traces = {}
+    signatures = {}
+    for crash_id, stack_trace, group_id in rows:
+        fingerprint = get_fingerprint(stack_trace)
+        fingerprints.append(fingerprint)
+        if fingerprint is not None and fingerprint not in stack_traces:
+            stack_traces[fingerprint] = stack_trace
+            signatures[fingerprint] = get_signature(stack_trace)
+    return fingerprints, stack_traces, signatures
+
+def _update_crash_groups(cursor, crash_ids_by_group, batch_size=1000):
+    for group_id, crash_ids in crash_ids_by_group.items():
+        for start in range(0, len(crash_ids), batch_size):
+            batch_ids = crash_ids[start:start + batch_size]
+            cursor.execute("""
+                update houdini_stats_houdinicrash
+                set group_id = %s
+                where id in (""" + ", ".join(["%s"] * len(batch_ids)) + ")",
+                [group_id] + batch_ids)
+
+def regroup_crashes(processes=None, chunk_size=10000, restart=False,
+                    using="stats", progress=None):
+    """
+    Assign every crash already ingested to the group of its fingerprint,
+    after the grouping changed. Crashes are read in id order, chunk_size at a
+    time, their fingerprints and signatures are computed by a pool of
+    processes, and the crashes whose group changed are updated with one
+    statement per group and chunk. Each chunk is committed together with a
+    checkpoint, so an interrupted run resumes after the last chunk written,
+    unless restart is true. The checkpoint is deleted once every crash is
+    regrouped, so the next run starts from the first crash again.
+    progress(last crash id, number of crashes read, number of crashes moved)
+    is called after every chunk. The statistics and daily rollup of the
+    groups are recomputed at the end.
+    """
+    checkpoint, created = HoudiniWarehouseWatermark.objects.using(using) \
+        .get_or_create(table_name=REGROUP_CHECKPOINT)
+    if restart:
+        checkpoint.last_id = 0
+        checkpoint.save(using=using)
+
+    # The pool processes don't use the database, and must not share the
+    # connections of this one.
+    for connection in django.db.connections.all():
+        connection.close()
+    processes = processes or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes)
+
+    cursor = django.db.connections[using].cursor()
+    last_read_id = checkpoint.last_id
+    num_read = num_moved = 0
+    # Chunks sent to the pool and not written yet, oldest first, so the
+    # database is read and written while the pool computes the keys.
+    pending = deque()
+    try:
+        while True:
+            while last_read_id is not None and len(pending) < 2 * processes:
+                cursor.execute("""
+                    select id, stack_trace, group_id
+                    from houdini_stats_houdinicrash
+                    where id > %s
+                    order by id
+                    limit %s""", [last_read_id, chunk_size])
+                rows = cursor.fetchall()
+                if len(rows) == 0:
+                    last_read_id = None
+                    break
+                last_read_id = rows[-1][0]
+                pending.append(
+                    (rows, pool.apply_async(_get_group_keys, (rows,))))
+            if len(pending) == 0:
+                break
+
+            rows, async_result = pending.popleft()
+            fingerprints, stack_traces, signatures = async_result.get()
+            with atomic(using=using):
+                group_ids = get_or_create_groups(
+                    stack_traces, signatures, using=using)
+                crash_ids_by_group = defaultdict(list)
+                for (crash_id, stack_trace, group_id), fingerprint in zip(
+                        rows, fingerprints):
+                    new_group_id = group_ids.get(fingerprint)
+                    if new_group_id != group_id:
+                        crash_ids_by_group[new_group_id].append(crash_id)
+                _update_crash_groups(cursor, crash_ids_by_group)
+
+                checkpoint.last_id = rows[-1][0]
+                checkpoint.save(using=using)
+
+            num_read += len(rows)
+            num_moved += sum(len(crash_ids)
+                             for crash_ids in crash_ids_by_group.values())
+            if progress is not None:
+                progress(checkpoint.last_id, num_read, num_moved)
+    finally:
+        pool.terminate()
+        pool.join()
+
+    checkpoint.delete(using=using)
+
+    # Moving the crashes left the statistics and daily rollup of their groups
+    # out of date.
+    rollups.rebuild_crash_group_stats(using=using)
+    rollups.rebuild_crash_group_daily(using=using)
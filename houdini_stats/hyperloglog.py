@@ -0,0 +1,176 @@
+"""
+HyperLogLog sketches, used to count distinct machines approximately.
+
+A sketch estimates how many distinct values were added to it using a fixed
+amount of memory, and sketches can be merged to count the values added to
+any of them. Storing one sketch per day makes it possible to count the
+distinct machines of any week, month or year by merging daily sketches,
+instead of running count(distinct) over the raw rows again.
+
+With the default precision of 12 bits (4096 registers) the standard error of
+the estimates is 1.04 / sqrt(4096), about 1.6%.
+"""
+import base64
+import binascii
+import hashlib
+import math
+import struct
+import zlib
+
+DEFAULT_PRECISION = 12
+
+#-------------------------------------------------------------------------------
+
+def _hash(value):
+    """
+    Return a 64 bit hash of the value.
+    """
+    digest = hashlib.sha1(str(value).encode("utf-8")).digest()
+    return struct.unpack("!Q", digest[:8])[0]
+
+def standard_error(precision=DEFAULT_PRECISION):
+    """
+    Relative standard error of the estimates of a sketch with the given
+    precision.
+    """
+    return 1.04 / math.sqrt(1 << precision)
+
+# Merging sketches takes the maximum of each pair of registers. Registers are
+# always below 128, so the registers of a sketch can be read as the bytes of a
+# big integer and all the pairs compared at once with integer operations,
+# which is much faster than comparing them one by one in Python.
+
+def _registers_to_int(registers):
+    return int(binascii.hexlify(bytes(registers)), 16)
+
+def _int_to_registers(value, num_registers):
+    return bytearray(binascii.unhexlify("%0*x" % (2 * num_registers, value)))
+
+def _max_registers(value, other_value, high_bits):
+    """
+    Return the registers with the maximum of each pair of registers of two
+    sketches, all of them read as integers. high_bits has the high bit of
+    every register set.
+    """
+    # The high bit of each register of the difference is set where the
+    # register of value is greater than or equal to the one of other_value.
+    # Setting the high bits before subtracting keeps registers from
+    # borrowing from their neighbours.
+    greater_or_equal = ((value | high_bits) - other_value) & high_bits
+    mask = (greater_or_equal >> 7) * 0xff
+    return (value & mask) | (other_value & ~mask)
+
+#-------------------------------------------------------------------------------
+
+class HyperLogLog(object):
+    """
+    Usage:
+        sketch = HyperLogLog()
+        sketch.add(machine_id)
+        sketch.merge(HyperLogLog.from_string(stored_sketch))
+        sketch.count()
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError("Invalid precision: %r" % precision)
+
+        self.precision = precision
+        self.num_registers = 1 << precision
+        if registers is None:
+            registers = bytearray(self.num_registers)
+        elif len(registers) != self.num_registers:
+            raise ValueError("Expected %d registers, got %d" % (
+                self.num_registers, len(registers)))
+        self.registers = registers
+
+    def add(self, value):
+        """
+        Add a value to the sketch and return whether the sketch changed.
+        """
+        hash_value = _hash(value)
+        index = hash_value >> (64 - self.precision)
+
+        # The rank is the position of the leftmost 1 bit in the rest of the
+        # hash, counting from 1.
+        remaining_bits = 64 - self.precision
+        remaining = hash_value & ((1 << remaining_bits) - 1)
+        rank = remaining_bits - remaining.bit_length() + 1
+
+        if rank <= self.registers[index]:
+            return False
+        self.registers[index] = rank
+        return True
+
+    def merge(self, other):
+        """
+        Add every value counted by another sketch to this one.
+        """
+        if other.precision != self.precision:
+            raise ValueError("Can't merge sketches of different precisions")
+
+        high_bits = int("80" * self.num_registers, 16)
+        self.registers = _int_to_registers(
+            _max_registers(_registers_to_int(self.registers),
+                           _registers_to_int(other.registers), high_bits),
+            self.num_registers)
+
+    def count(self):
+        """
+        Return the estimated number of distinct values added to the sketch.
+        """
+        num_registers = self.num_registers
+        if num_registers == 16:
+            alpha = 0.673
+        elif num_registers == 32:
+            alpha = 0.697
+        elif num_registers == 64:
+            alpha = 0.709
+        else:
+            alpha = 0.7213 / (1 + 1.079 / num_registers)
+
+        estimate = alpha * num_registers ** 2 / sum(
+            2.0 ** -register for register in self.registers)
+
+        # Small cardinalities are estimated more accurately from the number
+        # of registers that are still empty.
+        # bytearray.count() only takes an int from Python 3 on.
+        num_zeros = sum(1 for register in self.registers if register == 0)
+        if estimate <= 2.5 * num_registers and num_zeros != 0:
+            estimate = num_registers * math.log(
+                num_registers / float(num_zeros))
+
+        return int(round(estimate))
+
+    def to_string(self):
+        """
+        Serialize the sketch to a string that can be stored in a text column.
+        Mostly empty sketches compress well.
+        """
+        return base64.b64encode(
+            zlib.compress(bytes(self.registers))).decode("ascii")
+
+    @classmethod
+    def from_string(cls, string, precision=DEFAULT_PRECISION):
+        """
+        Create a sketch from a string returned by to_string(). An empty string
+        returns an empty sketch.
+        """
+        if not string:
+            return cls(precision)
+        return cls(precision,
+                   bytearray(zlib.decompress(base64.b64decode(string))))
+
+def merge_all(sketches, precision=DEFAULT_PRECISION):
+    """
+    Return a new sketch counting the values of all the given sketches.
+    """
+    num_registers = 1 << precision
+    high_bits = int("80" * num_registers, 16)
+    merged = 0
+    for sketch in sketches:
+        if sketch.precision != precision:
+            raise ValueError("Can't merge sketches of different precisions")
+        merged = _max_registers(
+            merged, _registers_to_int(sketch.registers), high_bits)
+    return HyperLogLog(precision, _int_to_registers(merged, num_registers))
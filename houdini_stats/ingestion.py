@@ -0,0 +1,260 @@
+"""
+Bulk ingestion of the Houdini rows sent in a single stats upload.
+
+Every upload fans out into many fact rows that all point to the same
+stats_main.MachineConfig. Instead of saving them one model instance at a
+time, collect them in an UploadBatch and write each model with a single
+batched insert inside one transaction.
+
+stats_main saves the rows of an upload one at a time. Inside
+collect_uploads() (or a request handled by CollectUploadsMiddleware), those
+rows are collected in one UploadBatch per machine config, saved once when the
+block ends.
+"""
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    from django.db.transaction import atomic
+except ImportError:
+    from django.db.transaction import commit_on_success as atomic
+
+import settings
+from houdini_stats.models import *
+from houdini_stats import caching, crash_groups, rollups
+from houdini_stats.classification import is_internal_ip, get_os_family
+
+# Models whose rows hang off the machine config of an upload, in the order in
+# which they are written.
+UPLOAD_MODELS = (
+    Uptime,
+    HoudiniCrash,
+    HoudiniToolUsage,
+    HoudiniUsageCount,
+    HoudiniSumAndCount,
+    HoudiniFlag,
+    HoudiniLog,
+    HoudiniString,
+)
+
+# Upload models that store the calendar day of their date in a day column.
+# bulk_create doesn't call save(), so the day is filled in when the rows are
+# queued.
+DAY_MODELS = (Uptime, HoudiniCrash, HoudiniToolUsage)
+
+#-------------------------------------------------------------------------------
+
+def _get_batch_size():
+    """
+    Maximum number of rows sent to the database in one INSERT statement.
+    """
+    return getattr(settings, "HOUDINI_STATS_INGEST_BATCH_SIZE", 500)
+
+#-------------------------------------------------------------------------------
+
+class UploadBatch(object):
+    """
+    Collects all the child rows of one upload and writes them in bulk.
+
+    Usage:
+        batch = UploadBatch(machine_config)
+        batch.add(Uptime, date=date, number_of_seconds=120, idle_time=10)
+        batch.add(HoudiniToolUsage, date=date, tool_name="box", ...)
+        batch.save()
+    """
+
+    def __init__(self, machine_config, batch_size=None, using="stats"):
+        self.machine_config = machine_config
+        self.batch_size = batch_size or _get_batch_size()
+        self.using = using
+        self.rows = OrderedDict((model, []) for model in UPLOAD_MODELS)
+
+    def add(self, model, **fields):
+        """
+        Queue a new (unsaved) row of the given model for this upload's machine
+        config and return it.
+        """
+        if model not in self.rows:
+            raise ValueError("%s is not an upload model" % model.__name__)
+        return self.add_row(
+            model(stats_machine_config=self.machine_config, **fields))
+
+    def add_row(self, row):
+        """
+        Queue a new (unsaved) row of an upload model, which must belong to
+        this upload's machine config, and return it.
+        """
+        model = row.__class__
+        if model not in self.rows:
+            raise ValueError("%s is not an upload model" % model.__name__)
+
+        if model in DAY_MODELS:
+            row.day = row.date.date()
+        self.rows[model].append(row)
+        return row
+
+    def __len__(self):
+        return sum(len(rows) for rows in self.rows.values())
+
+    def _get_houdini_machine_config(self):
+        """
+        Return the Houdini extension of the upload's machine config, or an
+        unsaved one, classified like create_machine_config_extension does, if
+        the config has none.
+        """
+        try:
+            return HoudiniMachineConfig.objects.using(self.using).get(
+                machine_config=self.machine_config)
+        except HoudiniMachineConfig.DoesNotExist:
+            return HoudiniMachineConfig(
+                machine_config=self.machine_config,
+                is_internal=is_internal_ip(self.machine_config.ip_address),
+                os_family=get_os_family(self.machine_config.operating_system))
+
+    def save(self):
+        """
+        Write every queued row, one batched insert per model, inside a single
+        transaction, with the crashes assigned to their crash groups, and
+        update the rollup tables and the crash group statistics with them.
+        Then add the machine to the daily sketches and move the ingest
+        watermark used to invalidate cached reports. The batch is emptied
+        once the rows are written.
+        """
+        # Use the stored classification, which classify_machine_configs
+        # keeps up to date when the internal networks change, so the new
+        # rollup rows match the rebuilt ones.
+        houdini_machine_config = self._get_houdini_machine_config()
+        is_internal = houdini_machine_config.is_internal
+        houdini_version_id = houdini_machine_config.houdini_version_id
+        if houdini_version_id is None:
+            houdini_version_id = get_houdini_version(
+                houdini_machine_config, using=self.using).id
+
+        with atomic(using=self.using):
+            crash_groups.assign_crash_groups(
+                self.rows[HoudiniCrash], using=self.using)
+            for model, rows in self.rows.items():
+                if len(rows) == 1:
+                    # Inserted on its own so that the row gets its id, like
+                    # the rows stats_main saves one at a time.
+                    rows[0].insert(using=self.using)
+                elif len(rows) != 0:
+                    model.objects.using(self.using).bulk_create(
+                        rows, batch_size=self.batch_size)
+
+            rollups.update_tool_usage_daily(
+                self.rows[HoudiniToolUsage], is_internal, using=self.using)
+            rollups.update_machine_activity_daily(
+                self.rows[Uptime], self.rows[HoudiniCrash],
+                self.machine_config.machine_id, is_internal,
+                houdini_version_id, using=self.using)
+            rollups.update_crash_group_stats(
+                self.rows[HoudiniCrash], self.machine_config.machine_id,
+                houdini_version_id, using=self.using)
+            rollups.update_crash_group_daily(
+                self.rows[HoudiniCrash], is_internal, houdini_version_id,
+                using=self.using)
+
+        # The sketches are locked in their own transactions, so that
+        # concurrent uploads don't wait for the whole of this one.
+        rollups.update_machine_sketches(
+            self.rows[Uptime], self.rows[HoudiniCrash],
+            self.machine_config.machine_id, is_internal,
+            houdini_machine_config.os_family,
+            houdini_machine_config.houdini_major_version, using=self.using)
+
+        caching.record_ingest()
+
+        for rows in self.rows.values():
+            del rows[:]
+
+#-------------------------------------------------------------------------------
+# Collection of the rows saved one at a time
+
+_collected = threading.local()
+
+def start_collecting():
+    """
+    Collect the upload rows saved with save() by this thread, until
+    save_collected() or discard_collected() is called.
+    """
+    _collected.batches = OrderedDict()
+
+def get_collecting_batch(machine_config, using="stats"):
+    """
+    Return the batch collecting the rows of the machine config in this
+    thread, or None if the thread isn't collecting rows.
+    """
+    batches = getattr(_collected, "batches", None)
+    if batches is None:
+        return None
+
+    key = (machine_config.pk, using)
+    batch = batches.get(key)
+    if batch is None:
+        batch = batches[key] = UploadBatch(machine_config, using=using)
+    return batch
+
+def discard_collected():
+    """
+    Stop collecting rows, dropping the ones collected.
+    """
+    _collected.batches = None
+
+def save_collected():
+    """
+    Stop collecting rows and save the ones collected, one batch per machine
+    config.
+    """
+    batches = getattr(_collected, "batches", None) or {}
+    discard_collected()
+    for batch in batches.values():
+        batch.save()
+
+@contextmanager
+def collect_uploads():
+    """
+    Save the upload rows saved with save() inside the block once it ends,
+    with one UploadBatch per machine config, instead of one per row. The
+    rows are dropped if the block raises. The collected rows don't get an
+    id.
+
+    Usage:
+        with collect_uploads():
+            Uptime(stats_machine_config=machine_config, ...).save()
+            HoudiniCrash(stats_machine_config=machine_config, ...).save()
+    """
+    if getattr(_collected, "batches", None) is not None:
+        # Already collected by an enclosing block.
+        yield
+        return
+
+    start_collecting()
+    try:
+        yield
+    except:
+        discard_collected()
+        raise
+    save_collected()
+
+class CollectUploadsMiddleware(object):
+    """
+    Collects the upload rows saved while handling each POST request, like
+    collect_uploads(), so that every upload is saved with one UploadBatch
+    per machine config. Add it to settings.MIDDLEWARE_CLASSES.
+    """
+
+    def process_request(self, request):
+        if request.method == "POST":
+            start_collecting()
+
+    def process_exception(self, request, exception):
+        discard_collected()
+
+    def process_response(self, request, response):
+        if response.status_code < 400:
+            save_collected()
+        else:
+            discard_collected()
+        return response
@@ -0,0 +1,211 @@
+"""
+Timing of the queries run by the Houdini reports.
+
+Every report query is logged with the report and series it was run for, its
+wall time, the number of rows it returned and, optionally, its EXPLAIN
+output. The log is a rotating file of JSON lines, set with
+settings.HOUDINI_STATS_QUERY_LOG, and the query_timings view summarizes its
+latest records, reading the files backwards from their end.
+
+The report and series are labels of the thread running the report, set by
+the caching decorators and carried to the threads of run_in_parallel.
+"""
+import datetime
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import settings
+
+_logger = logging.getLogger("houdini_stats.queries")
+_logger.propagate = False
+_logger_lock = threading.Lock()
+_configured_log = []
+
+#-------------------------------------------------------------------------------
+
+def _get_log_path():
+    return getattr(settings, "HOUDINI_STATS_QUERY_LOG", None)
+
+def _get_logger():
+    """
+    Return the query logger, adding the rotating file handler the first
+    time, or None if logging is disabled.
+    """
+    log_path = _get_log_path()
+    if log_path is None:
+        return None
+
+    with _logger_lock:
+        if log_path not in _configured_log:
+            handler = logging.handlers.RotatingFileHandler(
+                log_path,
+                maxBytes=getattr(settings, "HOUDINI_STATS_QUERY_LOG_MAX_BYTES",
+                                 10 * 1024 * 1024),
+                backupCount=getattr(
+                    settings, "HOUDINI_STATS_QUERY_LOG_BACKUP_COUNT", 5))
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            _logger.addHandler(handler)
+            _logger.setLevel(logging.INFO)
+            _configured_log.append(log_path)
+    return _logger
+
+#-------------------------------------------------------------------------------
+# Labels of the running report
+
+_labels = threading.local()
+
+def get_labels():
+    """
+    Return the (report, series) labels of the current thread.
+    """
+    return (getattr(_labels, "report", None), getattr(_labels, "series", None))
+
+@contextmanager
+def labelled(report=None, series=None):
+    """
+    Label the queries run inside the block with a report and/or series name.
+    The labels not given are kept.
+    """
+    old_labels = get_labels()
+    _labels.report = report or old_labels[0]
+    _labels.series = series or old_labels[1]
+    try:
+        yield
+    finally:
+        _labels.report, _labels.series = old_labels
+
+#-------------------------------------------------------------------------------
+
+def run_query(cursor, statement, params):
+    """
+    Execute a query and return all its rows and the description of its
+    columns, logging how long it took.
+    """
+    started = time.time()
+    cursor.execute(statement, params)
+    rows = cursor.fetchall()
+    seconds = time.time() - started
+    description = cursor.description
+
+    logger = _get_logger()
+    if logger is not None:
+        report, series = get_labels()
+        record = {
+            "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "report": report,
+            "series": series,
+            "seconds": round(seconds, 4),
+            "rows": len(rows),
+        }
+        if getattr(settings, "HOUDINI_STATS_QUERY_LOG_EXPLAIN", False):
+            # Run after fetching the rows, so it isn't counted in the time.
+            cursor.execute("explain " + statement, params)
+            columns = [column[0] for column in cursor.description]
+            record["explain"] = [
+                dict(zip(columns, [str(value) for value in row]))
+                for row in cursor.fetchall()]
+        logger.info(json.dumps(record))
+
+    return rows, description
+
+#-------------------------------------------------------------------------------
+# Summary
+
+def _percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of a sorted, non-empty list.
+    """
+    index = int(round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+def _get_summary_records():
+    return getattr(settings, "HOUDINI_STATS_QUERY_LOG_SUMMARY_RECORDS", 20000)
+
+def _read_lines_backwards(log_file, block_size=64 * 1024):
+    """
+    Yield the lines of a file opened in binary mode, last first, reading it
+    in blocks from its end.
+    """
+    log_file.seek(0, os.SEEK_END)
+    position = log_file.tell()
+    remainder = b""
+    while position > 0:
+        read_size = min(block_size, position)
+        position -= read_size
+        log_file.seek(position)
+        lines = (log_file.read(read_size) + remainder).split(b"\n")
+        # The first line may start in the previous block.
+        remainder = lines.pop(0)
+        for line in reversed(lines):
+            yield line
+    yield remainder
+
+def read_query_log(max_records=None):
+    """
+    Yield the records of the query log, including its rotated files, latest
+    first, stopping after max_records records if it is given.
+    """
+    log_path = _get_log_path()
+    if log_path is None:
+        return
+
+    # The rotated files are log_path.1 (the latest) to log_path.N.
+    rotated_paths = sorted(glob.glob(log_path + ".*"),
+                           key=lambda path: (len(path), path))
+    num_records = 0
+    for path in [log_path] + rotated_paths:
+        try:
+            log_file = open(path, "rb")
+        except IOError:
+            continue
+        with log_file:
+            for line in _read_lines_backwards(log_file):
+                if max_records is not None and num_records >= max_records:
+                    return
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    # Empty lines, and lines cut by a rotation.
+                    continue
+                num_records += 1
+                yield record
+
+def summarize_query_log(records=None):
+    """
+    Return a list of dicts with the number of queries, p50 and p95 wall
+    times, maximum time and average rows of each report and series, slowest
+    p95 first. The records default to the latest
+    settings.HOUDINI_STATS_QUERY_LOG_SUMMARY_RECORDS ones of the query log.
+    """
+    if records is None:
+        records = read_query_log(_get_summary_records())
+
+    seconds_by_series = defaultdict(list)
+    rows_by_series = defaultdict(int)
+    for record in records:
+        key = (record.get("report") or "", record.get("series") or "")
+        seconds_by_series[key].append(record["seconds"])
+        rows_by_series[key] += record["rows"]
+
+    summary = []
+    for (report, series), seconds in seconds_by_series.items():
+        seconds.sort()
+        summary.append({
+            "report": report,
+            "series": series,
+            "count": len(seconds),
+            "p50": _percentile(seconds, 0.5),
+            "p95": _percentile(seconds, 0.95),
+            "max": seconds[-1],
+            "average_rows": float(rows_by_series[(report, series)]) /
+                len(seconds),
+        })
+    summary.sort(key=lambda row: row["p95"], reverse=True)
+    return summary
@@ -0,0 +1,118 @@
+import datetime
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+import settings
+from houdini_stats import benchmark, synthetic
+
+#-------------------------------------------------------------------------------
+
+def _parse_list(value, parse=str):
+    return [parse(item) for item in value.split(",") if item != ""]
+
+class Command(BaseCommand):
+    help = ("Time the get_data() method of every Houdini report and write "
+            "the times to a JSON file, to compare them across commits. With "
+            "--scales, synthetic data is added to the stats database before "
+            "each round, so never run it on the production database.")
+
+    option_list = BaseCommand.option_list + (
+        make_option("--scales", dest="scales", default="",
+            help="Comma separated numbers of fact table rows. Before timing "
+                 "the reports at each scale, synthetic rows are added until "
+                 "the fact tables have that many. Without it, the reports "
+                 "are timed once on the current data."),
+        make_option("--seed", dest="seed", type="int", default=0,
+            help="Seed of the synthetic data."),
+        make_option("--days", dest="days", type="int", default=730,
+            help="Number of days the synthetic uploads are spread over."),
+        make_option("--ranges", dest="ranges", default="30,365",
+            help="Comma separated lengths, in days, of the ranges ending "
+                 "today to time."),
+        make_option("--aggregations", dest="aggregations",
+            default="daily,monthly",
+            help="Comma separated aggregations to time."),
+        make_option("--reports", dest="reports", default="",
+            help="Comma separated names of the reports to time, all of "
+                 "them by default."),
+        make_option("--repeats", dest="repeats", type="int", default=3,
+            help="Number of times each report is run."),
+        make_option("--output", dest="output",
+            default="report_benchmark.json",
+            help="File the results are written to."),
+        make_option("--force", dest="force", action="store_true",
+            default=False,
+            help="Add synthetic rows even if the database has real "
+                 "machines."),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            scales = _parse_list(options["scales"], int)
+            ranges_days = _parse_list(options["ranges"], int)
+        except ValueError:
+            raise CommandError("Invalid number in --scales or --ranges.")
+        aggregations = _parse_list(options["aggregations"])
+
+        report_names = [name for name, cls in
+                        benchmark.iter_report_classes()]
+        if options["reports"]:
+            unknown_names = set(_parse_list(options["reports"])) - \
+                set(report_names)
+            if len(unknown_names) != 0:
+                raise CommandError("Unknown reports: %s" %
+                                   ", ".join(sorted(unknown_names)))
+            report_names = _parse_list(options["reports"])
+
+        if len(scales) != 0 and not options["force"] and \
+                synthetic.has_real_machines():
+            raise CommandError("The stats database has real machines. Use "
+                               "--force to add synthetic data anyway.")
+
+        # Every run must query the database.
+        settings.HOUDINI_STATS_REPORT_CACHE_ENABLED = False
+
+        def progress(result):
+            if result["error"] is not None:
+                self.stderr.write("%s %sd %s failed: %s\n" % (
+                    result["report"], result["range_days"],
+                    result["aggregation"], result["error"]))
+            else:
+                self.stdout.write("%s %sd %s: %.3fs\n" % (
+                    result["report"], result["range_days"],
+                    result["aggregation"], result["median_seconds"]))
+
+        generator = None
+        rounds = []
+        for scale in scales or [None]:
+            if scale is not None:
+                if generator is None:
+                    generator = synthetic.SyntheticDataGenerator(
+                        seed=options["seed"], num_days=options["days"])
+                num_rows = sum(benchmark.get_table_rows().values())
+                if num_rows < scale:
+                    self.stdout.write("Adding %s rows\n" % (scale - num_rows))
+                    generator.generate(scale - num_rows)
+
+            table_rows = benchmark.get_table_rows()
+            self.stdout.write("Timing the reports on %s rows\n" %
+                              sum(table_rows.values()))
+            rounds.append({
+                "scale": scale,
+                "table_rows": table_rows,
+                "results": benchmark.run_benchmark(
+                    report_names, ranges_days, aggregations,
+                    options["repeats"], progress=progress),
+            })
+
+        with open(options["output"], "w") as output:
+            json.dump({
+                "commit": benchmark.get_commit(),
+                "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "repeats": options["repeats"],
+                "seed": options["seed"],
+                "rounds": rounds,
+            }, output, indent=2, sort_keys=True)
+        self.stdout.write("Wrote %s\n" % options["output"])
@@ -0,0 +1,33 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from houdini_stats import caching, warehouse
+
+#-------------------------------------------------------------------------------
+
+class Command(BaseCommand):
+    help = ("Add the uptimes ingested since the last run to the Apprentice "
+            "usage in the first 30 days warehouse table. The first run "
+            "builds it from every uptime.")
+
+    option_list = BaseCommand.option_list + (
+        make_option("--chunk-size", dest="chunk_size", type="int",
+            default=10000,
+            help="Number of uptime ids read per transaction."),
+        make_option("--rebuild", dest="rebuild", action="store_true",
+            default=False,
+            help="Drop the table and build it again from every uptime."),
+    )
+
+    def handle(self, *args, **options):
+        def progress(last_id):
+            self.stdout.write("Added uptimes up to id %s\n" % last_id)
+
+        if options["rebuild"]:
+            warehouse.rebuild_apprentice_usage(
+                options["chunk_size"], progress=progress)
+            caching.invalidate_caches()
+        else:
+            warehouse.update_apprentice_usage(
+                options["chunk_size"], progress=progress)
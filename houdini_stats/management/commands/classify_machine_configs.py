@@ -0,0 +1,102 @@
+from collections import defaultdict
+from optparse import make_option
+
+import django.db
+from django.core.management.base import BaseCommand
+
+try:
+    from django.db.transaction import atomic
+except ImportError:
+    from django.db.transaction import commit_on_success as atomic
+
+from houdini_stats import caching
+from houdini_stats.classification import is_internal_ip, get_os_family
+
+#-------------------------------------------------------------------------------
+
+class Command(BaseCommand):
+    help = ("Classify the existing Houdini machine configs as internal or "
+            "external using settings.INTERNAL_NETWORKS, and by the family of "
+            "their operating system. If the internal classification "
+            "changed, run rebuild_tool_usage_rollup, "
+            "rebuild_machine_activity_rollup, rebuild_machine_sketches and "
+            "rebuild_crash_group_rollup afterwards, since their rows store "
+            "it. If an operating system family changed, run "
+            "rebuild_machine_sketches.")
+
+    option_list = BaseCommand.option_list + (
+        make_option("--chunk-size", dest="chunk_size", type="int",
+            default=10000,
+            help="Number of machine configs classified per transaction."),
+    )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        cursor = django.db.connections["stats"].cursor()
+
+        last_id = 0
+        num_changed = 0
+        num_os_families_changed = 0
+        while True:
+            # Walk the machine configs in primary key order so every chunk is
+            # an index range scan.
+            cursor.execute("""
+                select hmc.id, hmc.is_internal, hmc.os_family,
+                       mc.ip_address, mc.operating_system
+                from houdini_stats_houdinimachineconfig hmc,
+                     stats_main_machineconfig mc
+                where mc.id = hmc.machine_config_id
+                and hmc.id > %s
+                order by hmc.id
+                limit %s""", [last_id, chunk_size])
+            rows = cursor.fetchall()
+            if len(rows) == 0:
+                break
+            last_id = rows[-1][0]
+
+            # Ids to update, by (column, new value).
+            ids_by_classification = defaultdict(list)
+            for id, is_internal, os_family, ip_address, operating_system \
+                    in rows:
+                new_is_internal = is_internal_ip(ip_address)
+                if bool(is_internal) != new_is_internal:
+                    ids_by_classification[
+                        ("is_internal", new_is_internal)].append(id)
+                    num_changed += 1
+
+                new_os_family = get_os_family(operating_system)
+                if os_family != new_os_family:
+                    ids_by_classification[
+                        ("os_family", new_os_family)].append(id)
+                    num_os_families_changed += 1
+
+            with atomic(using="stats"):
+                for (column, value), ids in ids_by_classification.items():
+                    cursor.execute(
+                        "update houdini_stats_houdinimachineconfig "
+                        "set " + column + " = %s where id in (" +
+                        ", ".join(["%s"] * len(ids)) + ")",
+                        [value] + ids)
+
+            self.stdout.write("Classified machine configs up to id %s\n" %
+                last_id)
+
+        if num_changed != 0:
+            # Machines are classified by their first config.
+            with atomic(using="stats"):
+                cursor.execute("""
+                    update houdini_stats_houdinimachinefirstseen f,
+                           stats_main_machineconfig mc,
+                           houdini_stats_houdinimachineconfig hmc
+                    set f.is_internal = hmc.is_internal
+                    where mc.machine_id = f.machine_id
+                    and mc.creation_date = f.first_seen
+                    and hmc.machine_config_id = mc.id""")
+
+        if num_changed != 0 or num_os_families_changed != 0:
+            caching.invalidate_caches()
+
+        self.stdout.write("%s machine configs changed classification\n" %
+            num_changed)
+        self.stdout.write("%s machine configs changed OS family\n" %
+            num_os_families_changed)
@@ -0,0 +1,39 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from houdini_stats import caching, crash_groups
+
+#-------------------------------------------------------------------------------
+
+class Command(BaseCommand):
+    help = ("Merge the crash groups whose stack traces are near duplicates, "
+            "and index the MinHash signatures of the groups that have none.")
+
+    option_list = BaseCommand.option_list + (
+        make_option("--threshold", dest="threshold", type="float",
+            default=None,
+            help="Minimum similarity, between 0 and 1, of the groups merged. "
+                 "settings.HOUDINI_STATS_CRASH_SIMILARITY_THRESHOLD by "
+                 "default."),
+        make_option("--chunk-size", dest="chunk_size", type="int",
+            default=1000,
+            help="Number of groups processed per transaction."),
+        make_option("--from-id", dest="from_id", type="int", default=0,
+            help="Only process the groups with a greater id, to resume an "
+                 "interrupted run."),
+    )
+
+    def handle(self, *args, **options):
+        threshold = options["threshold"]
+        if threshold is not None and not 0 < threshold <= 1:
+            raise CommandError("The threshold must be between 0 and 1.")
+
+        def progress(last_id, num_merged):
+            self.stdout.write("Processed groups up to id %s, %s merged\n" % (
+                last_id, num_merged))
+
+        crash_groups.cluster_crash_groups(
+            threshold, chunk_size=options["chunk_size"],
+            from_id=options["from_id"], progress=progress)
+        caching.invalidate_caches()
@@ -0,0 +1,44 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from houdini_stats import synthetic
+from houdini_stats.management.rebuild import parse_date_option
+
+#-------------------------------------------------------------------------------
+
+class Command(BaseCommand):
+    help = ("Fill the stats database with synthetic machines and uploads, to "
+            "measure the reports. Never run it on the production database.")
+
+    option_list = BaseCommand.option_list + (
+        make_option("--rows", dest="rows", type="int", default=10000,
+            help="Number of rows to add."),
+        make_option("--seed", dest="seed", type="int", default=0,
+            help="Seed of the random generator. The same seed and number of "
+                 "rows add the same data."),
+        make_option("--days", dest="days", type="int", default=365,
+            help="Number of days, ending at --end-date, the uploads are "
+                 "spread over."),
+        make_option("--end-date", dest="end_date", default=None,
+            help="Last day of the uploads (YYYY-MM-DD), today by default."),
+        make_option("--force", dest="force", action="store_true",
+            default=False,
+            help="Add the rows even if the database has real machines."),
+    )
+
+    def handle(self, *args, **options):
+        end_date = parse_date_option(options["end_date"])
+
+        if not options["force"] and synthetic.has_real_machines():
+            raise CommandError("The stats database has real machines. Use "
+                               "--force to add synthetic data anyway.")
+
+        def progress(num_rows):
+            self.stdout.write("Added %s rows\n" % num_rows)
+
+        generator = synthetic.SyntheticDataGenerator(
+            seed=options["seed"], num_days=options["days"], end_date=end_date)
+        generator.generate(options["rows"], progress=progress)
+        self.stdout.write("Added %s rows and rebuilt the rollups\n" %
+                          generator.num_rows)
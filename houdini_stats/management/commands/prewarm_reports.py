@@ -0,0 +1,143 @@
+import datetime
+import multiprocessing
+from optparse import make_option
+
+import django.db
+from django.core.management.base import BaseCommand, CommandError
+
+import settings
+from houdini_stats import caching
+from houdini_stats.reports import houdini as houdini_reports
+
+#-------------------------------------------------------------------------------
+
+def get_menu_report_names():
+    """
+    Return the names of the Houdini reports listed in the menus of
+    settings.TOP_MENU_OPTIONS, without duplicates.
+    """
+    report_names = []
+    for menu in settings.TOP_MENU_OPTIONS.values():
+        for option_name, option_label, option_reports in \
+                menu["menu_options"]:
+            for report_name in option_reports:
+                if (report_name not in report_names and
+                        hasattr(houdini_reports, report_name)):
+                    report_names.append(report_name)
+    return report_names
+
+def _get_default_filter_values(report):
+    """
+    The views show the first option of each filter until another one is
+    picked.
+    """
+    return dict((report_filter.name, report_filter.options[0])
+                for report_filter in report.get_filters())
+
+def _get_series_range(num_days, today):
+    """
+    The range of the last num_days days, including today.
+    """
+    start_date = datetime.datetime.combine(today, datetime.time()) - \
+        datetime.timedelta(days=num_days - 1)
+    end_date = datetime.datetime.combine(today, datetime.time(23, 59, 59))
+    return start_date, end_date
+
+def _close_connections():
+    # Connections inherited from the parent process can't be shared.
+    for connection in django.db.connections.all():
+        connection.close()
+
+def _prewarm(task):
+    """
+    Compute the data of a report for a range and aggregation, which stores
+    it in the shared cache. Runs in a pool process.
+    """
+    report_name, series_range, aggregation = task
+    report = getattr(houdini_reports, report_name)()
+    started = datetime.datetime.now()
+    try:
+        report.get_data(series_range, aggregation,
+                        _get_default_filter_values(report))
+        error = None
+    except Exception as e:
+        error = "%s: %s" % (e.__class__.__name__, e)
+    finally:
+        _close_connections()
+    return (report_name, series_range, aggregation,
+            datetime.datetime.now() - started, error)
+
+#-------------------------------------------------------------------------------
+
+class Command(BaseCommand):
+    help = ("Compute the reports listed in the menus for the most common "
+            "ranges, so the first visitors of the day find them in the "
+            "shared cache, even after new uploads, for "
+            "settings.HOUDINI_STATS_PREWARM_STALE_TTL seconds. Meant to be "
+            "run nightly.")
+
+    option_list = BaseCommand.option_list + (
+        make_option("--days", dest="days", default="30,90,365",
+            help="Comma separated lengths, in days, of the ranges ending "
+                 "today to compute."),
+        make_option("--aggregations", dest="aggregations",
+            default="daily,weekly,monthly,yearly",
+            help="Comma separated aggregations to compute."),
+        make_option("--processes", dest="processes", type="int",
+            default=multiprocessing.cpu_count(),
+            help="Number of reports computed at the same time."),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            days = [int(num_days) for num_days in options["days"].split(",")]
+        except ValueError:
+            raise CommandError("Invalid number of days: %s" % options["days"])
+        aggregations = options["aggregations"].split(",")
+
+        if getattr(settings, "HOUDINI_STATS_SHARED_CACHE_TTL",
+                   60 * 60 * 24) <= 0:
+            raise CommandError("The shared report cache is disabled "
+                               "(settings.HOUDINI_STATS_SHARED_CACHE_TTL).")
+        if not caching.is_cache_shared():
+            raise CommandError("The django cache isn't shared by the "
+                               "processes (settings.CACHES), so the "
+                               "reports computed would be lost.")
+
+        today = datetime.date.today()
+        tasks = []
+        for report_name in get_menu_report_names():
+            report = getattr(houdini_reports, report_name)()
+            # Reports without aggregation give the same data for all of them.
+            report_aggregations = aggregations
+            if not report.supports_aggregation():
+                report_aggregations = aggregations[:1]
+            for num_days in days:
+                for aggregation in report_aggregations:
+                    tasks.append((report_name,
+                                  _get_series_range(num_days, today),
+                                  aggregation))
+
+        _close_connections()
+        pool = multiprocessing.Pool(options["processes"],
+                                    initializer=caching.start_prewarming)
+        num_errors = 0
+        try:
+            for (report_name, series_range, aggregation, duration, error) in \
+                    pool.imap_unordered(_prewarm, tasks):
+                description = "%s %s to %s %s" % (
+                    report_name, series_range[0].date(),
+                    series_range[1].date(), aggregation)
+                if error is None:
+                    self.stdout.write("Computed %s in %.1fs\n" % (
+                        description, duration.total_seconds()))
+                else:
+                    num_errors += 1
+                    self.stderr.write("Failed %s: %s\n" % (
+                        description, error))
+        finally:
+            pool.close()
+            pool.join()
+
+        self.stdout.write("Computed %s reports, %s failed\n" % (
+            len(tasks) - num_errors, num_errors))
@@ -0,0 +1,9 @@
+from houdini_stats import rollups
+from houdini_stats.management.rebuild import RebuildCommand
+
+#-------------------------------------------------------------------------------
+
+class Command(RebuildCommand):
+    help = "Rebuild the daily crash group rollup from the raw crash rows."
+
+    rebuild = staticmethod(rollups.rebuild_crash_group_daily)
@@ -0,0 +1,26 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from houdini_stats import caching, rollups
+
+#-------------------------------------------------------------------------------
+
+class Command(BaseCommand):
+    help = ("Recompute the crash counts, machine counts, first and last "
+            "crash dates and latest Houdini version of every crash group "
+            "from the raw crash rows.")
+
+    option_list = BaseCommand.option_list + (
+        make_option("--chunk-size", dest="chunk_size", type="int",
+            default=1000,
+            help="Number of groups recomputed per transaction."),
+    )
+
+    def handle(self, *args, **options):
+        def progress(last_id):
+            self.stdout.write("Rebuilt groups up to id %s\n" % last_id)
+
+        rollups.rebuild_crash_group_stats(
+            chunk_size=options["chunk_size"], progress=progress)
+        caching.invalidate_caches()
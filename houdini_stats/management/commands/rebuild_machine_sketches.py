@@ -0,0 +1,10 @@
+from houdini_stats import rollups
+from houdini_stats.management.rebuild import RebuildCommand
+
+#-------------------------------------------------------------------------------
+
+class Command(RebuildCommand):
+    help = ("Rebuild the daily machine sketches from the raw uptime and crash "
+            "rows.")
+
+    rebuild = staticmethod(rollups.rebuild_machine_sketches)
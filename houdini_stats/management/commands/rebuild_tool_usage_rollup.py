@@ -0,0 +1,9 @@
+from houdini_stats import rollups
+from houdini_stats.management.rebuild import RebuildCommand
+
+#-------------------------------------------------------------------------------
+
+class Command(RebuildCommand):
+    help = "Rebuild the daily tool usage rollup from the raw tool usage rows."
+
+    rebuild = staticmethod(rollups.rebuild_tool_usage_daily)
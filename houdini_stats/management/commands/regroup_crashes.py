@@ -0,0 +1,41 @@
+import multiprocessing
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from houdini_stats import caching, crash_groups
+
+#-------------------------------------------------------------------------------
+
+class Command(BaseCommand):
+    help = ("Assign every crash to the group of its stack trace fingerprint, "
+            "after the grouping changed. An interrupted run resumes after "
+            "the last chunk written, and a finished one starts from the "
+            "first crash again.")
+
+    option_list = BaseCommand.option_list + (
+        make_option("--chunk-size", dest="chunk_size", type="int",
+            default=10000,
+            help="Number of crashes read, and written, per transaction."),
+        make_option("--processes", dest="processes", type="int",
+            default=multiprocessing.cpu_count(),
+            help="Number of processes computing the fingerprints."),
+        make_option("--restart", dest="restart", action="store_true",
+            default=False,
+            help="Start again from the first crash instead of resuming."),
+    )
+
+    def handle(self, *args, **options):
+        started = time.time()
+
+        def progress(last_id, num_read, num_moved):
+            self.stdout.write(
+                "Regrouped crashes up to id %s: %s read, %s moved, "
+                "%.0f crashes/s\n" % (last_id, num_read, num_moved,
+                                      num_read / (time.time() - started)))
+
+        crash_groups.regroup_crashes(
+            options["processes"], chunk_size=options["chunk_size"],
+            restart=options["restart"], progress=progress)
+        caching.invalidate_caches()
@@ -0,0 +1,52 @@
+"""
+Base of the management commands that rebuild a rollup table from the raw
+rows, from a given day on, a number of days at a time.
+"""
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from houdini_stats import caching
+
+#-------------------------------------------------------------------------------
+
+def parse_date_option(value):
+    """
+    Return the datetime of a YYYY-MM-DD command line option, or None if the
+    option wasn't given.
+    """
+    if value is None:
+        return None
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise CommandError("Invalid date: %s" % value)
+
+#-------------------------------------------------------------------------------
+
+class RebuildCommand(BaseCommand):
+    """
+    Subclasses set help and rebuild, a rollups function called as
+    rebuild(from_date, chunk_days=chunk_days, progress=progress). The cached
+    reports are invalidated once the rollup is rebuilt.
+    """
+    rebuild = None
+
+    option_list = BaseCommand.option_list + (
+        make_option("--from", dest="from_date", default=None,
+            help="Only rebuild the days from this date on (YYYY-MM-DD)."),
+        make_option("--chunk-days", dest="chunk_days", type="int", default=7,
+            help="Number of days rebuilt at once."),
+    )
+
+    def handle(self, *args, **options):
+        from_date = parse_date_option(options["from_date"])
+
+        def progress(chunk_start, chunk_end):
+            self.stdout.write("Rebuilt %s to %s\n" % (
+                chunk_start.date(), chunk_end.date()))
+
+        self.rebuild(from_date, chunk_days=options["chunk_days"],
+                     progress=progress)
+        caching.invalidate_caches()
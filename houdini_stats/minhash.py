@@ -0,0 +1,97 @@
+"""
+MinHash signatures and locality-sensitive hashing, used to find the crash
+groups whose stack traces are nearly the same.
+
+The MinHash signature of a set keeps, for each of NUM_PERMUTATIONS random
+hash functions, the minimum hash of the set's values. The fraction of
+positions where two signatures agree estimates the Jaccard similarity of the
+two sets (the size of their intersection divided by the size of their
+union).
+
+To find similar sets without comparing every pair, the signature is split
+into NUM_BANDS bands of ROWS_PER_BAND values and each band is hashed. Sets
+sharing the hash of any band are candidates, compared with their full
+signatures. Two sets with a similarity s share a band with a probability of
+1 - (1 - s ** ROWS_PER_BAND) ** NUM_BANDS: about 0.89 for s = 0.6 and 0.99
+for s = 0.7, with the default 16 bands of 4 values. Below a similarity of
+(1 / NUM_BANDS) ** (1 / ROWS_PER_BAND), 0.5, most sets are never candidates.
+"""
+import hashlib
+import struct
+
+NUM_PERMUTATIONS = 64
+NUM_BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // NUM_BANDS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+#-------------------------------------------------------------------------------
+
+def _hash(value):
+    """
+    Return a 32 bit hash of the value.
+    """
+    digest = hashlib.sha1(value.encode("utf-8")).digest()
+    return struct.unpack("!I", digest[:4])[0]
+
+def _make_permutation(index):
+    # Derived from hashes instead of the random module, so that they are the
+    # same in every process and Python version, and the stored signatures
+    # stay comparable.
+    digest = hashlib.sha1(("permutation%d" % index).encode("utf-8")).digest()
+    a, b = struct.unpack("!QQ", digest[:16])
+    return a % (_MERSENNE_PRIME - 1) + 1, b % _MERSENNE_PRIME
+
+# The random hash functions, (a * x + b) % _MERSENNE_PRIME.
+_PERMUTATIONS = [_make_permutation(index)
+                 for index in range(NUM_PERMUTATIONS)]
+
+def get_signature(values):
+    """
+    Return the MinHash signature, a list of NUM_PERMUTATIONS integers, of a
+    set of strings, or None if it is empty.
+    """
+    hashes = set(_hash(value) for value in values)
+    if len(hashes) == 0:
+        return None
+    return [min(((a * value + b) % _MERSENNE_PRIME) & _MAX_HASH
+                for value in hashes)
+            for a, b in _PERMUTATIONS]
+
+def get_similarity(signature, other_signature):
+    """
+    Estimate the Jaccard similarity of the sets of two signatures.
+    """
+    num_equal = sum(1 for value, other_value in
+                    zip(signature, other_signature) if value == other_value)
+    return float(num_equal) / len(signature)
+
+def get_band_hashes(signature):
+    """
+    Return the hash of each band of a signature, as a list of
+    (band index, signed 64 bit integer) pairs, ready to be stored in a
+    BigIntegerField.
+    """
+    band_hashes = []
+    for band in range(NUM_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.sha1(struct.pack(
+            "!%dI" % len(rows), *rows)).digest()
+        band_hashes.append((band, struct.unpack("!q", digest[:8])[0]))
+    return band_hashes
+
+#-------------------------------------------------------------------------------
+
+def to_string(signature):
+    return "".join("%08x" % value for value in signature)
+
+def from_string(string):
+    """
+    Return the signature serialized with to_string, or None if the string
+    is empty.
+    """
+    if not string:
+        return None
+    return [int(string[index:index + 8], 16)
+            for index in range(0, len(string), 8)]
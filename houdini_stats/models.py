@@ -1,6 +1,11 @@
+import datetime
+
 from django.db import models
 import django.db.models.options as options
 
+from houdini_stats.classification import is_internal_ip, get_os_family, \
+    parse_build_number
+
 # Keep django from complaining about the db_name meta attribute.
 if "db_name" not in options.DEFAULT_NAMES:
     options.DEFAULT_NAMES = options.DEFAULT_NAMES + ("db_name",)
@@ -47,6 +52,29 @@ class HoudiniMachineConfig(models.Model):
         default=False
     )
     
+    is_internal = models.BooleanField(
+        help_text='''Does the machine config ip address belong to one of the
+                     internal networks?''',
+        default=False,
+        db_index=True
+    )
+
+    os_family = models.CharField(
+        help_text='''Family of the machine config operating system (Linux,
+                     Mac OS, Windows or Unknown).''',
+        max_length=10,
+        default='Unknown',
+        db_index=True
+    )
+
+    houdini_version = models.ForeignKey(
+        'HoudiniVersion',
+        help_text='''Version, build and product of the machine config, set
+                     when it is created.''',
+        default=None,
+        null=True
+    )
+    
     def major_minor_version(self):
         return "%s.%s" % (
             self.houdini_major_version, self.houdini_minor_version)
@@ -58,23 +86,169 @@ class HoudiniMachineConfig(models.Model):
     class Meta:
         db_name = 'stats'
 
+#-------------------------------------------------------------------------------
+
+class HoudiniMachineFirstSeen(models.Model):
+    """
+    When each machine sent its first machine config, maintained when machine
+    configs are created.
+    """
+
+    machine = models.OneToOneField(
+        'stats_main.Machine',
+        help_text='''The machine.'''
+    )
+
+    first_seen = models.DateTimeField(
+        help_text='''Creation date of the first config of the machine.''',
+        db_index=True
+    )
+
+    is_internal = models.BooleanField(
+        help_text='''Was the first config of the machine in one of the
+                     internal networks?''',
+        default=False
+    )
+
+    def __unicode__(self):
+        return "HoudiniMachineFirstSeen(%s, %s)" % (
+            self.machine_id, self.first_seen)
+
+    class Meta:
+        db_name = 'stats'
+
+#-------------------------------------------------------------------------------
+
+class HoudiniVersion(models.Model):
+    """
+    Each distinct Houdini version, build and product sent in the machine
+    configs. Reports group on the small integer keys of this table instead of
+    the strings of the machine configs.
+    """
+
+    houdini_major_version = models.IntegerField(
+        help_text='''Houdini major version.''',
+        default=0
+    )
+
+    houdini_minor_version = models.IntegerField(
+        help_text='''Houdini minor version.''',
+        default=0
+    )
+
+    houdini_build_number = models.IntegerField(
+        help_text='''Houdini build number, 0 if it isn't a number.''',
+        default=0
+    )
+
+    product = models.CharField(
+        help_text='''Name of the product used.''',
+        max_length=40,
+        blank=True
+    )
+
+    is_apprentice = models.BooleanField(
+        help_text='''Is the product Houdini Apprentice?''',
+        default=False
+    )
+
+    def __unicode__(self):
+        return "HoudiniVersion(%s %s.%s.%s%s)" % (
+            self.product, self.houdini_major_version,
+            self.houdini_minor_version, self.houdini_build_number,
+            " Apprentice" if self.is_apprentice else "")
+
+    class Meta:
+        unique_together = (('houdini_major_version', 'houdini_minor_version',
+                            'houdini_build_number', 'product',
+                            'is_apprentice'),)
+        db_name = 'stats'
+
+def get_houdini_version(houdini_machine_config, using="stats"):
+    """
+    Return the HoudiniVersion with the version, build and product of a
+    Houdini machine config, creating it the first time they are seen.
+    """
+    houdini_version, created = HoudiniVersion.objects.using(using) \
+        .get_or_create(
+            houdini_major_version=int(
+                houdini_machine_config.houdini_major_version or 0),
+            houdini_minor_version=int(
+                houdini_machine_config.houdini_minor_version or 0),
+            houdini_build_number=parse_build_number(
+                houdini_machine_config.houdini_build_number),
+            product=houdini_machine_config.product or "",
+            is_apprentice=bool(houdini_machine_config.is_apprentice))
+    return houdini_version
+
+#-------------------------------------------------------------------------------
+
 def create_machine_config_extension(machine_config, user_info):
     """This is a specially-named function that stats_main will look for
     to extend the information in the machine config.
     """
+    # Imported here because the rollups module uses these models.
+    from houdini_stats import rollups
+
+    is_internal = is_internal_ip(machine_config.ip_address)
+    rollups.update_machine_first_seen(
+        machine_config.machine_id,
+        machine_config.creation_date or datetime.datetime.now(), is_internal)
+
     # Create new houdini machine config with the rest of the data 
-    return HoudiniMachineConfig(
+    houdini_machine_config = HoudiniMachineConfig(
         machine_config = machine_config,
         houdini_major_version = user_info.get('houdini_major_version',0),
         houdini_minor_version = user_info.get('houdini_minor_version',0),
         houdini_build_number = user_info.get('houdini_build_version',0),
         product = user_info.get('application_name',"").title(),
         is_apprentice = user_info.get('license_category',"") == 'Apprentice',
+        is_internal = is_internal,
+        os_family = get_os_family(machine_config.operating_system),
     )
+    houdini_machine_config.houdini_version = get_houdini_version(
+        houdini_machine_config)
+    return houdini_machine_config
 
 #-------------------------------------------------------------------------------
 
-class HoudiniCrash(models.Model):
+class UploadRow(object):
+    """
+    Base of the models of the rows sent in a stats upload. stats_main saves
+    them one at a time, so each new row is added to the UploadBatch of its
+    upload when the rows are collected (see collect_uploads in
+    houdini_stats/ingestion.py), and is otherwise written through an
+    UploadBatch of its own. Either way its crash group is assigned, it is
+    added to the rollup tables and it moves the ingest watermark of the
+    cached reports.
+    """
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None or args or kwargs.get("force_update"):
+            return super(UploadRow, self).save(*args, **kwargs)
+
+        # Imported here because the ingestion module uses these models.
+        from houdini_stats import ingestion
+        using = kwargs.get("using") or "stats"
+        batch = ingestion.get_collecting_batch(
+            self.stats_machine_config, using)
+        if batch is not None:
+            batch.add_row(self)
+            return
+
+        batch = ingestion.UploadBatch(self.stats_machine_config, using=using)
+        batch.add_row(self)
+        batch.save()
+
+    def insert(self, using="stats"):
+        """
+        Insert the row as is, without ingesting it. Used by UploadBatch.
+        """
+        super(UploadRow, self).save(using=using, force_insert=True)
+
+#-------------------------------------------------------------------------------
+
+class HoudiniCrash(UploadRow, models.Model):
     """
     Represents a Houdini Crash and corresponding stack trace.
     """
@@ -85,7 +259,14 @@ class HoudiniCrash(models.Model):
     )
 
     date = models.DateTimeField(
-        help_text='''When this crash occurred .'''
+        help_text='''When this crash occurred .''',
+        db_index=True
+    )
+
+    day = models.DateField(
+        help_text='''Calendar day of the date, filled in when saving.''',
+        null=True,
+        db_index=True
     )
     
     stack_trace = models.TextField(
@@ -106,12 +287,18 @@ class HoudiniCrash(models.Model):
         null=True,
     )
     
+    def save(self, *args, **kwargs):
+        self.day = self.date.date()
+        super(HoudiniCrash, self).save(*args, **kwargs)
+
     def __unicode__(self):
         return "HoudiniCrash(%s)" % self.stack_trace
 
     class Meta:
         # How to order results when doing queries:
         ordering = ('date', )
+        # Reports filter on date ranges and join on the machine config.
+        index_together = (('stats_machine_config', 'date'),)
         db_name = 'stats'
 
 #-------------------------------------------------------------------------------
@@ -120,6 +307,15 @@ class HoudiniCrashGroup(models.Model):
     """
     Represents a group of HoudiniCrashes (i.e. stack traces) that are the same.
     """
+    fingerprint = models.CharField(
+        help_text='''Hash of the top normalized frames of the stack traces
+                     of the group (see houdini_stats/crash_groups.py).''',
+        max_length=40,
+        default=None,
+        null=True,
+        unique=True
+    )
+
     representative_stack_trace = models.TextField(
         help_text='''Stack trace representing this group.''',
         blank=True,
@@ -127,7 +323,8 @@ class HoudiniCrashGroup(models.Model):
     )
 
     fixed_in_houdini_build = models.CharField(
-        help_text='''The Houdini build where this was fixed.''',
+        help_text='''The Houdini build where this was fixed, as
+                     major.minor.build (ex. 14.0.201).''',
         default='',
         max_length=12
     )
@@ -137,6 +334,61 @@ class HoudiniCrashGroup(models.Model):
         default=False
     )
 
+    minhash_signature = models.TextField(
+        help_text='''MinHash signature of the frames of the representative
+                     stack trace (see houdini_stats/minhash.py).''',
+        blank=True,
+        default=''
+    )
+
+    merged_into = models.ForeignKey(
+        'self',
+        help_text='''Group this one was found to be a near duplicate of.
+                     Its crashes, and the new crashes with its fingerprint,
+                     belong to that group.''',
+        related_name='merged_groups',
+        default=None,
+        null=True
+    )
+
+    # Statistics of the crashes of the group, updated when crashes are
+    # ingested (see houdini_stats/rollups.py).
+    num_crashes = models.PositiveIntegerField(
+        help_text='''Number of crashes of the group.''',
+        default=0,
+        db_index=True
+    )
+
+    num_machines = models.PositiveIntegerField(
+        help_text='''Number of distinct machines that sent crashes of the
+                     group.''',
+        default=0,
+        db_index=True
+    )
+
+    first_seen = models.DateTimeField(
+        help_text='''Date of the first crash of the group.''',
+        default=None,
+        null=True,
+        db_index=True
+    )
+
+    last_seen = models.DateTimeField(
+        help_text='''Date of the last crash of the group.''',
+        default=None,
+        null=True,
+        db_index=True
+    )
+
+    latest_houdini_version = models.ForeignKey(
+        'HoudiniVersion',
+        help_text='''Latest Houdini version and build that sent crashes of
+                     the group.''',
+        related_name='+',
+        default=None,
+        null=True
+    )
+
     def __unicode__(self):
         return "HoudiniCrashGroup(%s)" % self.representative_stack_trace
 
@@ -145,7 +397,64 @@ class HoudiniCrashGroup(models.Model):
 
 #-------------------------------------------------------------------------------
 
-class HoudiniToolUsage(models.Model):
+class HoudiniCrashGroupMachine(models.Model):
+    """
+    The machines that sent crashes of each crash group, to count the distinct
+    machines of a group when crashes are ingested.
+    """
+
+    group = models.ForeignKey(
+        'HoudiniCrashGroup',
+        help_text='''The crash group.'''
+    )
+
+    machine = models.ForeignKey(
+        'stats_main.Machine',
+        help_text='''A machine that sent crashes of the group.'''
+    )
+
+    def __unicode__(self):
+        return "HoudiniCrashGroupMachine(%s, %s)" % (
+            self.group_id, self.machine_id)
+
+    class Meta:
+        unique_together = (('group', 'machine'),)
+        db_name = 'stats'
+
+#-------------------------------------------------------------------------------
+
+class HoudiniCrashGroupBand(models.Model):
+    """
+    Hash of one band of the MinHash signature of a crash group. Groups
+    sharing a band hash are candidate near duplicates.
+    """
+
+    group = models.ForeignKey(
+        'HoudiniCrashGroup',
+        help_text='''The crash group.'''
+    )
+
+    band = models.IntegerField(
+        help_text='''Index of the band in the signature.'''
+    )
+
+    band_hash = models.BigIntegerField(
+        help_text='''Hash of the values of the band.'''
+    )
+
+    def __unicode__(self):
+        return "HoudiniCrashGroupBand(%s, %s, %s)" % (
+            self.group_id, self.band, self.band_hash)
+
+    class Meta:
+        unique_together = (('group', 'band'),)
+        # Candidates are looked up by band and hash.
+        index_together = (('band', 'band_hash'),)
+        db_name = 'stats'
+
+#-------------------------------------------------------------------------------
+
+class HoudiniToolUsage(UploadRow, models.Model):
     """
     Represent the usage of Houdini Houdini Tools. Specifically the ones
     on the Shelf and the Tab Menu.
@@ -157,7 +466,14 @@ class HoudiniToolUsage(models.Model):
     )
 
     date = models.DateTimeField(
-        help_text='''When was this tool used.'''
+        help_text='''When was this tool used.''',
+        db_index=True
+    )
+
+    day = models.DateField(
+        help_text='''Calendar day of the date, filled in when saving.''',
+        null=True,
+        db_index=True
     )
     
     tool_name = models.CharField(
@@ -200,19 +516,66 @@ class HoudiniToolUsage(models.Model):
         default=False
     )
         
+    def save(self, *args, **kwargs):
+        self.day = self.date.date()
+        super(HoudiniToolUsage, self).save(*args, **kwargs)
+
     def __unicode__(self):
         return "HoudiniToolUsage(%s , %d)" % \
             (self.tool_name, self.count)
 
     class Meta:
         # How to order results when doing queries:
-        ordering = ('date', 'count')    
+        ordering = ('date', 'count')
+        # Reports filter on date ranges and join on the machine config.
+        index_together = (('stats_machine_config', 'date'),)
         db_name = 'stats'
 
+#-------------------------------------------------------------------------------
+
+class HoudiniToolUsageDaily(models.Model):
+    """
+    Daily rollup of the Houdini tool usage counts, maintained incrementally
+    when uploads are ingested. The tool usage reports read from this table
+    instead of scanning the raw HoudiniToolUsage rows.
+    """
+
+    day = models.DateField(
+        help_text='''Day the tools were used.'''
+    )
+
+    tool_name = models.CharField(
+        help_text='''The name of the tool (Ex. torus, box).''',
+        max_length=60
+    )
+
+    tool_creation_mode = models.IntegerField(
+        choices=HoudiniToolUsage.TOOL_CREATION_MODES)
+
+    is_internal = models.BooleanField(
+        help_text='''Were the tools used from internal machines?''',
+        default=False
+    )
+
+    count = models.PositiveIntegerField(
+        default=0,
+        help_text='''Number of times the tool was used that day.'''
+    )
+
+    def __unicode__(self):
+        return "HoudiniToolUsageDaily(%s, %s, %d)" % \
+            (self.day, self.tool_name, self.count)
+
+    class Meta:
+        # One row per day and tool, also used as the index for day ranges.
+        unique_together = (
+            ('day', 'tool_name', 'tool_creation_mode', 'is_internal'),)
+        ordering = ('day',)
+        db_name = 'stats'
 
 #-------------------------------------------------------------------------------
 
-class HoudiniString(models.Model):
+class HoudiniString(UploadRow, models.Model):
     """
     Model to represent houdini strings.
 
@@ -225,7 +588,8 @@ class HoudiniString(models.Model):
     )
     
     date = models.DateTimeField(
-        help_text='''Date the data was recorded.'''
+        help_text='''Date the data was recorded.''',
+        db_index=True
     )
         
     key = models.CharField(
@@ -244,11 +608,13 @@ class HoudiniString(models.Model):
     class Meta:
         # How to order results when doing queries:
         ordering = ('date',)    
+        # Reports filter on date ranges and join on the machine config.
+        index_together = (('stats_machine_config', 'date'),)
         db_name = 'stats'        
 
 #-------------------------------------------------------------------------------
 
-class HoudiniUsageCount(models.Model):
+class HoudiniUsageCount(UploadRow, models.Model):
     """
     Model to represent houdini usage keys different from the tools.
     """
@@ -259,7 +625,8 @@ class HoudiniUsageCount(models.Model):
     )
     
     date = models.DateTimeField(
-        help_text='''Date to record the key.'''
+        help_text='''Date to record the key.''',
+        db_index=True
     )
         
     key = models.CharField(
@@ -279,11 +646,13 @@ class HoudiniUsageCount(models.Model):
     class Meta:
         # How to order results when doing queries:
         ordering = ('date','count')    
+        # Reports filter on date ranges and join on the machine config.
+        index_together = (('stats_machine_config', 'date'),)
         db_name = 'stats'        
 
 #-------------------------------------------------------------------------------
 
-class HoudiniSumAndCount(models.Model):
+class HoudiniSumAndCount(UploadRow, models.Model):
     """
     Model to represent sums and counts.
     """
@@ -294,7 +663,8 @@ class HoudiniSumAndCount(models.Model):
     )
     
     date = models.DateTimeField(
-        help_text='''Date to record the sum and count.'''
+        help_text='''Date to record the sum and count.''',
+        db_index=True
     )
         
     key = models.CharField(
@@ -318,11 +688,13 @@ class HoudiniSumAndCount(models.Model):
     class Meta:
         # How to order results when doing queries:
         ordering = ('date',)    
+        # Reports filter on date ranges and join on the machine config.
+        index_together = (('stats_machine_config', 'date'),)
         db_name = 'stats'        
         
 #-------------------------------------------------------------------------------
 
-class HoudiniFlag(models.Model):
+class HoudiniFlag(UploadRow, models.Model):
     """
     Model to represent houdini flags.
     """
@@ -333,7 +705,8 @@ class HoudiniFlag(models.Model):
     )
     
     date = models.DateTimeField(
-        help_text='''Date to record the flag.'''
+        help_text='''Date to record the flag.''',
+        db_index=True
     )
         
     key = models.CharField(
@@ -348,11 +721,13 @@ class HoudiniFlag(models.Model):
     class Meta:
         # How to order results when doing queries:
         ordering = ('date',)    
+        # Reports filter on date ranges and join on the machine config.
+        index_together = (('stats_machine_config', 'date'),)
         db_name = 'stats'        
 
 #-------------------------------------------------------------------------------
 
-class HoudiniLog(models.Model):
+class HoudiniLog(UploadRow, models.Model):
     """
     Model to represent houdini logs.
     """
@@ -363,7 +738,8 @@ class HoudiniLog(models.Model):
     )
     
     date = models.DateTimeField(
-        help_text='''Date to record the log.'''
+        help_text='''Date to record the log.''',
+        db_index=True
     )
         
     key = models.CharField(
@@ -387,11 +763,13 @@ class HoudiniLog(models.Model):
     class Meta:
         # How to order results when doing queries:
         ordering = ('date',)    
+        # Reports filter on date ranges and join on the machine config.
+        index_together = (('stats_machine_config', 'date'),)
         db_name = 'stats'            
 
 #-------------------------------------------------------------------------------
 
-class Uptime(models.Model):
+class Uptime(UploadRow, models.Model):
     """
     Represent the uptime of a machine using houdini.
     """
@@ -402,7 +780,14 @@ class Uptime(models.Model):
     )
 
     date = models.DateTimeField(
-        help_text='''Date to record the uptime.'''
+        help_text='''Date to record the uptime.''',
+        db_index=True
+    )
+
+    day = models.DateField(
+        help_text='''Calendar day of the date, filled in when saving.''',
+        null=True,
+        db_index=True
     )
     
     number_of_seconds = models.PositiveIntegerField(
@@ -415,6 +800,10 @@ class Uptime(models.Model):
         help_text='''Number of seconds houdini was open but inactive.'''
     )
         
+    def save(self, *args, **kwargs):
+        self.day = self.date.date()
+        super(Uptime, self).save(*args, **kwargs)
+
     def __unicode__(self):
         return "Uptime(%s, %d, %s)" % \
             (self.stats_machine_config.config_hash, self.number_of_seconds, self.date)
@@ -422,8 +811,171 @@ class Uptime(models.Model):
     class Meta:
         # How to order results when doing queries:
         ordering = ('date','number_of_seconds')    
-        db_name = 'stats'   
-        
+        # Reports filter on date ranges and join on the machine config.
+        index_together = (('stats_machine_config', 'date'),)
+        db_name = 'stats'
+
+#-------------------------------------------------------------------------------
+
+class HoudiniMachineActivityDaily(models.Model):
+    """
+    Daily rollup of the sessions and crashes of each machine, maintained
+    incrementally when uploads are ingested. The uptime reports read from
+    this table instead of scanning the raw Uptime and HoudiniCrash rows.
+    """
+
+    day = models.DateField(
+        help_text='''Day of the sessions and crashes.'''
+    )
+
+    machine = models.ForeignKey(
+        'stats_main.Machine',
+        help_text='''The machine that sent the sessions and crashes.'''
+    )
+
+    is_internal = models.BooleanField(
+        help_text='''Was the machine in one of the internal networks?''',
+        default=False
+    )
+
+    houdini_version = models.ForeignKey(
+        'HoudiniVersion',
+        help_text='''Houdini version, build and product used.'''
+    )
+
+    num_sessions = models.PositiveIntegerField(
+        default=0,
+        help_text='''Number of uptimes sent that day.'''
+    )
+
+    total_seconds = models.PositiveIntegerField(
+        default=0,
+        help_text='''Sum of the number of seconds of the uptimes.'''
+    )
+
+    total_idle_time = models.PositiveIntegerField(
+        default=0,
+        help_text='''Sum of the idle time of the uptimes.'''
+    )
+
+    num_crashes = models.PositiveIntegerField(
+        default=0,
+        help_text='''Number of crashes sent that day.'''
+    )
+
+    def __unicode__(self):
+        return "HoudiniMachineActivityDaily(%s, %s, %d, %d)" % \
+            (self.day, self.machine_id, self.num_sessions, self.num_crashes)
+
+    class Meta:
+        # One row per day, machine and Houdini version, also used as the
+        # index for day ranges.
+        unique_together = (('day', 'machine', 'is_internal',
+                            'houdini_version'),)
+        ordering = ('day',)
+        db_name = 'stats'
+
+#-------------------------------------------------------------------------------
+
+class HoudiniCrashGroupDaily(models.Model):
+    """
+    Daily rollup of the crashes of each crash group, maintained incrementally
+    when uploads are ingested. The crash group reports read from this table
+    instead of joining the raw HoudiniCrash rows to the machine configs.
+    """
+
+    day = models.DateField(
+        help_text='''Day of the crashes.'''
+    )
+
+    group = models.ForeignKey(
+        'HoudiniCrashGroup',
+        help_text='''The crash group.'''
+    )
+
+    is_internal = models.BooleanField(
+        help_text='''Were the machines in one of the internal networks?''',
+        default=False
+    )
+
+    houdini_version = models.ForeignKey(
+        'HoudiniVersion',
+        help_text='''Houdini version, build and product used.'''
+    )
+
+    num_crashes = models.PositiveIntegerField(
+        default=0,
+        help_text='''Number of crashes sent that day.'''
+    )
+
+    def __unicode__(self):
+        return "HoudiniCrashGroupDaily(%s, %s, %d)" % \
+            (self.day, self.group_id, self.num_crashes)
+
+    class Meta:
+        # One row per day, group and Houdini version, also used as the index
+        # for day ranges.
+        unique_together = (('day', 'group', 'is_internal',
+                            'houdini_version'),)
+        ordering = ('day',)
+        db_name = 'stats'
+
+#-------------------------------------------------------------------------------
+
+class HoudiniMachineSketch(models.Model):
+    """
+    HyperLogLog sketch of the ids of the machines that were active on a day,
+    for one segment of machines. Sketches are merged to count the distinct
+    machines of longer periods approximately (see houdini_stats/hyperloglog.py).
+    """
+
+    # What the machines did to be counted in the sketch.
+    SENT_UPTIME = 1
+    SENT_CRASH = 2
+
+    KINDS = (
+        (SENT_UPTIME, "Sent uptime"),
+        (SENT_CRASH, "Sent crash"),
+    )
+
+    day = models.DateField(
+        help_text='''Day the machines were active.'''
+    )
+
+    kind = models.IntegerField(choices=KINDS)
+
+    is_internal = models.BooleanField(
+        help_text='''Are the machines in one of the internal networks?''',
+        default=False
+    )
+
+    os_family = models.CharField(
+        help_text='''Operating system family of the machines (Ex. Linux).''',
+        max_length=10
+    )
+
+    houdini_major_version = models.IntegerField(
+        help_text='''Houdini major version the machines were running.''',
+        default=0
+    )
+
+    sketch = models.TextField(
+        help_text='''The serialized sketch of the machine ids.''',
+        blank=True
+    )
+
+    def __unicode__(self):
+        return "HoudiniMachineSketch(%s, %s, %s, %s, %s)" % (
+            self.day, self.get_kind_display(), self.is_internal,
+            self.os_family, self.houdini_major_version)
+
+    class Meta:
+        # One sketch per day and segment, also used as the index for day
+        # ranges.
+        unique_together = (('day', 'kind', 'is_internal', 'os_family',
+                            'houdini_major_version'),)
+        ordering = ('day',)
+        db_name = 'stats'
 
 #-------------------------------------------------------------------------------
 
@@ -521,3 +1073,36 @@ class HoudiniPersistentStatsEntry(models.Model):
         unique_together = (('persistent_stats', 'persistent_stats_kvp'),)
         db_name = 'stats'             
 
+
+#-------------------------------------------------------------------------------
+
+class HoudiniWarehouseWatermark(models.Model):
+    """
+    How far the incremental builders of the warehouse tables (see
+    houdini_stats/warehouse.py), and other resumable jobs, got.
+    """
+
+    table_name = models.CharField(
+        help_text='''The warehouse table built.''',
+        max_length=80,
+        unique=True
+    )
+
+    last_id = models.BigIntegerField(
+        help_text='''Id of the last source row added to the table.''',
+        default=0
+    )
+
+    last_date = models.DateTimeField(
+        help_text='''When the job last ran, for the jobs tracked by date
+                     (ex. the ingest watermark of the report caches).''',
+        default=None,
+        null=True
+    )
+
+    def __unicode__(self):
+        return "HoudiniWarehouseWatermark(%s, %d)" % (
+            self.table_name, self.last_id)
+
+    class Meta:
+        db_name = 'stats'
@@ -0,0 +1,75 @@
+"""
+Concurrent execution of the independent queries of a report.
+
+Most reports chart several series that come from separate queries. Running
+them one after the other makes a report as slow as the sum of its queries;
+running them on a small shared thread pool makes it as slow as the slowest
+one. Django keeps a separate database connection per thread, so every worker
+queries the stats database on its own connection.
+"""
+import threading
+from multiprocessing.pool import ThreadPool
+
+import django.db
+
+import settings
+from houdini_stats import instrumentation
+
+#-------------------------------------------------------------------------------
+
+def _get_max_workers():
+    """
+    Maximum number of queries run at the same time, for all the reports
+    served by this process. 1 or less runs the queries in the calling thread.
+    """
+    return getattr(settings, "HOUDINI_STATS_REPORT_QUERY_THREADS", 4)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(_get_max_workers())
+        return _pool
+
+def _run_in_worker(call, labels):
+    """
+    Run a call in a pool thread, with the query labels of the thread that
+    submitted it, and close the connections it opened, so idle workers
+    don't hold connections the database may time out.
+    """
+    report, series = labels
+    try:
+        with instrumentation.labelled(report=report, series=series):
+            return call()
+    finally:
+        for connection in django.db.connections.all():
+            connection.close()
+
+#-------------------------------------------------------------------------------
+
+def run_in_parallel(*calls):
+    """
+    Run the given callables, which take no arguments, concurrently and return
+    their results in the same order. If any of them raises an exception, it
+    is raised again here once all of them are done.
+
+    Usage:
+        crashes, events = run_in_parallel(
+            lambda: num_crashes_over_time(series_range, aggregation),
+            lambda: get_events_in_range(series_range, aggregation))
+    """
+    if len(calls) <= 1 or _get_max_workers() <= 1:
+        return [call() for call in calls]
+
+    labels = instrumentation.get_labels()
+    async_results = [_get_pool().apply_async(_run_in_worker, (call, labels))
+                     for call in calls]
+
+    # Wait for every call before raising, so no query is left running on
+    # behalf of a request that has already failed.
+    for async_result in async_results:
+        async_result.wait()
+    return [async_result.get() for async_result in async_results]
@@ -0,0 +1,258 @@
+"""
+Report queries compiled into parameterized statements.
+
+The report queries are written with the template tags of stats_main, and
+get_sql_data_for_report renders them with the values of every call embedded
+in the SQL. Instead, each query is compiled once, the first time it is run:
+the value tags become driver placeholders and the values are bound as
+parameters on every call. Only the date aggregation, which changes the
+structure of the query, is rendered by the template engine, once per
+aggregation.
+
+Supported tags:
+    {{ name }}                                  a bound value ('{{ name }}'
+                                                too); lists and tuples are
+                                                bound as (v1, v2, ...)
+    {% where_between "column" start end %}      column between the two values
+    {% aggregated_date "column" aggregation %}  rendered once per aggregation
+"""
+import calendar
+import datetime
+import re
+import threading
+
+import django.db
+from stats_main.genericreportclasses import expand_templated_query
+
+from houdini_stats.instrumentation import run_query
+
+#-------------------------------------------------------------------------------
+
+_TAG_RE = re.compile(r"""
+    (?P<quote>['"]?)\{\{\s*(?P<variable>\w+)\s*\}\}(?P=quote)
+  | \{%\s*where_between\s+"(?P<between_column>[^"]+)"
+        \s+(?P<start>\w+)\s+(?P<end>\w+)\s*%\}
+  | \{%\s*aggregated_date\s+"(?P<aggregated_column>[^"]+)"
+        \s+(?P<aggregation>\w+)\s*%\}
+  | (?P<other>\{%.*?%\}|\{\{.*?\}\})
+    """, re.VERBOSE | re.DOTALL)
+
+class CompiledQuery(object):
+    """
+    A report query split into SQL text, bound values and aggregated dates.
+    """
+
+    def __init__(self, string_query):
+        # List of ("sql", text), ("value", name) and
+        # ("aggregated_date", column, aggregation variable) pieces.
+        self.pieces = []
+        position = 0
+        for match in _TAG_RE.finditer(string_query):
+            self._add_sql(string_query[position:match.start()])
+            position = match.end()
+
+            if match.group("variable"):
+                self.pieces.append(("value", match.group("variable")))
+            elif match.group("between_column"):
+                self._add_sql(match.group("between_column") + " between ")
+                self.pieces.append(("value", match.group("start")))
+                self._add_sql(" and ")
+                self.pieces.append(("value", match.group("end")))
+            elif match.group("aggregated_column"):
+                self.pieces.append(("aggregated_date",
+                    match.group("aggregated_column"),
+                    match.group("aggregation")))
+            else:
+                raise ValueError("Can't compile the template tag %s" %
+                                 match.group("other"))
+        self._add_sql(string_query[position:])
+
+        # Statements already built, by the aggregations and the lengths of
+        # the list values they were built for.
+        self.statements = {}
+        self.lock = threading.Lock()
+
+    def _add_sql(self, sql):
+        # Literal percent signs must be doubled once the values are bound.
+        self.pieces.append(("sql", sql.replace("%", "%%")))
+
+    def _get_statement(self, context_vars):
+        key = tuple(
+            context_vars[piece[2]] if piece[0] == "aggregated_date" else
+            len(context_vars[piece[1]])
+            if isinstance(context_vars.get(piece[1]), (list, tuple)) else None
+            for piece in self.pieces if piece[0] != "sql")
+
+        with self.lock:
+            statement = self.statements.get(key)
+        if statement is not None:
+            return statement
+
+        sql = []
+        for piece in self.pieces:
+            if piece[0] == "sql":
+                sql.append(piece[1])
+            elif piece[0] == "value":
+                value = context_vars[piece[1]]
+                if isinstance(value, (list, tuple)):
+                    sql.append("(" + ", ".join(["%s"] * len(value)) + ")")
+                else:
+                    sql.append("%s")
+            else:
+                aggregated_date = expand_templated_query(
+                    '{%% aggregated_date "%s" aggregation %%}' % piece[1],
+                    {"aggregation": context_vars[piece[2]]})
+                sql.append(aggregated_date.replace("%", "%%"))
+        statement = "".join(sql)
+
+        with self.lock:
+            self.statements[key] = statement
+        return statement
+
+    def get_params(self, context_vars):
+        params = []
+        for piece in self.pieces:
+            if piece[0] == "value":
+                value = context_vars[piece[1]]
+                if isinstance(value, (list, tuple)):
+                    params.extend(value)
+                else:
+                    params.append(value)
+        return params
+
+    def execute(self, cursor, context_vars):
+        """
+        Run the query and return its rows and column description. The run
+        is timed and logged by houdini_stats.instrumentation.
+        """
+        return run_query(cursor, self._get_statement(context_vars),
+                         self.get_params(context_vars))
+
+_compiled_queries = {}
+_compiled_queries_lock = threading.Lock()
+
+def compile_query(string_query):
+    """
+    Return the CompiledQuery of a report query, compiling it the first time.
+    """
+    with _compiled_queries_lock:
+        compiled_query = _compiled_queries.get(string_query)
+    if compiled_query is None:
+        compiled_query = CompiledQuery(string_query)
+        with _compiled_queries_lock:
+            _compiled_queries[string_query] = compiled_query
+    return compiled_query
+
+#-------------------------------------------------------------------------------
+
+def get_sql_data(string_query, db_name, context_vars, fill_zeros=True):
+    """
+    Run a report query with its values bound as parameters and return its
+    rows. Takes the same arguments as stats_main's get_sql_data_for_report,
+    which it replaces for the Houdini reports.
+
+    When fill_zeros is true, the rows are a time series whose first column
+    is the aggregated date, and the buckets of the range without rows are
+    added with zeros.
+    """
+    context_vars = dict(context_vars)
+    if "start_date" not in context_vars and "series_range" in context_vars:
+        context_vars["start_date"], context_vars["end_date"] = \
+            context_vars["series_range"]
+
+    cursor = django.db.connections[db_name].cursor()
+    rows, description = compile_query(string_query).execute(
+        cursor, context_vars)
+    rows = [tuple(row) for row in rows]
+
+    if not fill_zeros:
+        return rows
+    return _fill_zeros(rows, len(description),
+        context_vars["start_date"], context_vars["end_date"],
+        context_vars.get("aggregation"))
+
+#-------------------------------------------------------------------------------
+# Zero filling of time series
+
+def _add_months(date, num_months):
+    month_index = date.month - 1 + num_months
+    year = date.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(date.day, calendar.monthrange(year, month)[1])
+    return date.replace(year=year, month=month, day=day)
+
+def _step_bucket(date, aggregation, num_steps):
+    """
+    Return the start of the bucket num_steps buckets after (or before) the
+    bucket starting at date.
+    """
+    if aggregation == "weekly":
+        return date + datetime.timedelta(days=7 * num_steps)
+    if aggregation == "monthly":
+        return _add_months(date, num_steps)
+    if aggregation == "yearly":
+        return _add_months(date, 12 * num_steps)
+    return date + datetime.timedelta(days=num_steps)
+
+def _get_bucket_start(date, aggregation):
+    date = datetime.datetime(date.year, date.month, date.day)
+    if aggregation == "weekly":
+        return date - datetime.timedelta(days=date.weekday())
+    if aggregation == "monthly":
+        return date.replace(day=1)
+    if aggregation == "yearly":
+        return date.replace(month=1, day=1)
+    return date
+
+def _to_datetime(date):
+    if isinstance(date, datetime.datetime):
+        return date
+    return datetime.datetime(date.year, date.month, date.day)
+
+def _get_bucket_key(date, aggregation):
+    """
+    Key of the bucket of a date returned by the database. Months and years
+    are matched by their number, whatever day the database dated them with.
+    """
+    if aggregation == "monthly":
+        return (date.year, date.month)
+    if aggregation == "yearly":
+        return date.year
+    return date
+
+def _fill_zeros(rows, num_columns, start_date, end_date, aggregation):
+    """
+    Add a row of zeros for every bucket between start_date and end_date that
+    has no row. Months and years are stepped from their first day, so the
+    buckets don't drift on shorter months. Days and weeks are aligned on the
+    first row returned by the database, so they always match how the query
+    aggregated the dates.
+    """
+    start_date = _to_datetime(start_date)
+    end_date = _to_datetime(end_date)
+    rows_by_key = dict(
+        (_get_bucket_key(_to_datetime(row[0]), aggregation), row)
+        for row in rows if row[0] is not None)
+
+    date_type = datetime.datetime
+    bucket_start = _get_bucket_start(start_date, aggregation)
+    if len(rows_by_key) != 0:
+        date_type = type(next(row[0] for row in rows if row[0] is not None))
+        if aggregation not in ("monthly", "yearly"):
+            # Walk back to the bucket containing start_date.
+            bucket_start = min(rows_by_key)
+            while bucket_start > start_date:
+                bucket_start = _step_bucket(bucket_start, aggregation, -1)
+
+    zeros = (0,) * (num_columns - 1)
+    filled_rows = []
+    while bucket_start <= end_date:
+        row = rows_by_key.get(_get_bucket_key(bucket_start, aggregation))
+        if row is None:
+            date = bucket_start
+            if date_type is datetime.date:
+                date = bucket_start.date()
+            row = (date,) + zeros
+        filled_rows.append(row)
+        bucket_start = _step_bucket(bucket_start, aggregation, 1)
+    return filled_rows
@@ -9,36 +9,100 @@ import stats_main.utils
 import stats_main.time_series 
 
 from houdini_stats.models import *
+from houdini_stats.caching import cached_report_data, cached_closed_buckets
+from houdini_stats.parallel import run_in_parallel
+from houdini_stats.queries import get_sql_data
+from houdini_stats.classification import OS_FAMILIES, parse_houdini_build
+from houdini_stats.hyperloglog import HyperLogLog, merge_all
 from stats_main.models import *
-from settings import IP_PATTERNS, HOUDINI_VERSIONS 
-
-#===============================================================================
-linux = ['linux', 'mint', 'debian', 'ubuntu', 'fedora', 'centos', 'rhel', 
-         'opensuse', 'red hat', '/sid']
-windows = ['windows']
-mac = ['mac', 'mavericks', 'mountain lion']
+from settings import HOUDINI_VERSIONS 
 
 #-------------------------------------------------------------------------------
 
-def _get_ip_filter(external):
+def _get_ip_filter(external, table="hmc"):
     """
-    Get the right peace of sql query to filter ip addresses for external and 
-    internal machines
+    Get the right peace of sql query to filter external and internal machines.
+    Machine configs are classified when they are ingested, so the query must
+    join houdini_stats_houdinimachineconfig (as hmc, unless another table
+    name is given).
     """
     
     if external:
-        return """(mc.ip_address not like '{{ ip_pattern1 }}'
-                      and mc.ip_address not like '{{ ip_pattern2 }}')""" 
+        return """%s.is_internal = false""" % table
     
-    return """(mc.ip_address like '{{ ip_pattern1 }}'
-              or mc.ip_address like '{{ ip_pattern2 }}')""" 
+    return """%s.is_internal = true""" % table
+
+#-------------------------------------------------------------------------------
+def _split_series(rows, num_series):
+    """
+    Split the rows returned by a query that computes several series in one
+    pass, of the form (date, value_1, ..., value_n), into n time series of
+    (date, value) rows. Missing values become 0.
+    """
+    all_series = []
+    for i in range(1, num_series + 1):
+        all_series.append([
+            (row[0], row[i] if len(row) > i and row[i] is not None else 0)
+            for row in rows])
+    return all_series
     
 #-------------------------------------------------------------------------------
-def _contains_any(string, substrings):
-    for substring in substrings:
-        if substring in string:
-            return True
-    return False
+# Approximate distinct machine counts, from the daily machine sketches.
+
+def _get_counting_filter(report):
+    return DropdownFilter(report, "counting", "Counting of machines:",
+                          ["Exact", "Approximate"])
+
+def _is_approximate(filter_values):
+    return (filter_values or {}).get("counting") == "Approximate"
+
+def _get_machine_sketches(kind, series_range, aggregation):
+    """
+    Get the daily machine sketches of the given kind in the range, as a list
+    of (date, sketches) per aggregated date, where sketches is a list of
+    ((is_internal, os_family, houdini_major_version), sketch) tuples.
+    """
+    rows = get_sql_data(
+        """
+        select {% aggregated_date "s.day" aggregation %} AS mydate,
+               s.is_internal, s.os_family, s.houdini_major_version, s.sketch
+        from houdini_stats_houdinimachinesketch s
+        where s.kind = {{ kind }}
+        and {% where_between "s.day" start_date end_date %}
+        order by mydate
+        """,
+        'stats', locals(), fill_zeros=False)
+
+    buckets = []
+    for mydate, is_internal, os_family, houdini_major_version, sketch in rows:
+        if len(buckets) == 0 or buckets[-1][0] != mydate:
+            buckets.append((mydate, []))
+        buckets[-1][1].append(
+            ((bool(is_internal), os_family, houdini_major_version),
+             HyperLogLog.from_string(sketch)))
+    return buckets
+
+def _count_machines_by_series(sketches, series_keys, get_series_key):
+    """
+    Merge the sketches of each series and return their estimated number of
+    machines, in the order of series_keys. get_series_key(is_internal,
+    os_family, houdini_major_version) returns the series of a sketch, or None
+    to leave it out.
+    """
+    sketches_by_series = defaultdict(list)
+    for segment, sketch in sketches:
+        sketches_by_series[get_series_key(*segment)].append(sketch)
+    return tuple(merge_all(sketches_by_series[series_key]).count()
+                 for series_key in series_keys)
+
+def _count_machines_by_date(buckets, series_keys, get_series_key):
+    """
+    Return (date, count_1, ..., count_n) rows with the estimated number of
+    machines of each series for each aggregated date.
+    """
+    return [(mydate,) + _count_machines_by_series(
+                sketches, series_keys, get_series_key)
+            for mydate, sketches in buckets]
 
 #-------------------------------------------------------------------------------
 def _clean_os_names(full_os_name_and_counts_list):
@@ -54,47 +118,13 @@ def _clean_os_names(full_os_name_and_counts_list):
     return cleaned_list
 
 #-------------------------------------------------------------------------------
-def _get_counts_by_os_trans(full_os_name_and_counts_list):
-        """
-        This function does a data transformation.
-        
-        Receiving a list form (example):
-        [(u'linux-x86_64-gcc4.4', 57L), 
-        (u'linux-x86_64-gcc4.6', 38L), (u'linux-x86_64-gcc4.7', 18L), 
-        (u'darwin-x86_64-clang5.1-MacOSX10.9', 16L), 
-        (u'darwin-x86_64-clang4.1-MacOSX10.8', 3L), 
-        (u'macosx10.10-x86_64-clang6.1', 2L), 
-        (u'windows-i686-cl17', 1L)]
-
-        Return a list of a more general level, and adding the OS with the same
-        type, for example:
-        
-        [(u'Linux', 113L), 
-        (u'Mac', 21L), 
-        (u'Windows', 1L)]
-        """
-        
-        linux_counts = 0
-        mac_counts = 0
-        win_counts= 0
-        unknown_counts = 0 
-         
-        for os_name, count in full_os_name_and_counts_list:
-            os_name = os_name.lower() 
-            if _contains_any(os_name, linux):
-                linux_counts+=count
-            elif _contains_any(os_name, mac):
-                mac_counts+=count
-            elif 'windows' in os_name:
-                win_counts+=count   
-            else:
-                #print os_name  
-                unknown_counts+=count            
-        
-        return [('Linux', linux_counts),
-                ('Mac OS', mac_counts),
-                ('Windows', win_counts),
-                ('Unknown', unknown_counts)]    
+def _get_counts_by_os_family(os_family_and_counts_list):
+    """
+    Return the (os family, count) rows grouped by the database in the order
+    of OS_FAMILIES, with a 0 count for the families without rows.
+    """
+    counts = defaultdict(int, os_family_and_counts_list)
+    return [(os_family, counts[os_family]) for os_family in OS_FAMILIES]
 
 #===============================================================================
 # Houdini Usage Report Classes
@@ -119,42 +149,37 @@ class NewMachinesOverTime(HoudiniStatsReport):
     def title(self):
         return "Number of New Machines Subscribed"
 
+    @cached_report_data
     def get_data(self, series_range, aggregation, filter_values):
-        # Observation: When aggregating different dates the query don't take  
-        # into account that the machine configs might have been inserted to the
-        # DB in an earlier period of time and counts machine configs that might 
-        # have been inserted earlier, since the distinct operator just do the 
-        # lookup in the given time range. 
         
-        def num_new_machines_sending_stats_over_time(series_range, aggregation, external):
-            ip_pattern1 = IP_PATTERNS[0] 
-            ip_pattern2 = IP_PATTERNS[1]
-  
-            return get_sql_data_for_report("""
-                select {% aggregated_date "min_creation_date" aggregation %} 
-                       as mydate, count(machines_count)
-                from(  
-                select min(str_to_date(date_format(creation_date, '%%Y-%%m-%%d'),
-                                                                '%%Y-%%m-%%d')) 
-                       as min_creation_date,
-                       count(distinct machine_id) as machines_count 
-                from stats_main_machineconfig mc
-                where {% where_between "creation_date" start_date end_date %}
-                and """ + _get_ip_filter(external) + """ 
-                group by machine_id
-                order by min_creation_date)
-                as TempTable
+        def num_new_machines_sending_stats_over_time(series_range, aggregation):
+            # Machines are new when their first config is created, which is
+            # recorded when the configs are ingested. External and internal
+            # machines are counted in the same pass.
+            return get_sql_data("""
+                select {% aggregated_date "f.first_seen" aggregation %} 
+                       as mydate, 
+                       count(case when """ + _get_ip_filter(True, "f") + """
+                                  then 1 end),
+                       count(case when """ + _get_ip_filter(False, "f") + """
+                                  then 1 end)
+                from houdini_stats_houdinimachinefirstseen f
+                where {% where_between "f.first_seen" start_date end_date %}
                 group by mydate
                 order by mydate""",
                 'stats', locals())
         
+        # Only exact counts: the sketches can't tell which machines were
+        # already seen before the range without merging every earlier day.
+        machines, events = run_in_parallel(
+            lambda: num_new_machines_sending_stats_over_time(
+                series_range, aggregation),
+            lambda: get_events_in_range(series_range, aggregation))
+        external_machines, internal_machines = _split_series(machines, 2)
+        
         return time_series.merge_time_series(
-            [num_new_machines_sending_stats_over_time(series_range, aggregation, 
-                                                      external=True),
-             get_events_in_range(series_range, aggregation),  
-             num_new_machines_sending_stats_over_time(series_range, aggregation, 
-                                                      external=False)])
-    
+            [external_machines, events, internal_machines])
+
     def chart_columns(self, filter_values):
         return """
         {% col "string" "Date" %}
@@ -180,36 +205,53 @@ class MachinesActivelySendingStats(HoudiniStatsReport):
     def title(self):
         return "Number of Machines Actively Sending Stats"
 
+    def get_filters(self):
+        return (_get_counting_filter(self),)
+
+    @cached_report_data
     def get_data(self, series_range, aggregation, filter_values):
         
+        @cached_closed_buckets("num_machines_actively_sending_stats_by_type")
         def num_machines_actively_sending_stats_over_time(series_range, 
-                                                         aggregation, external):
-            ip_pattern1 = IP_PATTERNS[0] 
-            ip_pattern2 = IP_PATTERNS[1]
-            
-            return get_sql_data_for_report(
+                                                          aggregation):
+            # External and internal machines are counted in the same pass.
+            return get_sql_data(
                 """
-                select mydate, count( distinct machine )
-                from (
-                select {% aggregated_date "u.date" aggregation %} AS mydate, 
-                   mc.machine_id AS machine
-                from houdini_stats_uptime u, stats_main_machineconfig mc
-                where mc.id = u.stats_machine_config_id
-                and {% where_between "u.date" start_date end_date %}
-                and """ + _get_ip_filter(external) + """ 
-                ORDER BY u.date
-                ) as tempTable
+                select {% aggregated_date "a.day" aggregation %} AS mydate, 
+                   count(distinct case when """ +
+                                  _get_ip_filter(True, "a") + """
+                                  then a.machine_id end),
+                   count(distinct case when """ +
+                                  _get_ip_filter(False, "a") + """
+                                  then a.machine_id end)
+                from houdini_stats_houdinimachineactivitydaily a
+                where a.num_sessions > 0
+                and {% where_between "a.day" start_date end_date %}
                 GROUP BY mydate
                 ORDER BY mydate  
                """ ,
                'stats', locals())
+        
+        def approximate_num_machines_actively_sending_stats(series_range,
+                                                            aggregation):
+            return _count_machines_by_date(
+                _get_machine_sketches(HoudiniMachineSketch.SENT_UPTIME,
+                                      series_range, aggregation),
+                (False, True),
+                lambda is_internal, os_family, version: is_internal)
+        
+        if _is_approximate(filter_values):
+            count_machines = approximate_num_machines_actively_sending_stats
+        else:
+            count_machines = num_machines_actively_sending_stats_over_time
+        
+        machines, events = run_in_parallel(
+            lambda: count_machines(series_range, aggregation),
+            lambda: get_events_in_range(series_range, aggregation))
+        external_machines, internal_machines = _split_series(machines, 2)
   
         return time_series.merge_time_series(
-                   [num_machines_actively_sending_stats_over_time(series_range, 
-                                                  aggregation, external=True),
-                   get_events_in_range(series_range, aggregation),  
-                   num_machines_actively_sending_stats_over_time(series_range, 
-                                                  aggregation, external=False)])
+                   [external_machines, events, internal_machines])
 
     def chart_columns(self, filter_values):
         return """
@@ -234,10 +276,10 @@ class MachinesSendingStatsByOS(HoudiniStatsReport):
     def external_machines(self):
         return ""
         
-    def get_query(self):
+    def get_filters(self):
+        return (_get_counting_filter(self),)
         
-        ip_pattern1 = IP_PATTERNS[0] 
-        ip_pattern2 = IP_PATTERNS[1]
+    def get_query(self):
         
         return """
                 select os, count_by_os 
@@ -245,31 +287,71 @@ class MachinesSendingStatsByOS(HoudiniStatsReport):
                 select from_days( min( to_days( date ) ) ) AS min_date, 
                 mc.operating_system AS os, 
                 count(distinct(mc.machine_id)) AS count_by_os
-                from houdini_stats_uptime AS u, stats_main_machineconfig as mc
+                from houdini_stats_uptime AS u, stats_main_machineconfig as mc,
+                     houdini_stats_houdinimachineconfig as hmc
                 where mc.id = u.stats_machine_config_id
+                and mc.id = hmc.machine_config_id
                 and {% where_between "date" start_date end_date %}
-                and """ + _get_ip_filter(self.external_machines) + """
+                and """ + _get_ip_filter(self.external_machines()) + """
                 group by os
                 order by min_date)
                 as TempTable
                 order by os
                 """
+
+    def get_os_family_query(self):
+        
+        return """
+                select hmc.os_family, count(distinct(mc.machine_id))
+                from houdini_stats_uptime AS u, stats_main_machineconfig as mc,
+                     houdini_stats_houdinimachineconfig as hmc
+                where mc.id = u.stats_machine_config_id
+                and mc.id = hmc.machine_config_id
+                and {% where_between "date" start_date end_date %}
+                and """ + _get_ip_filter(self.external_machines()) + """
+                group by hmc.os_family
+                """
+
+    def _get_approximate_counts_by_os(self, series_range, aggregation):
+        """
+        Estimate the machines of each OS family from the daily machine
+        sketches. The sketches don't keep the full OS names, so both charts
+        show the OS families.
+        """
+        is_internal = not self.external_machines()
+        sketches = [sketch for mydate, bucket_sketches in
+                    _get_machine_sketches(HoudiniMachineSketch.SENT_UPTIME,
+                                          series_range, aggregation)
+                    for sketch in bucket_sketches]
+        counts = _count_machines_by_series(
+            sketches, OS_FAMILIES,
+            lambda sketch_is_internal, os_family, version:
+                os_family if sketch_is_internal == is_internal else None)
+        
+        os_families_and_counts = list(zip(OS_FAMILIES, counts))
+        return [os_families_and_counts, os_families_and_counts]
+    
+    @cached_report_data
     def get_data(self, series_range, aggregation, filter_values):
         
-        machines_sending_stats_by_os = get_sql_data_for_report(
-               self.get_query(), 'stats', 
-                locals(),
-                fill_zeros = False)
+        if _is_approximate(filter_values):
+            return self._get_approximate_counts_by_os(series_range, aggregation)
+        
+        # The OS families are classified when the machine configs are
+        # ingested, so the database groups the machines by family.
+        query_context = locals()
+        machines_sending_stats_by_os_family, machines_sending_stats_by_os = \
+            run_in_parallel(
+                lambda: get_sql_data(self.get_os_family_query(),
+                    'stats', query_context, fill_zeros = False),
+                lambda: get_sql_data(self.get_query(),
+                    'stats', query_context, fill_zeros = False))
         
         # Clean os names
         machines_sending_stats_by_os = _clean_os_names(
                                                    machines_sending_stats_by_os)
         
-        # Apply transformation to the data
-        general_machines_os_names_and_counts = _get_counts_by_os_trans(
-                                           machines_sending_stats_by_os)
-        
-        return [general_machines_os_names_and_counts, 
+        return [_get_counts_by_os_family(machines_sending_stats_by_os_family), 
                 machines_sending_stats_by_os]
         
     
@@ -320,48 +402,49 @@ class AvgNumConnectionsFromSameMachine(HoudiniStatsReport):
     """
     Average number of individual successful connections from the same machine.
     Column Chart.
+
+    The average is over the days each machine connected, counting all the
+    configs of a machine as one machine. Before the daily machine activity
+    rollup, each machine config was counted separately.
     """  
     def name(self):
         return "avg_num_conn_from_same_machine"
 
     def title(self):
-        return "Average Num of Individual Connections From the Same Machine "
+        return "Average Num of Connections per Machine and Day"
 
+    @cached_report_data
     def get_data(self, series_range, aggregation, filter_values):
         #TO IMPROVE (YB): Take into account the connections that resulted into 
         # crashes, which means take the crashes table into account too, to compute 
         # the results for the average (Maybe doing a merge using Panda?). 
          
-        def avg_num_connections_same_machine(series_range, aggregation, 
-                                             external):
-            ip_pattern1 = IP_PATTERNS[0] 
-            ip_pattern2 = IP_PATTERNS[1]
-               
-            return get_sql_data_for_report(
+        @cached_closed_buckets("avg_num_connections_same_machine_by_type")
+        def avg_num_connections_same_machine(series_range, aggregation):
+            # External and internal machines are averaged in the same pass.
+            return get_sql_data(
             """
             select {% aggregated_date "day" aggregation %} AS mydate, 
-                    avg(total_records)
+                    avg(case when """ + _get_ip_filter(True, "TempTable") + """
+                             then total_records end),
+                    avg(case when """ + _get_ip_filter(False, "TempTable") + """
+                             then total_records end)
             from (
-                 select u.stats_machine_config_id,
-                 str_to_date(date_format(u.date, '%%Y-%%m-%%d'),'%%Y-%%m-%%d') 
-                 as day,
-                 count(u.stats_machine_config_id) as total_records
-                 from houdini_stats_uptime u, stats_main_machineconfig mc
-                 where mc.id = u.stats_machine_config_id
-                 and {% where_between "u.date" start_date end_date %}
-                 and """ + _get_ip_filter(external) + """ 
-                 group by u.stats_machine_config_id, day
+                 select a.machine_id, a.day, a.is_internal,
+                 sum(a.num_sessions) as total_records
+                 from houdini_stats_houdinimachineactivitydaily a
+                 where a.num_sessions > 0
+                 and {% where_between "a.day" start_date end_date %}
+                 group by a.machine_id, a.day, a.is_internal
              ) as TempTable
              group by mydate
              order by mydate
              """,
              'stats', locals())
                
-        return time_series.merge_time_series(
-                   [avg_num_connections_same_machine(series_range, aggregation, 
-                                                     external=True),
-                   avg_num_connections_same_machine(series_range, aggregation, 
-                                                    external=False)])
+        return time_series.merge_time_series(_split_series(
+            avg_num_connections_same_machine(series_range, aggregation), 2))
+
     def chart_columns(self, filter_values):
         return """
           {% col "string" "Date" %}"{{ val|date:date_format }}"{% endcol %}
@@ -382,50 +465,51 @@ class AvgNumConnectionsFromSameMachine(HoudiniStatsReport):
 class AverageSessionLength(HoudiniStatsReport):
     """
     Houdini average session length. Column Chart.
+
+    The average is over every session in the bucket, the total active time
+    divided by the number of sessions, so machines with more sessions weigh
+    more. Before the day column was added, one arbitrary session per day was
+    averaged.
     """
     def name(self):
         return "average_session_length"
 
     def title(self):
-        return "Average Session Length (in minutes)"
+        return "Average Length of All Sessions (in minutes)"
 
+    @cached_report_data
     def get_data(self, series_range, aggregation, filter_values):
         
-        def avg_session_length(series_range, aggregation, 
-                                             external):
-            ip_pattern1 = IP_PATTERNS[0] 
-            ip_pattern2 = IP_PATTERNS[1]
-             
-            return  time_series.seconds_to_time_unit_series(
-            get_sql_data_for_report(
+        @cached_closed_buckets("avg_session_length_by_type")
+        def avg_session_length(series_range, aggregation):
+            # External and internal machines are averaged in the same pass.
+            return get_sql_data(
             """
-            select {% aggregated_date "day" aggregation %} AS mydate, 
-                    avg(total_uptime_seconds)
-             from (
-                 select u.stats_machine_config_id,
-                 str_to_date(date_format(u.date, '%%Y-%%m-%%d'),'%%Y-%%m-%%d')
-                    as day,
-                 (u.number_of_seconds - u.idle_time) as total_uptime_seconds
-                 from houdini_stats_uptime u, stats_main_machineconfig mc,
-                      houdini_stats_houdinimachineconfig hmc
-                 where mc.id = u.stats_machine_config_id 
-                 and  mc.id = hmc.machine_config_id
-                 and {% where_between "u.date" start_date end_date %}
-                 and (hmc.product != 'Mantra' and 
-                      hmc.product != 'Hbatch')   
-                 and """ + _get_ip_filter(external) + """ 
-                 group by day
-             ) as TempTable
+            select {% aggregated_date "a.day" aggregation %} AS mydate, 
+                    sum(case when """ + _get_ip_filter(True, "a") + """
+                        then a.total_seconds - a.total_idle_time end) /
+                    sum(case when """ + _get_ip_filter(True, "a") + """
+                        then a.num_sessions end),
+                    sum(case when """ + _get_ip_filter(False, "a") + """
+                        then a.total_seconds - a.total_idle_time end) /
+                    sum(case when """ + _get_ip_filter(False, "a") + """
+                        then a.num_sessions end)
+             from houdini_stats_houdinimachineactivitydaily a,
+                  houdini_stats_houdiniversion v
+             where v.id = a.houdini_version_id
+             and a.num_sessions > 0
+             and {% where_between "a.day" start_date end_date %}
+             and v.product not in ('Mantra', 'Hbatch')
              group by mydate
              order by mydate
              """,
-             'stats', locals()), 
-             "minutes") 
+             'stats', locals())
                 
         return time_series.merge_time_series(
-                 [avg_session_length(series_range, aggregation, external=True),
-                 avg_session_length(series_range, aggregation, external=False)])
-        
+            [time_series.seconds_to_time_unit_series(series, "minutes")
+             for series in _split_series(
+                 avg_session_length(series_range, aggregation), 2)])
+
     def chart_columns(self, filter_values):
         return """
            {% col "string" "Date" %}"{{ val|date:date_format }}"{% endcol %}
@@ -445,46 +529,48 @@ class AverageSessionLength(HoudiniStatsReport):
 class AverageUsageByMachine(HoudiniStatsReport):
     """
     Houdini average usage by machine. Column Chart.
+
+    The average is over the days each machine was used, counting all the
+    configs of a machine as one machine. Before the daily machine activity
+    rollup, each machine config was counted separately.
     """
     def name(self):
         return "average_usage_by_machine"
 
     def title(self):
-        return "Average Usage by Machine (in minutes)"
+        return "Average Usage per Machine and Day (in minutes)"
 
+    @cached_report_data
     def get_data(self, series_range, aggregation, filter_values):   
         
-        def avg_usage_by_machine(series_range, aggregation, external):
-            
-            ip_pattern1 = IP_PATTERNS[0] 
-            ip_pattern2 = IP_PATTERNS[1]
-             
-            return time_series.seconds_to_time_unit_series(
-            get_sql_data_for_report(
+        @cached_closed_buckets("avg_usage_by_machine_by_type")
+        def avg_usage_by_machine(series_range, aggregation):
+            # External and internal machines are averaged in the same pass.
+            return get_sql_data(
             """
             select {% aggregated_date "day" aggregation %} AS mydate, 
-                    avg(total_seconds)
+                    avg(case when """ + _get_ip_filter(True, "TempTable") + """
+                             then total_seconds end),
+                    avg(case when """ + _get_ip_filter(False, "TempTable") + """
+                             then total_seconds end)
              from (
-                 select u.stats_machine_config_id,
-                 str_to_date(date_format(u.date, '%%Y-%%m-%%d'),'%%Y-%%m-%%d')
-                    as day,
-                 sum(u.number_of_seconds - u.idle_time) as total_seconds
-                 from houdini_stats_uptime u, stats_main_machineconfig mc
-                 where mc.id = u.stats_machine_config_id
-                 and {% where_between "u.date" start_date end_date %}
-                 and """ + _get_ip_filter(external) + """  
-                 group by u.stats_machine_config_id, day
+                 select a.machine_id, a.day, a.is_internal,
+                 sum(a.total_seconds - a.total_idle_time) as total_seconds
+                 from houdini_stats_houdinimachineactivitydaily a
+                 where a.num_sessions > 0
+                 and {% where_between "a.day" start_date end_date %}
+                 group by a.machine_id, a.day, a.is_internal
              ) as TempTable
              group by mydate
              order by mydate
              """,
-             'stats', locals()), 
-             "minutes")
+             'stats', locals())
              
         return time_series.merge_time_series(
-              [avg_usage_by_machine(series_range, aggregation, external=True),
-               avg_usage_by_machine(series_range, aggregation, external=False)])
-          
+            [time_series.seconds_to_time_unit_series(series, "minutes")
+             for series in _split_series(
+                 avg_usage_by_machine(series_range, aggregation), 2)])
+
     def chart_columns(self, filter_values):
        return """
            {% col "string" "Date" %}"{{ val|date:date_format }}"{% endcol %}
@@ -500,10 +586,74 @@ class AverageUsageByMachine(HoudiniStatsReport):
 
 #-------------------------------------------------------------------------------
 
-class BreakdownOfApprenticeUsage(HoudiniStatsReport):
+class HistogramReport(HoudiniStatsReport):
+    """
+    Histogram of the values of a column. Column Chart.
+
+    The values are grouped into bins by the database, so only one row per
+    bin is read no matter how many values there are. Values from bin_max up
+    fall in a last, open bin. Subclasses set the bins and return the binned
+    column and the rest of the query from histogram_source().
+    """
+    bin_size = 1
+    bin_max = 100
+
+    def histogram_source(self, series_range, filter_values):
+        """
+        Return a (column, from_and_where) tuple, where column is the sql
+        expression of the values and from_and_where the templated from and
+        where clauses of the query selecting them.
+        """
+        raise NotImplementedError()
+
+    def histogram_context(self, series_range, filter_values):
+        """
+        Return the variables used by the templated query.
+        """
+        start_date, end_date = series_range
+        return {"start_date": start_date, "end_date": end_date}
+
+    def _num_bins(self):
+        return self.bin_max // self.bin_size
+
+    @cached_report_data
+    def get_data(self, series_range, aggregation, filter_values):
+        column, from_and_where = self.histogram_source(
+            series_range, filter_values)
+        query_context = self.histogram_context(series_range, filter_values)
+        query_context.update(bin_size=self.bin_size,
+                             num_bins=self._num_bins())
+
+        rows = get_sql_data(
+            """
+            select least(floor((%s) / {{ bin_size }}), {{ num_bins }}) as bin,
+                   count(*)
+            %s
+            group by bin
+            """ % (column, from_and_where),
+            'stats', query_context, fill_zeros=False)
+
+        bin_counts = [0] * (self._num_bins() + 1)
+        for bin, count in rows:
+            bin_counts[int(bin)] = count
+
+        bin_labels = ["%s - %s" % (i, i + self.bin_size)
+            for i in range(0, self.bin_max, self.bin_size)]
+        bin_labels.append("%s+" % self.bin_max)
+        return zip(bin_labels, bin_counts)
+
+    def chart_options(self):
+        return '"opt_count_wide_columnGreen"'
+
+#-------------------------------------------------------------------------------
+
+class BreakdownOfApprenticeUsage(HistogramReport):
     """
     Breakdown of users who subscribed to Maya or Unity plugin. Column Chart.
     """  
+    bin_size = 2
+    bin_max = 240
+
     def __init__(self, version_tuple):
         self.version_tuple = version_tuple[:]
 
@@ -517,51 +667,26 @@ class BreakdownOfApprenticeUsage(HoudiniStatsReport):
         return ("Time Spent in Houdini %s by Apprentice Users" +
             " (Histogram in Minutes)") % self._version_name()
 
-    def get_data(self, series_range, aggregation, filter_values):
-        # Get the number of seconds of use for each user who started using
+    def histogram_source(self, series_range, filter_values):
+        # Get the number of minutes of use for each user who started using
         # Apprentice in the date range.  For each user, we only consider
         # the amount of time they used Houdini in the first 30 days after
-        # activation.
-        major_version = self.version_tuple[0]
-        minor_version = self.version_tuple[1]
-        string_query = """
-            select
-                usage_in_seconds
+        # activation. The table is kept up to date by the
+        # build_apprentice_usage management command.
+        return ("usage_in_seconds / 60.0", """
             from
                 warehouse_ApprenticeUsageInFirst30Days
             where houdini_major_version = {{ major_version }}
             and houdini_minor_version = {{ minor_version }}
             and {% where_between "start_date" start_date end_date %}
-        """
-        string_query = expand_templated_query(string_query, locals())
-
-        # Now group the values into bins and display a histogram.  Convert
-        # the number of seconds into number of minutes.
-        cursor = stats_main.genericreportclasses._get_cursor("stats")
-        cursor.execute(string_query, [])
-        return self._bin_data(
-            (row[0] / 60.0 for row in cursor.fetchall()),
-            bin_size=2,
-            bin_max=240)
-
-    def _bin_data(self, values, bin_size, bin_max):
-        """Given a series of values, a bin size, and a range from 0 to bin_max,
-        return a sequence of (label, count) bins, where the label is the
-        range for values in that bin and count is the number of values in
-        that bin.
-        """
-        bin_labels = ["%s - %s" % (i, i + bin_size)
-            for i in range(0, bin_max, bin_size)]
-        bin_labels.append("%s+" % bin_max)
-        bin_counts = [0] * ((bin_max / bin_size) + 1)
+        """)
 
-        for value in values:
-            if value >= bin_max:
-                bin_counts[-1] += 1
-            else:
-                bin_counts[int(value / bin_size)] += 1
-
-        return zip(bin_labels, bin_counts)
+    def histogram_context(self, series_range, filter_values):
+        query_context = super(BreakdownOfApprenticeUsage,
+            self).histogram_context(series_range, filter_values)
+        query_context.update(major_version=self.version_tuple[0],
+                             minor_version=self.version_tuple[1])
+        return query_context
 
     def chart_columns(self, filter_values):
        return """
@@ -569,31 +694,63 @@ class BreakdownOfApprenticeUsage(HoudiniStatsReport):
            {% col "number" "# users" %}{{ val }}{% endcol %}
         """
 
-    def chart_options(self):
-        return '"opt_count_wide_columnGreen"'
+def _make_apprentice_usage_report(major_version):
+    """
+    Create the BreakdownOfApprenticeUsageH<major_version> report class, which
+    can be listed in the menus of the settings.
+    """
+    class_name = "BreakdownOfApprenticeUsageH%s" % major_version
 
-class BreakdownOfApprenticeUsageH13(BreakdownOfApprenticeUsage):
     def __init__(self):
-        super(BreakdownOfApprenticeUsageH13, self).__init__((13, 0))
+        BreakdownOfApprenticeUsage.__init__(self, (major_version, 0))
 
-class BreakdownOfApprenticeUsageH14(BreakdownOfApprenticeUsage):
-    def __init__(self):
-        super(BreakdownOfApprenticeUsageH14, self).__init__((14, 0))
+    return type(class_name, (BreakdownOfApprenticeUsage,),
+                {"__init__": __init__, "__module__": __name__})
+
+# One report per Houdini version in settings.HOUDINI_VERSIONS.
+for _major_version in HOUDINI_VERSIONS:
+    _report_class = _make_apprentice_usage_report(_major_version)
+    globals()[_report_class.__name__] = _report_class
 
 #===============================================================================
 
 # Houdini Crashes Report Classes
 
-def _get_hou_version_filter(latest):
+def _get_hou_version_filter(latest, table="hmc"):
     """
     Get the right peace of sql query to filter by houdini versions, latest and
     previous
     """
     if latest:
-        return """hmc.houdini_major_version = '{{ latest_hou }}'  """
+        return """%s.houdini_major_version = {{ latest_hou }} """ % table
     
     else:
-        return """hmc.houdini_major_version <= '{{ previous_hou }}' """    
+        return """%s.houdini_major_version <= {{ previous_hou }} """ % table
+
+def _get_crash_series_filters(table="hmc"):
+    """
+    Get the conditions selecting each of the crash series, in the order they
+    are charted: external machines in the previous and latest versions, then
+    internal machines in the previous and latest versions.
+    """
+    return ["(%s and %s)" % (_get_ip_filter(external, table),
+                             _get_hou_version_filter(latest, table))
+            for external in (True, False) for latest in (False, True)]
+
+def _get_crash_series_with_events(crash_series_func, series_range,
+                                  aggregation):
+    """
+    Run the pivoted query of a crash report alongside the events query and
+    merge its four series with the events, which are charted between the
+    external and internal machines.
+    """
+    crash_rows, events = run_in_parallel(
+        lambda: crash_series_func(series_range, aggregation),
+        lambda: get_events_in_range(series_range, aggregation))
+    crash_series = _split_series(crash_rows, 4)
+    
+    return time_series.merge_time_series(
+        crash_series[:2] + [events] + crash_series[2:])
 
 #-------------------------------------------------------------------------------
     
@@ -607,44 +764,36 @@ class NumCrashesOverTime(HoudiniStatsReport):
     def title(self):
         return "Number of Crashes Over Time"
 
+    @cached_report_data
     def get_data(self, series_range, aggregation, filter_values):
         
-        def num_crashes_over_time(series_range, aggregation, external, latest):
-             
-            ip_pattern1 = IP_PATTERNS[0] 
-            ip_pattern2 = IP_PATTERNS[1]
-             
+        @cached_closed_buckets("num_crashes_over_time_by_type")
+        def num_crashes_over_time(series_range, aggregation):
+            # All the machine type and version series are counted in the same
+            # pass over the crashes.
             latest_hou = HOUDINI_VERSIONS[0]
             previous_hou = HOUDINI_VERSIONS[1] 
              
-            return get_sql_data_for_report(
+            return get_sql_data(
                 """
                 select {% aggregated_date "c.date" aggregation %} AS mydate, 
-                      count(*) as total_records
-                from  houdini_stats_houdinicrash c, stats_main_machineconfig mc,
+                      """ + ",\n".join(
+                          "count(case when %s then 1 end)" % condition
+                          for condition in _get_crash_series_filters()) + """
+                from  houdini_stats_houdinicrash c,
                       houdini_stats_houdinimachineconfig AS hmc
-                where mc.id = c.stats_machine_config_id
-                      and mc.id = hmc.machine_config_id
-                      and """ + _get_hou_version_filter(latest) + """
+                where hmc.machine_config_id = c.stats_machine_config_id
+                      and (""" + _get_hou_version_filter(True) + """
+                           or """ + _get_hou_version_filter(False) + """)
                       and {% where_between "c.date" start_date end_date %}
-                      and """ + _get_ip_filter(external) + """
                 GROUP BY mydate
                 ORDER BY mydate  
                """ ,
                'stats', locals())
               
-        return time_series.merge_time_series(
-              [num_crashes_over_time(series_range, aggregation, external=True, 
-                                     latest=False),
-               num_crashes_over_time(series_range, aggregation, external=True, 
-                                     latest=True),
-               get_events_in_range(series_range, aggregation),
-               num_crashes_over_time(series_range, aggregation, external=False, 
-                                     latest=False),
-               num_crashes_over_time(series_range, aggregation, external=False, 
-                                     latest=True)
-               ])
-        
+        return _get_crash_series_with_events(
+            num_crashes_over_time, series_range, aggregation)
+
     def chart_columns(self, filter_values):
         return """
         {% col "string" "Date" %}
@@ -679,49 +828,65 @@ class NumOfMachinesSendingCrashesOverTime(HoudiniStatsReport):
     def title(self):
         return "Number of Individual Machines Sending Crashes Over Time"
 
+    def get_filters(self):
+        return (_get_counting_filter(self),)
+
+    @cached_report_data
     def get_data(self, series_range, aggregation, filter_values):
         
-        def num_machines_sending_crashes_over_time(series_range, aggregation, 
-                                                   external, latest):
-            ip_pattern1 = IP_PATTERNS[0] 
-            ip_pattern2 = IP_PATTERNS[1]
-              
+        @cached_closed_buckets("num_machines_sending_crashes_by_type")
+        def num_machines_sending_crashes_over_time(series_range, aggregation):
+            # All the machine type and version series are counted in the same
+            # pass over the crashes.
             latest_hou = HOUDINI_VERSIONS[0]
             previous_hou = HOUDINI_VERSIONS[1] 
              
-            return get_sql_data_for_report(
+            return get_sql_data(
             """
-            select {% aggregated_date "day" aggregation %} AS mydate, 
-                   sum(total_records)
-            from (
-                select c.stats_machine_config_id,
-                str_to_date(date_format(c.date, '%%Y-%%m-%%d'),'%%Y-%%m-%%d') as day,
-                count( DISTINCT c.stats_machine_config_id ) AS total_records
-                from houdini_stats_houdinicrash c, stats_main_machineconfig mc,
-                     houdini_stats_houdinimachineconfig AS hmc
-                where mc.id = c.stats_machine_config_id
-                      and mc.id = hmc.machine_config_id
-                      and """ + _get_hou_version_filter(latest) + """
-                      and {% where_between "c.date" start_date end_date %}
-                      and """ + _get_ip_filter(external) + """
-                      group by c.stats_machine_config_id
-            ) as TempTable
+            select {% aggregated_date "c.day" aggregation %} AS mydate, 
+                   """ + ",\n".join(
+                       "count(distinct case when %s "
+                       "then mc.machine_id end)" % condition
+                       for condition in _get_crash_series_filters()) + """
+            from houdini_stats_houdinicrash c,
+                 stats_main_machineconfig mc,
+                 houdini_stats_houdinimachineconfig AS hmc
+            where mc.id = c.stats_machine_config_id
+                  and hmc.machine_config_id = mc.id
+                  and (""" + _get_hou_version_filter(True) + """
+                       or """ + _get_hou_version_filter(False) + """)
+                  and {% where_between "c.day" start_date end_date %}
             group by mydate
             order by mydate
             """ ,
             'stats', locals())
               
-        return time_series.merge_time_series(
-              [num_machines_sending_crashes_over_time(series_range, aggregation, 
-                                                   external=True, latest=False),
-               num_machines_sending_crashes_over_time(series_range, aggregation, 
-                                                   external=True, latest=True),
-               get_events_in_range(series_range, aggregation),
-               num_machines_sending_crashes_over_time(series_range, aggregation, 
-                                                   external=False, latest=False),
-               num_machines_sending_crashes_over_time(series_range, aggregation, 
-                                                   external=False, latest=True)
-              ])
+        def approximate_num_machines_sending_crashes(series_range,
+                                                     aggregation):
+            latest_hou = int(HOUDINI_VERSIONS[0])
+            previous_hou = int(HOUDINI_VERSIONS[1])
+            
+            def get_series_key(is_internal, os_family, version):
+                if version == latest_hou:
+                    return (is_internal, True)
+                if version <= previous_hou:
+                    return (is_internal, False)
+                return None
+            
+            return _count_machines_by_date(
+                _get_machine_sketches(HoudiniMachineSketch.SENT_CRASH,
+                                      series_range, aggregation),
+                [(is_internal, latest) for is_internal in (False, True)
+                                       for latest in (False, True)],
+                get_series_key)
+        
+        if _is_approximate(filter_values):
+            return _get_crash_series_with_events(
+                approximate_num_machines_sending_crashes, series_range,
+                aggregation)
+        
+        return _get_crash_series_with_events(
+            num_machines_sending_crashes_over_time, series_range, aggregation)
 
     def chart_columns(self, filter_values):
         return """
@@ -758,49 +923,42 @@ class AvgNumCrashesFromSameMachine(HoudiniStatsReport):
     def title(self):
         return "Average Num of Crashes From the Same Machine"
 
+    @cached_report_data
     def get_data(self, series_range, aggregation, filter_values):
         
-        def avg_num_crashes_from_same_machine(series_range, aggregation, 
-                                              external, latest):
-            ip_pattern1 = IP_PATTERNS[0] 
-            ip_pattern2 = IP_PATTERNS[1]
-              
+        @cached_closed_buckets("avg_num_crashes_from_same_machine_by_type")
+        def avg_num_crashes_from_same_machine(series_range, aggregation):
+            # All the machine type and version series are averaged in the same
+            # pass over the crashes.
             latest_hou = HOUDINI_VERSIONS[0]
             previous_hou = HOUDINI_VERSIONS[1] 
             
-            return get_sql_data_for_report(
+            return get_sql_data(
             """
             select {% aggregated_date "day" aggregation %} AS mydate, 
-                   avg(total_records)
+                   """ + ",\n".join(
+                       "avg(case when %s then total_records end)" % condition
+                       for condition in _get_crash_series_filters(
+                           "TempTable")) + """
             from (
-                select c.stats_machine_config_id,
-                str_to_date(date_format(c.date, '%%Y-%%m-%%d'),'%%Y-%%m-%%d') as day,
+                select c.stats_machine_config_id, c.day, hmc.is_internal,
+                hmc.houdini_major_version,
                 count( c.stats_machine_config_id ) AS total_records
-                from houdini_stats_houdinicrash c, stats_main_machineconfig mc,
+                from houdini_stats_houdinicrash c,
                      houdini_stats_houdinimachineconfig AS hmc
-                where mc.id = c.stats_machine_config_id
-                      and mc.id = hmc.machine_config_id
-                      and """ + _get_hou_version_filter(latest) + """
-                      and {% where_between "c.date" start_date end_date %}
-                      and """ + _get_ip_filter(external) + """ 
-                      group by c.stats_machine_config_id, day
+                where hmc.machine_config_id = c.stats_machine_config_id
+                      and (""" + _get_hou_version_filter(True) + """
+                           or """ + _get_hou_version_filter(False) + """)
+                      and {% where_between "c.day" start_date end_date %}
+                      group by c.stats_machine_config_id, c.day
             ) as TempTable
             group by mydate
             order by mydate
             """ ,
             'stats', locals())
         
-        return time_series.merge_time_series(
-              [avg_num_crashes_from_same_machine(series_range, aggregation, 
-                                                 external=True, latest=False),
-               avg_num_crashes_from_same_machine(series_range, aggregation, 
-                                                 external=True, latest=True),
-               get_events_in_range(series_range, aggregation),
-               avg_num_crashes_from_same_machine(series_range, aggregation, 
-                                                 external=False, latest=False),
-               avg_num_crashes_from_same_machine(series_range, aggregation, 
-                                                 external=False, latest=True)
-              ])
+        return _get_crash_series_with_events(
+            avg_num_crashes_from_same_machine, series_range, aggregation)
 
     def chart_columns(self, filter_values):
         return """
@@ -854,8 +1012,9 @@ class CrashesByOS(HoudiniStatsReport):
             SELECT from_days( min( to_days( date ) ) ) as min_date, 
                    mc.operating_system AS os, count( * ) as count_by_os
             FROM houdini_stats_houdinicrash AS c, stats_main_machineconfig 
-                 as mc
+                 as mc, houdini_stats_houdinimachineconfig AS hmc
             WHERE c.stats_machine_config_id = mc.id 
+                  and mc.id = hmc.machine_config_id
                   and {% where_between "date" start_date end_date %}
                   and """ + _get_ip_filter(self.external_machines()) + """
             GROUP by os
@@ -863,23 +1022,36 @@ class CrashesByOS(HoudiniStatsReport):
             as TempTable
             ORDER by count_by_os desc
             """
+
+    def get_os_family_query(self):
+        
+        return """
+            SELECT hmc.os_family, count( * )
+            FROM houdini_stats_houdinicrash AS c, stats_main_machineconfig 
+                 as mc, houdini_stats_houdinimachineconfig AS hmc
+            WHERE c.stats_machine_config_id = mc.id 
+                  and mc.id = hmc.machine_config_id
+                  and {% where_between "date" start_date end_date %}
+                  and """ + _get_ip_filter(self.external_machines()) + """
+            GROUP by hmc.os_family
+            """
         
+    @cached_report_data
     def get_data(self, series_range, aggregation, filter_values):
         
-        ip_pattern1 = IP_PATTERNS[0] 
-        ip_pattern2 = IP_PATTERNS[1]
         
-        full_os_names_and_counts = get_sql_data_for_report(self.get_query(),
-             'stats', locals(), fill_zeros = False)
+        query_context = locals()
+        os_families_and_counts, full_os_names_and_counts = run_in_parallel(
+            lambda: get_sql_data(self.get_os_family_query(),
+                'stats', query_context, fill_zeros = False),
+            lambda: get_sql_data(self.get_query(),
+                'stats', query_context, fill_zeros = False))
         
         # Clean os names
         full_os_names_and_counts = _clean_os_names(full_os_names_and_counts)
         
-        # Apply transformation to the data
-        general_os_names_and_counts = _get_counts_by_os_trans(
-                                          full_os_names_and_counts)
-        
-        return [general_os_names_and_counts, full_os_names_and_counts]  
+        return [_get_counts_by_os_family(os_families_and_counts),
+                full_os_names_and_counts]  
         
     
     def chart_columns(self, filter_values):
@@ -942,26 +1114,28 @@ class CrashesByProduct(HoudiniStatsReport):
         
     def get_query(self):
         
+        # Count the crashes of each Houdini version first, then add up the
+        # versions of each product.
         return """
-            SELECT concat_ws( '-', hmc.product, hmc.is_apprentice), 
-            count( * ) as counts
-            FROM houdini_stats_houdinicrash AS c, 
-                 stats_main_machineconfig AS mc,
-                 houdini_stats_houdinimachineconfig AS hmc
-            WHERE c.stats_machine_config_id = mc.id
-                  AND mc.id = hmc.machine_config_id
-                  AND {% where_between "date" start_date end_date %}
-                  AND """ + _get_ip_filter(self.external_machines()) + """
-            GROUP BY hmc.product, hmc.is_apprentice
+            SELECT v.product, v.is_apprentice, sum(c.counts) as counts
+            FROM (SELECT hmc.houdini_version_id, count( * ) as counts
+                  FROM houdini_stats_houdinicrash AS c, 
+                       houdini_stats_houdinimachineconfig AS hmc
+                  WHERE c.stats_machine_config_id = hmc.machine_config_id
+                        AND {% where_between "date" start_date end_date %}
+                        AND """ + _get_ip_filter(self.external_machines()) + """
+                  GROUP BY hmc.houdini_version_id) AS c,
+                 houdini_stats_houdiniversion AS v
+            WHERE v.id = c.houdini_version_id
+            GROUP BY v.product, v.is_apprentice
             ORDER BY counts desc
         """    
         
+    @cached_report_data
     def get_data(self, series_range, aggregation, filter_values):
         
-        ip_pattern1 = IP_PATTERNS[0] 
-        ip_pattern2 = IP_PATTERNS[1]
         
-        crashes_by_product_list = get_sql_data_for_report(self.get_query(),
+        crashes_by_product_list = get_sql_data(self.get_query(),
                                          'stats', locals(), fill_zeros = False)
     
         return self._get_hou_crashes_by_product_trans(crashes_by_product_list) 
@@ -970,37 +1144,22 @@ class CrashesByProduct(HoudiniStatsReport):
         """
         This function does a data transformation.
         
-        Receiving a list in the form (example):
+        Receiving a list of (product, is_apprentice, count) tuples, for
+        example:
         
-        [(u'Houdini-0', 138L), 
-         (u'Hbatch-0', 2L), 
-         (u'Houdini-1', 2L),
-         (u'Hescape-0', 1L), 
-         (u'Mplay-0', 1L)]
+        [(u'Houdini', 0, 138L), 
+         (u'Hbatch', 0, 2L), 
+         (u'Houdini', 1, 2L)]
       
-        In the data, in the tuple, the first element represents the Houdini 
-        product name, the suffix '-0', or '0-1' is there to identify if the 
-        product is apprentice or not. The second element in the tuple is the 
-        counts of crashes registered in DB for this specific product.
-        
-        Return a list were the suffix '-1' will be substituted by 'Apprentice'
-        and the suffix '-0' will be eliminated, returning a list of the form: 
+        Return a list of (product name, count) tuples, where the name of
+        the Apprentice products ends with 'Apprentice':
         
         [(u'Houdini', 138L), 
          (u'Hbatch', 2L), 
-         (u'Houdini Apprentice', 2L),
-         (u'Hescape', 1L), 
-         (u'Mplay', 1L)]
+         (u'Houdini Apprentice', 2L)]
         """
-        import re
-        REPLACEMENTS = dict([('-1', ' Apprentice'), ('-0', '')])
-                         
-        def replacer(m):
-            return REPLACEMENTS[m.group(0)]
-    
-        r = re.compile('|'.join(REPLACEMENTS.keys()))
-        return [(r.sub(replacer, tup[0]), tup[1]) for tup in \
-                crashes_by_product_list]  
+        return [(product + (" Apprentice" if is_apprentice else ""), count)
+                for product, is_apprentice, count in crashes_by_product_list]
     
     def chart_columns(self, filter_values):
         return """
@@ -1050,59 +1209,50 @@ class PercentageOfSessionsEndingInCrash(HoudiniStatsReport):
     def title(self):
         return "Percentage of Sessions Ending in Crashes"
 
+    @cached_report_data
     def get_data(self, series_range, aggregation, filter_values):
         def percentage_of_crashes(sessions_without_crashes, crashes):
             if sessions_without_crashes == 0 and crashes == 0:
                 return 0
-            return 100 * crashes / float(crashes + sessions_without_crashes)
+            return 100 * float(crashes) / float(
+                crashes + sessions_without_crashes)
         
-        def total_num_sessions(series_range, aggregation, external):
-            ip_pattern1 = IP_PATTERNS[0] 
-            ip_pattern2 = IP_PATTERNS[1] 
+        # The sessions and crashes of external and internal machines are
+        # counted in the same pass.
+        @cached_closed_buckets("total_num_sessions_and_crashes_by_type")
+        def total_num_sessions_and_crashes(series_range, aggregation):
              
-            return get_sql_data_for_report(
+            return get_sql_data(
                 """
-                select {% aggregated_date "u.date" aggregation %} AS mydate, 
-                      count(*) as total_records
-                from houdini_stats_uptime u, stats_main_machineconfig mc
-                where mc.id = u.stats_machine_config_id 
-                      and {% where_between "u.date" start_date end_date %}
-                      and """ + _get_ip_filter(external) + """
+                select {% aggregated_date "a.day" aggregation %} AS mydate, 
+                      sum(case when """ + _get_ip_filter(True, "a") + """
+                               then a.num_sessions else 0 end),
+                      sum(case when """ + _get_ip_filter(True, "a") + """
+                               then a.num_crashes else 0 end),
+                      sum(case when """ + _get_ip_filter(False, "a") + """
+                               then a.num_sessions else 0 end),
+                      sum(case when """ + _get_ip_filter(False, "a") + """
+                               then a.num_crashes else 0 end)
+                from houdini_stats_houdinimachineactivitydaily a
+                where {% where_between "a.day" start_date end_date %}
                 GROUP BY mydate
                 ORDER BY mydate  
                """ ,
                'stats', locals())
         
-        def total_num_crashes_over_time(series_range, aggregation, external):
-            ip_pattern1 = IP_PATTERNS[0] 
-            ip_pattern2 = IP_PATTERNS[1]
- 
-            return get_sql_data_for_report(
-                """
-                select {% aggregated_date "c.date" aggregation %} AS mydate, 
-                      count(*) as total_records
-                from  houdini_stats_houdinicrash c, stats_main_machineconfig mc
-                where mc.id = c.stats_machine_config_id
-                      and {% where_between "c.date" start_date end_date %}
-                      and """ + _get_ip_filter(external) + """
-                GROUP BY mydate
-                ORDER BY mydate  
-               """,
-               'stats', locals())
+        (external_sessions, external_crashes, internal_sessions,
+         internal_crashes) = _split_series(
+            total_num_sessions_and_crashes(series_range, aggregation), 4)
         
         percentages_internal_machines = time_series.compute_time_series(
-                 [total_num_sessions(series_range, aggregation, external=False),
-                 total_num_crashes_over_time(series_range, aggregation,
-                 external=False)], percentage_of_crashes)
+                 [internal_sessions, internal_crashes], percentage_of_crashes)
         
         percentages_external_machines = time_series.compute_time_series(
-                  [total_num_sessions(series_range, aggregation, external=True),
-                  total_num_crashes_over_time(series_range, aggregation,
-                  external=True)], percentage_of_crashes) 
+                  [external_sessions, external_crashes], percentage_of_crashes) 
                 
         return time_series.merge_time_series([percentages_internal_machines, 
                                               percentages_external_machines])
-        
+
     def chart_columns(self, filter_values):
         return """
     {% col "string" "Date" %}"{{ val|date:date_format }}"{% endcol %}
@@ -1113,6 +1263,168 @@ class PercentageOfSessionsEndingInCrash(HoudiniStatsReport):
     def chart_options(self):
         return '"opt_count_with_legend"'  
             
+#===============================================================================
+# Houdini Crash Groups related reports
+
+def _get_crash_group_filters(report, num_groups_label, num_groups_options):
+    return (
+        DropdownFilter(report, "num_groups", num_groups_label,
+                       num_groups_options),
+        DropdownFilter(report, "ip_filter", "Type of Machines:",
+                       ["External Machines", "Internal Machines", "All"]),
+    )
+
+def _get_crash_group_ip_filter(filter_values, table="d"):
+    """
+    Get the condition selecting the rows of the daily crash group rollup (as
+    d, unless another table name is given) of the type of machines picked.
+    """
+    ip_filter = filter_values["ip_filter"]
+    if ip_filter == "All":
+        return "true"
+    return _get_ip_filter(ip_filter == "External Machines", table)
+
+#-------------------------------------------------------------------------------
+
+class TopCrashGroupsOverTime(HoudiniStatsReport):
+    """
+    Crashes over time of the crash groups with the most crashes in the
+    range. Line Chart.
+    """
+    def name(self):
+        return "top_crash_groups_over_time"
+
+    def title(self):
+        return "Top Crash Groups Over Time"
+
+    def get_filters(self):
+        return _get_crash_group_filters(
+            self, "Number of groups to show:", ["5", "10", "20"])
+
+    @cached_report_data
+    def get_data(self, series_range, aggregation, filter_values):
+        num_groups = int(filter_values["num_groups"])
+        ip_filter = _get_crash_group_ip_filter(filter_values)
+
+        # Both queries read the daily crash group rollup, which is kept up to
+        # date at ingest time, instead of the raw crashes.
+        top_groups = get_sql_data(
+            """
+            select d.group_id, sum(d.num_crashes) as group_crashes
+            from houdini_stats_houdinicrashgroupdaily d
+            where {% where_between "d.day" start_date end_date %}
+            and """ + ip_filter + """
+            group by d.group_id
+            order by group_crashes desc
+            limit {{ num_groups }}
+            """,
+            'stats', locals(), fill_zeros=False)
+
+        # Group ids are never 0, so missing groups are series of zeros and
+        # the chart always has the same columns.
+        group_ids = [int(row[0]) for row in top_groups]
+        group_ids += [0] * (num_groups - len(group_ids))
+
+        crashes_by_group = get_sql_data(
+            """
+            select {% aggregated_date "d.day" aggregation %} AS mydate,
+                   """ + ",\n".join(
+                       "sum(case when d.group_id = %d "
+                       "then d.num_crashes else 0 end)" % group_id
+                       for group_id in group_ids) + """
+            from houdini_stats_houdinicrashgroupdaily d
+            where {% where_between "d.day" start_date end_date %}
+            and """ + ip_filter + """
+            group by mydate
+            order by mydate
+            """,
+            'stats', locals())
+
+        return time_series.merge_time_series(
+            _split_series(crashes_by_group, num_groups))
+
+    def chart_columns(self, filter_values):
+        # The groups change with the range, so they are named by rank.
+        columns = [
+            '{% col "string" "Date" %}"{{ val|date:date_format }}"{% endcol %}']
+        for rank in range(1, int(filter_values["num_groups"]) + 1):
+            columns.append('{%% col "number" "Crash group #%d" %%}'
+                           '{{ val }}{%% endcol %%}' % rank)
+        return "\n".join(columns)
+
+    def chart_options(self):
+        return '"opt_count_with_legend"'
+
+#-------------------------------------------------------------------------------
+
+class RegressedCrashGroups(HoudiniStatsReport):
+    """
+    Crash groups with crashes in builds later than the build they were fixed
+    in, with the number of those crashes. Column Chart.
+    """
+    def name(self):
+        return "regressed_crash_groups"
+
+    def title(self):
+        return "Crash Groups Regressed After Their Fix"
+
+    def supports_aggregation(self):
+        return False
+
+    def get_filters(self):
+        return _get_crash_group_filters(
+            self, "Number of bars to show:", ["10", "20", "30", "Unlimited"])
+
+    @cached_report_data
+    def get_data(self, series_range, aggregation, filter_values):
+        # The crashes of each fixed group are counted per build in the daily
+        # crash group rollup, and the builds compared to the fixed build
+        # here, since it is stored as a string.
+        crashes_by_build = get_sql_data(
+            """
+            select d.group_id, g.fixed_in_houdini_build,
+                   v.houdini_major_version, v.houdini_minor_version,
+                   v.houdini_build_number, sum(d.num_crashes)
+            from houdini_stats_houdinicrashgroupdaily d,
+                 houdini_stats_houdinicrashgroup g,
+                 houdini_stats_houdiniversion v
+            where g.id = d.group_id
+            and v.id = d.houdini_version_id
+            and g.fixed_in_houdini_build != ''
+            and {% where_between "d.day" start_date end_date %}
+            and """ + _get_crash_group_ip_filter(filter_values) + """
+            group by d.group_id, g.fixed_in_houdini_build,
+                     v.houdini_major_version, v.houdini_minor_version,
+                     v.houdini_build_number
+            """,
+            'stats', locals(), fill_zeros=False)
+
+        regressed_crashes = defaultdict(int)
+        for (group_id, fixed_in_houdini_build, major_version, minor_version,
+                build_number, num_crashes) in crashes_by_build:
+            fixed_build = parse_houdini_build(fixed_in_houdini_build)
+            if (fixed_build is not None and
+                    (major_version, minor_version, build_number) > fixed_build):
+                regressed_crashes[(group_id, fixed_in_houdini_build)] += \
+                    int(num_crashes)
+
+        rows = sorted(
+            (("Group %s (fixed in %s)" % group_key, num_crashes)
+             for group_key, num_crashes in regressed_crashes.items()),
+            key=lambda row: row[1], reverse=True)
+        if filter_values["num_groups"] != "Unlimited":
+            rows = rows[:int(filter_values["num_groups"])]
+        return rows
+
+    def chart_columns(self, filter_values):
+        return """
+        {% col "string" "Crash group" %}"{{ val }}"{% endcol %}
+        {% col "number" "# of crashes after the fix" %}{{ val }}{% endcol %}
+       """
+
+    def chart_options(self):
+        return '"opt_count_wide_column"'
+
 #===============================================================================
 # Houdini Tools Usage related reports
 
@@ -1137,9 +1449,9 @@ class MostPopularTools(HoudiniStatsReport):
     
     def creation_mode(self):
         """
-        Where was the tool created: "(1,2,3)" -  shelf, viewer, network 
+        Where was the tool created: (1, 2, 3) -  shelf, viewer, network 
         """ 
-        return "(1,2,3)"
+        return (1, 2, 3)
 
     def get_filters(self):
         return (
@@ -1150,45 +1462,39 @@ class MostPopularTools(HoudiniStatsReport):
                 ["External Machines", "Internal Machines", "All"]),
         )
         
+    @cached_report_data
     def get_data(self, series_range, aggregation, filter_values):
         
-        ip_pattern1 = IP_PATTERNS[0] 
-        ip_pattern2 = IP_PATTERNS[1]
-        
         tool_usage_count = self.tool_usage_count()
         tool_creation_mode = self.creation_mode()
         
         # Set filter to control the num of bars to be shown
         limit_clause = ""
-        bars_to_show_num =  filter_values['num_bars_to_show']
-        if bars_to_show_num != "Unlimited":
+        if filter_values['num_bars_to_show'] != "Unlimited":
+            bars_to_show_num = int(filter_values['num_bars_to_show'])
             limit_clause = "limit {{ bars_to_show_num }}"
         
         # Set filter to control external or internal machines
         ip_filter = filter_values['ip_filter'] 
-        external = ""
+        internal_filter_clause = ""
         if ip_filter == "External Machines":
-            external = True
+            internal_filter_clause = " and is_internal = false"
         elif ip_filter == "Internal Machines":
-            external = False
-        ip_filter_clause = " and " + _get_ip_filter(external) if external!="" else ""
+            internal_filter_clause = " and is_internal = true"
         
+        # Read from the daily rollup, which is kept up to date at ingest time,
+        # instead of the raw tool usage rows.
         string_query = """
-            select tool_name, tool_count 
-               from (
-               select sum(count) as tool_count, tool_name, tool_creation_mode
-                from houdini_stats_houdinitoolusage, stats_main_machineconfig mc
-                where mc.id = houdini_stats_houdinitoolusage.stats_machine_config_id 
-                and {% where_between "date" start_date end_date %} """ + \
-                ip_filter_clause  + """
-                group by tool_name 
-                order by tool_count
-           ) as TempTable
-           where tool_count >=  {{ tool_usage_count }} and 
-           tool_creation_mode in {{ tool_creation_mode }} 
-           order by tool_count desc """ + limit_clause 
+            select tool_name, sum(count) as tool_count
+            from houdini_stats_houdinitoolusagedaily
+            where {% where_between "day" start_date end_date %}
+            and tool_creation_mode in {{ tool_creation_mode }} """ + \
+            internal_filter_clause + """
+            group by tool_name
+            having tool_count >= {{ tool_usage_count }}
+            order by tool_count desc """ + limit_clause 
                    
-        return get_sql_data_for_report(string_query, 'stats', locals(), 
+        return get_sql_data(string_query, 'stats', locals(), 
                    fill_zeros=False)
     
     def chart_columns(self, filter_values):
@@ -1214,9 +1520,9 @@ class MostPopularToolsShelf(MostPopularTools):
     
     def creation_mode(self):
         """
-        Where was the tool created: "(1)" -  shelf 
+        Where was the tool created: (1,) -  shelf 
         """ 
-        return "(1)"
+        return (1,)
 
     def chart_options(self):
         return '"opt_count_wide_columnGreen"'
@@ -1238,9 +1544,9 @@ class MostPopularToolsViewer(MostPopularTools):
     
     def creation_mode(self):
         """
-        Where was the tool created: "(2)" -  viewer 
+        Where was the tool created: (2,) -  viewer 
         """ 
-        return "(2)"
+        return (2,)
 
     def chart_options(self):
         return '"opt_count_wide_columnYellow"'    
@@ -1262,9 +1568,9 @@ class MostPopularToolsNetwork(MostPopularTools):
     
     def creation_mode(self):
         """
-        Where was the tool created: "(3)" -  network 
+        Where was the tool created: (3,) -  network 
         """ 
-        return "(3)"
+        return (3,)
 
     def chart_options(self):
         return '"opt_count_wide_columnPurple"' 
@@ -1294,44 +1600,55 @@ class VersionsAndBuilds(HoudiniStatsReport):
     def show_just_apprentice(self):
         return "" 
     
+    @cached_report_data
     def get_data(self, series_range, aggregation, filter_values):
         
-        houdini_version_and_counts = get_sql_data_for_report(
-            """
-            SELECT count( * ) AS counts, 
-            CONCAT( 'Houdini ', hmc.houdini_major_version, ".", 
-                  hmc.houdini_minor_version ) 
+        # Count the machine configs of each Houdini version first, then add
+        # up the versions of each major.minor version or build.
+        configs_by_version = """
+            (SELECT hmc.houdini_version_id, count( * ) AS counts
+             FROM stats_main_machineconfig mc, 
+                  houdini_stats_houdinimachineconfig AS hmc
+             WHERE mc.id = hmc.machine_config_id
+             AND {% where_between "mc.creation_date" start_date end_date %}
+             GROUP BY hmc.houdini_version_id) AS c,
+            houdini_stats_houdiniversion AS v
+            WHERE v.id = c.houdini_version_id
+            AND v.houdini_major_version !=0 
+            AND v.product != ""
+            """ + self.show_just_apprentice()
+
+        versions_query = """
+            SELECT sum(c.counts) AS counts, 
+            CONCAT( 'Houdini ', v.houdini_major_version, ".", 
+                  v.houdini_minor_version ) 
                   AS houdini_version
-            FROM stats_main_machineconfig mc, 
-                 houdini_stats_houdinimachineconfig AS hmc
-                 WHERE mc.id = hmc.machine_config_id
-                 AND hmc.houdini_major_version !=0 
-                 AND hmc.product != ""
-                 AND {% where_between "mc.creation_date" start_date end_date %}
-                 """ + self.show_just_apprentice() + """
-            GROUP BY hmc.houdini_major_version, hmc.houdini_minor_version
-            ORDER BY houdini_version desc;
-            """,
-            'stats', locals(), fill_zeros = False)
-        
-        houdini_builds_and_counts = get_sql_data_for_report(
+            FROM """ + configs_by_version + """
+            GROUP BY v.houdini_major_version, v.houdini_minor_version
+            ORDER BY v.houdini_major_version desc,
+                     v.houdini_minor_version desc;
             """
-            SELECT count( * ) AS counts, 
-            CONCAT(hmc.houdini_major_version, ".", hmc.houdini_minor_version, 
-                  ".", hmc.houdini_build_number) 
+        
+        builds_query = """
+            SELECT sum(c.counts) AS counts, 
+            CONCAT(v.houdini_major_version, ".", v.houdini_minor_version, 
+                  ".", v.houdini_build_number) 
                   AS houdini_version_build 
-            FROM stats_main_machineconfig mc, 
-                 houdini_stats_houdinimachineconfig AS hmc
-                 WHERE mc.id = hmc.machine_config_id
-                 AND hmc.houdini_major_version !=0 
-                 AND hmc.product != ""
-                 AND {% where_between "mc.creation_date" start_date end_date %}
-                 """ + self.show_just_apprentice() + """
-            GROUP BY hmc.houdini_major_version, hmc.houdini_minor_version,
-            hmc.houdini_build_number
-            ORDER BY houdini_version_build desc;
-            """,
-            'stats', locals(), fill_zeros = False) 
+            FROM """ + configs_by_version + """
+            GROUP BY v.houdini_major_version, v.houdini_minor_version,
+            v.houdini_build_number
+            ORDER BY v.houdini_major_version desc,
+                     v.houdini_minor_version desc,
+                     v.houdini_build_number desc;
+            """
+        
+        query_context = locals()
+        houdini_version_and_counts, houdini_builds_and_counts = \
+            run_in_parallel(
+                lambda: get_sql_data(versions_query, 'stats', 
+                    query_context, fill_zeros = False),
+                lambda: get_sql_data(builds_query, 'stats', 
+                    query_context, fill_zeros = False))
         
         return [self._return_product_counts_list(houdini_version_and_counts),
                 self._return_product_counts_list(houdini_builds_and_counts)] 
@@ -1374,7 +1691,7 @@ class VersionsAndBuildsApprentice(VersionsAndBuilds):
         return "Houdini Apprentice Versions and Builds"
     
     def show_just_apprentice(self):
-        return "AND hmc.is_apprentice=true" 
+        return "AND v.is_apprentice=true" 
     
     def chart_leyend_text(self):
         return "Houdini Apprentice"
@@ -1392,7 +1709,7 @@ class VersionsAndBuildsCommercial(VersionsAndBuilds):
         return "Houdini Commercial Versions and Builds"
     
     def show_just_apprentice(self):
-        return "AND hmc.is_apprentice=false" 
+        return "AND v.is_apprentice=false" 
     
     def chart_leyend_text(self):
         return "Houdini FX"    
@@ -0,0 +1,663 @@
+"""
+Rollup tables maintained from the raw Houdini fact rows.
+
+Each rollup has an incremental update, called by the ingestion code with the
+rows of one upload, and a rebuild that recomputes it from the raw tables.
+"""
+import datetime
+from collections import defaultdict
+
+import django.db
+
+from houdini_stats.hyperloglog import HyperLogLog
+from houdini_stats.models import HoudiniMachineSketch
+
+try:
+    from django.db.transaction import atomic
+except ImportError:
+    from django.db.transaction import commit_on_success as atomic
+
+#-------------------------------------------------------------------------------
+
+def _date_chunks(start_date, end_date, chunk_days):
+    """
+    Split [start_date, end_date) into consecutive [start, end) ranges of
+    chunk_days days.
+    """
+    chunk_start = start_date
+    while chunk_start < end_date:
+        chunk_end = min(chunk_start + datetime.timedelta(days=chunk_days),
+                        end_date)
+        yield chunk_start, chunk_end
+        chunk_start = chunk_end
+
+def _to_midnight(date):
+    return datetime.datetime(date.year, date.month, date.day)
+
+#===============================================================================
+# Daily tool usage
+
+def update_tool_usage_daily(tool_usages, is_internal, using="stats"):
+    """
+    Add the counts of the given (just saved) HoudiniToolUsage rows to the
+    daily tool usage rollup.
+    """
+    counts = defaultdict(int)
+    for tool_usage in tool_usages:
+        counts[(tool_usage.date.date(), tool_usage.tool_name,
+                tool_usage.tool_creation_mode)] += tool_usage.count
+
+    if len(counts) == 0:
+        return
+
+    cursor = django.db.connections[using].cursor()
+    cursor.executemany("""
+        insert into houdini_stats_houdinitoolusagedaily
+            (day, tool_name, tool_creation_mode, is_internal, count)
+        values (%s, %s, %s, %s, %s)
+        on duplicate key update count = count + values(count)
+        """,
+        [(day, tool_name, tool_creation_mode, is_internal, count)
+         for (day, tool_name, tool_creation_mode), count in counts.items()])
+
+def rebuild_tool_usage_daily(from_date=None, chunk_days=7, using="stats",
+                             progress=None):
+    """
+    Recompute the daily tool usage rollup from the raw tool usage rows, from
+    the given day on (or from the very beginning), chunk_days at a time.
+
+    Uploads ingested while the rebuild runs can be counted twice, so run it
+    while ingestion is paused.
+    """
+    cursor = django.db.connections[using].cursor()
+    cursor.execute("""
+        select min(date), max(date) from houdini_stats_houdinitoolusage""")
+    min_date, max_date = cursor.fetchone()
+    if min_date is None:
+        return
+
+    start_date = _to_midnight(from_date or min_date)
+    end_date = _to_midnight(max_date) + datetime.timedelta(days=1)
+
+    for chunk_start, chunk_end in _date_chunks(
+            start_date, end_date, chunk_days):
+        # Each chunk is replaced in one transaction, so a failed rebuild
+        # leaves the days it didn't get to as they were.
+        with atomic(using=using):
+            cursor.execute("""
+                delete from houdini_stats_houdinitoolusagedaily
+                where day >= %s and day < %s
+                """, [chunk_start.date(), chunk_end.date()])
+            cursor.execute("""
+                insert into houdini_stats_houdinitoolusagedaily
+                    (day, tool_name, tool_creation_mode, is_internal, count)
+                select date(tu.date) as day, tu.tool_name,
+                       tu.tool_creation_mode, hmc.is_internal, sum(tu.count)
+                from houdini_stats_houdinitoolusage tu,
+                     houdini_stats_houdinimachineconfig hmc
+                where hmc.machine_config_id = tu.stats_machine_config_id
+                and tu.date >= %s and tu.date < %s
+                group by day, tu.tool_name, tu.tool_creation_mode,
+                         hmc.is_internal
+                """, [chunk_start, chunk_end])
+
+        if progress is not None:
+            progress(chunk_start, chunk_end)
+
+#===============================================================================
+# Daily machine activity
+
+def update_machine_activity_daily(uptimes, crashes, machine_id, is_internal,
+                                  houdini_version_id, using="stats"):
+    """
+    Add the given (just saved) Uptime and HoudiniCrash rows, all sent by the
+    same machine, to the daily machine activity rollup.
+    """
+    # Maps each day to [sessions, seconds, idle time, crashes].
+    activity = defaultdict(lambda: [0, 0, 0, 0])
+    for uptime in uptimes:
+        day_activity = activity[uptime.date.date()]
+        day_activity[0] += 1
+        day_activity[1] += uptime.number_of_seconds
+        day_activity[2] += uptime.idle_time
+    for crash in crashes:
+        activity[crash.date.date()][3] += 1
+
+    if len(activity) == 0:
+        return
+
+    cursor = django.db.connections[using].cursor()
+    cursor.executemany("""
+        insert into houdini_stats_houdinimachineactivitydaily
+            (day, machine_id, is_internal, houdini_version_id, num_sessions,
+             total_seconds, total_idle_time, num_crashes)
+        values (%s, %s, %s, %s, %s, %s, %s, %s)
+        on duplicate key update
+            num_sessions = num_sessions + values(num_sessions),
+            total_seconds = total_seconds + values(total_seconds),
+            total_idle_time = total_idle_time + values(total_idle_time),
+            num_crashes = num_crashes + values(num_crashes)
+        """,
+        [(day, machine_id, is_internal, houdini_version_id) +
+         tuple(day_activity)
+         for day, day_activity in activity.items()])
+
+def rebuild_machine_activity_daily(from_date=None, chunk_days=7,
+                                   using="stats", progress=None):
+    """
+    Recompute the daily machine activity rollup from the raw uptime and crash
+    rows, from the given day on (or from the very beginning), chunk_days at a
+    time. Machine configs without a Houdini version are left out, like in the
+    crash group rollups.
+
+    Uploads ingested while the rebuild runs can be counted twice, so run it
+    while ingestion is paused.
+    """
+    cursor = django.db.connections[using].cursor()
+    date_ranges = []
+    for table in ("houdini_stats_uptime", "houdini_stats_houdinicrash"):
+        cursor.execute("select min(date), max(date) from %s" % table)
+        min_date, max_date = cursor.fetchone()
+        if min_date is not None:
+            date_ranges.append((min_date, max_date))
+    if len(date_ranges) == 0:
+        return
+
+    min_date = min(date_range[0] for date_range in date_ranges)
+    max_date = max(date_range[1] for date_range in date_ranges)
+
+    start_date = _to_midnight(from_date or min_date)
+    end_date = _to_midnight(max_date) + datetime.timedelta(days=1)
+
+    for chunk_start, chunk_end in _date_chunks(
+            start_date, end_date, chunk_days):
+        chunk_range = [chunk_start.date(), chunk_end.date()]
+        # Each chunk is replaced in one transaction, so a failed rebuild
+        # leaves the days it didn't get to as they were.
+        with atomic(using=using):
+            cursor.execute("""
+                delete from houdini_stats_houdinimachineactivitydaily
+                where day >= %s and day < %s""", chunk_range)
+            cursor.execute("""
+                insert into houdini_stats_houdinimachineactivitydaily
+                    (day, machine_id, is_internal, houdini_version_id,
+                     num_sessions, total_seconds, total_idle_time,
+                     num_crashes)
+                select day, machine_id, is_internal, houdini_version_id,
+                       sum(num_sessions), sum(total_seconds),
+                       sum(total_idle_time), sum(num_crashes)
+                from (
+                    select u.day, mc.machine_id, hmc.is_internal,
+                           hmc.houdini_version_id,
+                           count(*) as num_sessions,
+                           sum(u.number_of_seconds) as total_seconds,
+                           sum(u.idle_time) as total_idle_time,
+                           0 as num_crashes
+                    from houdini_stats_uptime u, stats_main_machineconfig mc,
+                         houdini_stats_houdinimachineconfig hmc
+                    where mc.id = u.stats_machine_config_id
+                    and hmc.machine_config_id = mc.id
+                    and hmc.houdini_version_id is not null
+                    and u.day >= %s and u.day < %s
+                    group by u.day, mc.machine_id, hmc.is_internal,
+                             hmc.houdini_version_id
+                    union all
+                    select c.day, mc.machine_id, hmc.is_internal,
+                           hmc.houdini_version_id,
+                           0, 0, 0, count(*)
+                    from houdini_stats_houdinicrash c,
+                         stats_main_machineconfig mc,
+                         houdini_stats_houdinimachineconfig hmc
+                    where mc.id = c.stats_machine_config_id
+                    and hmc.machine_config_id = mc.id
+                    and hmc.houdini_version_id is not null
+                    and c.day >= %s and c.day < %s
+                    group by c.day, mc.machine_id, hmc.is_internal,
+                             hmc.houdini_version_id
+                ) as activity
+                group by day, machine_id, is_internal, houdini_version_id
+                """, chunk_range + chunk_range)
+
+        if progress is not None:
+            progress(chunk_start, chunk_end)
+
+#===============================================================================
+# First seen machines
+
+def update_machine_first_seen(machine_id, config_creation_date, is_internal,
+                              using="stats"):
+    """
+    Record that a machine sent a config created on the given date. The
+    earliest config of each machine is kept, along with whether it was
+    internal.
+    """
+    cursor = django.db.connections[using].cursor()
+    # MySQL assigns the columns from left to right, so is_internal is
+    # compared to the first_seen value before it is updated.
+    cursor.execute("""
+        insert into houdini_stats_houdinimachinefirstseen
+            (machine_id, first_seen, is_internal)
+        values (%s, %s, %s)
+        on duplicate key update
+            is_internal = if(values(first_seen) < first_seen,
+                             values(is_internal), is_internal),
+            first_seen = least(first_seen, values(first_seen))
+        """, [machine_id, config_creation_date, is_internal])
+
+#===============================================================================
+# Daily sketches of the active machines
+
+def update_machine_sketches(uptimes, crashes, machine_id, is_internal,
+                            os_family, houdini_major_version, using="stats"):
+    """
+    Add the machine that sent the given Uptime and HoudiniCrash rows to the
+    sketches of the days they were sent on.
+
+    Call it after the upload is committed: each sketch is locked in its own
+    short transaction, and only when the machine isn't in it yet, so
+    concurrent uploads don't wait on each other's ingest transactions.
+    """
+    days_by_kind = (
+        (HoudiniMachineSketch.SENT_UPTIME,
+         set(uptime.date.date() for uptime in uptimes)),
+        (HoudiniMachineSketch.SENT_CRASH,
+         set(crash.date.date() for crash in crashes)),
+    )
+
+    cursor = django.db.connections[using].cursor()
+    for kind, days in days_by_kind:
+        for day in sorted(days):
+            segment = dict(day=day, kind=kind, is_internal=is_internal,
+                           os_family=os_family,
+                           houdini_major_version=houdini_major_version)
+
+            # Most uploads come from machines already in the sketch, which
+            # are found without locking it.
+            rows = list(HoudiniMachineSketch.objects.using(using)
+                        .filter(**segment).values_list("sketch", flat=True))
+            if len(rows) != 0 and \
+                    not HyperLogLog.from_string(rows[0]).add(machine_id):
+                continue
+
+            with atomic(using=using):
+                # Create the sketch if needed and lock it, so concurrent
+                # uploads don't overwrite each other's machines.
+                cursor.execute("""
+                    insert ignore into houdini_stats_houdinimachinesketch
+                        (day, kind, is_internal, os_family,
+                         houdini_major_version, sketch)
+                    values (%s, %s, %s, %s, %s, '')
+                    """, [day, kind, is_internal, os_family,
+                          houdini_major_version])
+                row = HoudiniMachineSketch.objects.using(using) \
+                    .select_for_update().get(**segment)
+
+                sketch = HyperLogLog.from_string(row.sketch)
+                if sketch.add(machine_id):
+                    HoudiniMachineSketch.objects.using(using).filter(
+                        pk=row.pk).update(sketch=sketch.to_string())
+
+def rebuild_machine_sketches(from_date=None, chunk_days=7, using="stats",
+                             progress=None):
+    """
+    Recompute the daily machine sketches from the raw uptime and crash rows,
+    from the given day on (or from the very beginning), chunk_days at a time.
+    Only the sketches of one chunk are kept in memory.
+
+    Uploads ingested while the rebuild runs can be lost, so run it while
+    ingestion is paused.
+    """
+    tables_by_kind = (
+        (HoudiniMachineSketch.SENT_UPTIME, "houdini_stats_uptime"),
+        (HoudiniMachineSketch.SENT_CRASH, "houdini_stats_houdinicrash"),
+    )
+
+    cursor = django.db.connections[using].cursor()
+    date_ranges = []
+    for kind, table in tables_by_kind:
+        cursor.execute("select min(date), max(date) from %s" % table)
+        min_date, max_date = cursor.fetchone()
+        if min_date is not None:
+            date_ranges.append((min_date, max_date))
+    if len(date_ranges) == 0:
+        return
+
+    start_date = _to_midnight(
+        from_date or min(date_range[0] for date_range in date_ranges))
+    end_date = _to_midnight(max(date_range[1] for date_range in date_ranges)) \
+        + datetime.timedelta(days=1)
+
+    for chunk_start, chunk_end in _date_chunks(
+            start_date, end_date, chunk_days):
+        sketches = defaultdict(HyperLogLog)
+        for kind, table in tables_by_kind:
+            cursor.execute("""
+                select distinct t.day, mc.machine_id, hmc.is_internal,
+                       hmc.os_family, hmc.houdini_major_version
+                from """ + table + """ t, stats_main_machineconfig mc,
+                     houdini_stats_houdinimachineconfig hmc
+                where mc.id = t.stats_machine_config_id
+                and hmc.machine_config_id = mc.id
+                and t.day >= %s and t.day < %s
+                """, [chunk_start.date(), chunk_end.date()])
+
+            while True:
+                rows = cursor.fetchmany(1000)
+                if len(rows) == 0:
+                    break
+                for (day, machine_id, is_internal, os_family,
+                        houdini_major_version) in rows:
+                    sketches[(day, kind, bool(is_internal), os_family,
+                              houdini_major_version)].add(machine_id)
+
+        with atomic(using=using):
+            cursor.execute("""
+                delete from houdini_stats_houdinimachinesketch
+                where day >= %s and day < %s
+                """, [chunk_start.date(), chunk_end.date()])
+            if len(sketches) != 0:
+                cursor.executemany("""
+                    insert into houdini_stats_houdinimachinesketch
+                        (day, kind, is_internal, os_family,
+                         houdini_major_version, sketch)
+                    values (%s, %s, %s, %s, %s, %s)
+                    """,
+                    [segment + (sketch.to_string(),)
+                     for segment, sketch in sketches.items()])
+
+        if progress is not None:
+            progress(chunk_start, chunk_end)
+
+#===============================================================================
+# Crash group statistics
+
+def _update_latest_houdini_version(cursor, group_ids, houdini_version_id):
+    """
+    Set the latest Houdini version of the given groups to the given one,
+    unless they have already seen a later build.
+    """
+    cursor.execute("""
+        update houdini_stats_houdinicrashgroup g
+        join houdini_stats_houdiniversion v on v.id = %s
+        left join houdini_stats_houdiniversion latest
+            on latest.id = g.latest_houdini_version_id
+        set g.latest_houdini_version_id = v.id
+        where g.id in (""" + ", ".join(["%s"] * len(group_ids)) + """)
+        and (latest.id is null or
+             (v.houdini_major_version, v.houdini_minor_version,
+              v.houdini_build_number) >
+             (latest.houdini_major_version, latest.houdini_minor_version,
+              latest.houdini_build_number))
+        """, [houdini_version_id] + list(group_ids))
+
+def update_crash_group_stats(crashes, machine_id, houdini_version_id,
+                             using="stats"):
+    """
+    Add the given (just saved) HoudiniCrash rows, all sent by the same
+    machine, to the statistics of their crash groups.
+    """
+    # Maps each group to [crashes, first seen, last seen].
+    stats = {}
+    for crash in crashes:
+        if crash.group_id is None:
+            continue
+        group_stats = stats.get(crash.group_id)
+        if group_stats is None:
+            stats[crash.group_id] = [1, crash.date, crash.date]
+        else:
+            group_stats[0] += 1
+            group_stats[1] = min(group_stats[1], crash.date)
+            group_stats[2] = max(group_stats[2], crash.date)
+
+    if len(stats) == 0:
+        return
+
+    cursor = django.db.connections[using].cursor()
+    for group_id in sorted(stats):
+        num_crashes, first_seen, last_seen = stats[group_id]
+        # Most crashes come from machines already counted in their group.
+        cursor.execute("""
+            insert ignore into houdini_stats_houdinicrashgroupmachine
+                (group_id, machine_id)
+            values (%s, %s)""", [group_id, machine_id])
+        num_new_machines = cursor.rowcount
+        cursor.execute("""
+            update houdini_stats_houdinicrashgroup
+            set num_crashes = num_crashes + %s,
+                num_machines = num_machines + %s,
+                first_seen = least(coalesce(first_seen, %s), %s),
+                last_seen = greatest(coalesce(last_seen, %s), %s)
+            where id = %s""",
+            [num_crashes, num_new_machines, first_seen, first_seen,
+             last_seen, last_seen, group_id])
+
+    _update_latest_houdini_version(cursor, sorted(stats), houdini_version_id)
+
+def merge_crash_group_stats(cursor, group_id, into_group_id):
+    """
+    Add the statistics of a crash group to the group it is merged into, and
+    reset its own, since its crashes are moved too.
+    """
+    cursor.execute("""
+        insert ignore into houdini_stats_houdinicrashgroupmachine
+            (group_id, machine_id)
+        select %s, machine_id
+        from houdini_stats_houdinicrashgroupmachine
+        where group_id = %s""", [into_group_id, group_id])
+    cursor.execute("""
+        delete from houdini_stats_houdinicrashgroupmachine
+        where group_id = %s""", [group_id])
+
+    cursor.execute("""
+        update houdini_stats_houdinicrashgroup g,
+               houdini_stats_houdinicrashgroup merged
+        set g.num_crashes = g.num_crashes + merged.num_crashes,
+            g.num_machines = (
+                select count(*) from houdini_stats_houdinicrashgroupmachine
+                where group_id = g.id),
+            g.first_seen = least(coalesce(g.first_seen, merged.first_seen),
+                                 coalesce(merged.first_seen, g.first_seen)),
+            g.last_seen = greatest(coalesce(g.last_seen, merged.last_seen),
+                                   coalesce(merged.last_seen, g.last_seen))
+        where g.id = %s and merged.id = %s""", [into_group_id, group_id])
+
+    cursor.execute("""
+        select latest_houdini_version_id
+        from houdini_stats_houdinicrashgroup
+        where id = %s""", [group_id])
+    houdini_version_id = cursor.fetchone()[0]
+    if houdini_version_id is not None:
+        _update_latest_houdini_version(
+            cursor, [into_group_id], houdini_version_id)
+
+    cursor.execute("""
+        update houdini_stats_houdinicrashgroup
+        set num_crashes = 0, num_machines = 0, first_seen = null,
+            last_seen = null, latest_houdini_version_id = null
+        where id = %s""", [group_id])
+
+def rebuild_crash_group_stats(chunk_size=1000, using="stats",
+                              progress=None):
+    """
+    Recompute the statistics of every crash group from the raw crash rows,
+    chunk_size groups at a time, in id order. progress(last group id) is
+    called after every chunk.
+
+    Uploads ingested while the rebuild runs can be counted twice, so run it
+    while ingestion is paused.
+    """
+    cursor = django.db.connections[using].cursor()
+    with atomic(using=using):
+        cursor.execute("delete from houdini_stats_houdinicrashgroupmachine")
+
+    last_id = 0
+    while True:
+        cursor.execute("""
+            select id from houdini_stats_houdinicrashgroup
+            where id > %s
+            order by id
+            limit %s""", [last_id, chunk_size])
+        group_ids = [row[0] for row in cursor.fetchall()]
+        if len(group_ids) == 0:
+            break
+        group_range = [group_ids[0], group_ids[-1]]
+
+        with atomic(using=using):
+            cursor.execute("""
+                insert ignore into houdini_stats_houdinicrashgroupmachine
+                    (group_id, machine_id)
+                select distinct c.group_id, mc.machine_id
+                from houdini_stats_houdinicrash c, stats_main_machineconfig mc
+                where mc.id = c.stats_machine_config_id
+                and c.group_id >= %s and c.group_id <= %s
+                """, group_range)
+
+            cursor.execute("""
+                update houdini_stats_houdinicrashgroup g
+                left join (
+                    select group_id, count(*) as num_crashes,
+                           min(date) as first_seen, max(date) as last_seen
+                    from houdini_stats_houdinicrash
+                    where group_id >= %s and group_id <= %s
+                    group by group_id
+                ) as c on c.group_id = g.id
+                left join (
+                    select group_id, count(*) as num_machines
+                    from houdini_stats_houdinicrashgroupmachine
+                    where group_id >= %s and group_id <= %s
+                    group by group_id
+                ) as m on m.group_id = g.id
+                set g.num_crashes = coalesce(c.num_crashes, 0),
+                    g.num_machines = coalesce(m.num_machines, 0),
+                    g.first_seen = c.first_seen,
+                    g.last_seen = c.last_seen,
+                    g.latest_houdini_version_id = null
+                where g.id >= %s and g.id <= %s
+                """, group_range * 3)
+
+            # The latest build of each group, compared on the version keys
+            # instead of in SQL, which has no group-wise maximum.
+            cursor.execute("""
+                select id, houdini_major_version, houdini_minor_version,
+                       houdini_build_number
+                from houdini_stats_houdiniversion""")
+            version_keys = dict((row[0], row[1:]) for row in cursor.fetchall())
+            cursor.execute("""
+                select distinct c.group_id, hmc.houdini_version_id
+                from houdini_stats_houdinicrash c,
+                     houdini_stats_houdinimachineconfig hmc
+                where hmc.machine_config_id = c.stats_machine_config_id
+                and hmc.houdini_version_id is not null
+                and c.group_id >= %s and c.group_id <= %s
+                """, group_range)
+            latest_versions = {}
+            for group_id, houdini_version_id in cursor.fetchall():
+                latest_version_id = latest_versions.get(group_id)
+                if (latest_version_id is None or
+                        version_keys[houdini_version_id] >
+                        version_keys[latest_version_id]):
+                    latest_versions[group_id] = houdini_version_id
+            if len(latest_versions) != 0:
+                cursor.executemany("""
+                    update houdini_stats_houdinicrashgroup
+                    set latest_houdini_version_id = %s
+                    where id = %s""",
+                    [(houdini_version_id, group_id) for group_id,
+                     houdini_version_id in latest_versions.items()])
+
+        last_id = group_ids[-1]
+        if progress is not None:
+            progress(last_id)
+
+#===============================================================================
+# Daily crash groups
+
+def update_crash_group_daily(crashes, is_internal, houdini_version_id,
+                             using="stats"):
+    """
+    Add the counts of the given (just saved) HoudiniCrash rows, all sent by
+    the same machine, to the daily crash group rollup.
+    """
+    counts = defaultdict(int)
+    for crash in crashes:
+        if crash.group_id is not None:
+            counts[(crash.date.date(), crash.group_id)] += 1
+
+    if len(counts) == 0:
+        return
+
+    cursor = django.db.connections[using].cursor()
+    cursor.executemany("""
+        insert into houdini_stats_houdinicrashgroupdaily
+            (day, group_id, is_internal, houdini_version_id, num_crashes)
+        values (%s, %s, %s, %s, %s)
+        on duplicate key update num_crashes = num_crashes + values(num_crashes)
+        """,
+        [(day, group_id, is_internal, houdini_version_id, count)
+         for (day, group_id), count in counts.items()])
+
+def merge_crash_group_daily(cursor, group_id, into_group_id):
+    """
+    Move the daily rollup rows of a crash group to the group it is merged
+    into.
+    """
+    cursor.execute("""
+        insert into houdini_stats_houdinicrashgroupdaily
+            (day, group_id, is_internal, houdini_version_id, num_crashes)
+        select day, %s, is_internal, houdini_version_id, num_crashes
+        from houdini_stats_houdinicrashgroupdaily merged
+        where merged.group_id = %s
+        on duplicate key update
+            num_crashes = houdini_stats_houdinicrashgroupdaily.num_crashes +
+                          values(num_crashes)
+        """, [into_group_id, group_id])
+    cursor.execute("""
+        delete from houdini_stats_houdinicrashgroupdaily
+        where group_id = %s""", [group_id])
+
+def rebuild_crash_group_daily(from_date=None, chunk_days=7, using="stats",
+                              progress=None):
+    """
+    Recompute the daily crash group rollup from the raw crash rows, from the
+    given day on (or from the very beginning), chunk_days at a time.
+
+    Uploads ingested while the rebuild runs can be counted twice, so run it
+    while ingestion is paused.
+    """
+    cursor = django.db.connections[using].cursor()
+    cursor.execute("""
+        select min(date), max(date) from houdini_stats_houdinicrash""")
+    min_date, max_date = cursor.fetchone()
+    if min_date is None:
+        return
+
+    start_date = _to_midnight(from_date or min_date)
+    end_date = _to_midnight(max_date) + datetime.timedelta(days=1)
+
+    for chunk_start, chunk_end in _date_chunks(
+            start_date, end_date, chunk_days):
+        # Each chunk is replaced in one transaction, so a failed rebuild
+        # leaves the days it didn't get to as they were.
+        with atomic(using=using):
+            cursor.execute("""
+                delete from houdini_stats_houdinicrashgroupdaily
+                where day >= %s and day < %s
+                """, [chunk_start.date(), chunk_end.date()])
+            cursor.execute("""
+                insert into houdini_stats_houdinicrashgroupdaily
+                    (day, group_id, is_internal, houdini_version_id,
+                     num_crashes)
+                select c.day, c.group_id, hmc.is_internal,
+                       hmc.houdini_version_id, count(*)
+                from houdini_stats_houdinicrash c,
+                     houdini_stats_houdinimachineconfig hmc
+                where hmc.machine_config_id = c.stats_machine_config_id
+                and c.group_id is not null
+                and hmc.houdini_version_id is not null
+                and c.day >= %s and c.day < %s
+                group by c.day, c.group_id, hmc.is_internal,
+                         hmc.houdini_version_id
+                """, [chunk_start.date(), chunk_end.date()])
+
+        if progress is not None:
+            progress(chunk_start, chunk_end)
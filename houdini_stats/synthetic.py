@@ -0,0 +1,368 @@
+"""
+Seeded generator of synthetic Houdini stats, to measure the reports on
+databases of any size before deploying (see the generate_synthetic_data and
+benchmark_reports management commands).
+
+The machines, their machine configs and the rows of their uploads are
+generated with the skew of the real data: a few tools account for most of
+the usage, most machines run Windows, about one machine in ten is internal,
+and a few machines and bugs account for most of the crashes. The same seed
+and number of rows always generate the same data.
+
+Rows are written with batched inserts straight into the fact tables, and the
+rollups and sketches are rebuilt from them afterwards, which is much faster
+than ingesting every upload.
+"""
+import datetime
+import random
+import socket
+import struct
+
+try:
+    from django.db.transaction import atomic
+except ImportError:
+    from django.db.transaction import commit_on_success as atomic
+
+from stats_main.models import Machine, MachineConfig
+
+import settings
+from houdini_stats import crash_groups, rollups, warehouse
+from houdini_stats.classification import get_os_family, parse_network
+from houdini_stats.ingestion import DAY_MODELS, UPLOAD_MODELS
+from houdini_stats.models import *
+
+# Prefix of the hardware ids of the generated machines, to tell them apart
+# from real ones.
+HARDWARE_ID_PREFIX = "synthetic-"
+
+# Operating systems sent by the machine configs, with their share of the
+# machines.
+OPERATING_SYSTEMS = (
+    ("windows-x86_64-cl17", 0.45),
+    ("windows-i686-cl17", 0.10),
+    ("linux-x86_64-gcc4.4", 0.25),
+    ("Ubuntu 14.04", 0.05),
+    ("darwin-x86_64-clang5.1-MacOSX10.9", 0.14),
+    ("", 0.01),
+)
+
+# Products, with their share of the machine configs.
+PRODUCTS = (
+    ("Houdini", 0.55),
+    ("Houdini Core", 0.10),
+    ("Hbatch", 0.15),
+    ("Mantra", 0.12),
+    ("Mplay", 0.08),
+)
+
+INTERNAL_FRACTION = 0.1
+APPRENTICE_FRACTION = 0.3
+
+NUM_TOOLS = 2000
+NUM_BUGS = 500
+NUM_FRAMES_PER_TRACE = 12
+
+# Share of the machine configs on the latest Houdini version, the rest are
+# on the previous ones.
+LATEST_VERSION_FRACTION = 0.6
+
+#-------------------------------------------------------------------------------
+
+class _WeightedChoice(object):
+    """
+    Picks values with the given weights in O(log n).
+    """
+
+    def __init__(self, values_and_weights):
+        self.values = []
+        self.cumulative_weights = []
+        total = 0.0
+        for value, weight in values_and_weights:
+            total += weight
+            self.values.append(value)
+            self.cumulative_weights.append(total)
+        self.total = total
+
+    def pick(self, rng):
+        target = rng.random() * self.total
+        low, high = 0, len(self.cumulative_weights) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if self.cumulative_weights[middle] < target:
+                low = middle + 1
+            else:
+                high = middle
+        return self.values[low]
+
+def _zipf(values, exponent=1.1):
+    """
+    Weight the values by 1 / rank ** exponent, so the first ones are picked
+    most of the time.
+    """
+    return _WeightedChoice((value, 1.0 / (rank + 1) ** exponent)
+                           for rank, value in enumerate(values))
+
+def _int_to_ip(ip):
+    return socket.inet_ntoa(struct.pack("!I", ip))
+
+def has_real_machines(using="stats"):
+    """
+    Return whether the database has machines that weren't generated, which
+    the generated data would mix with.
+    """
+    return Machine.objects.using(using).exclude(
+        hardware_id__startswith=HARDWARE_ID_PREFIX).exists()
+
+#-------------------------------------------------------------------------------
+
+class SyntheticDataGenerator(object):
+    """
+    Generates machines and their uploads until the fact tables have received
+    the requested number of rows.
+
+    Usage:
+        generator = SyntheticDataGenerator(seed=1, num_days=365)
+        generator.generate(1000000, progress=report_progress)
+    """
+
+    def __init__(self, seed=0, num_days=365, end_date=None,
+                 machines_per_chunk=100, using="stats"):
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.num_days = num_days
+        self.end_date = end_date or datetime.datetime.combine(
+            datetime.date.today(), datetime.time())
+        self.machines_per_chunk = machines_per_chunk
+        self.using = using
+
+        self.operating_systems = _WeightedChoice(OPERATING_SYSTEMS)
+        self.products = _WeightedChoice(PRODUCTS)
+        self.tools = _zipf(self._make_tool_names())
+        self.bugs = _zipf(range(NUM_BUGS))
+        self.creation_modes = _WeightedChoice((
+            (HoudiniToolUsage.SHELF, 0.5),
+            (HoudiniToolUsage.VIEWER, 0.35),
+            (HoudiniToolUsage.NETWORK, 0.15)))
+
+        versions = sorted(getattr(settings, "HOUDINI_VERSIONS", [14]),
+                          reverse=True)
+        self.major_versions = _WeightedChoice(
+            [(versions[0], LATEST_VERSION_FRACTION)] +
+            [(version, (1 - LATEST_VERSION_FRACTION) / (len(versions) - 1))
+             for version in versions[1:]])
+
+        internal_networks = [parse_network(cidr) for cidr in
+                             getattr(settings, "INTERNAL_NETWORKS", [])]
+        self.internal_network = (internal_networks[0]
+                                 if len(internal_networks) != 0 else None)
+
+        # HoudiniVersion ids by (major, minor, build, product, apprentice).
+        self.houdini_version_ids = {}
+
+        self.num_machines = Machine.objects.using(using).filter(
+            hardware_id__startswith=HARDWARE_ID_PREFIX).count()
+        self.num_rows = 0
+
+    def _make_tool_names(self):
+        categories = ("sop", "obj", "dop", "vop", "shop", "rop", "cop", "chop")
+        return ["%s_tool%d" % (categories[index % len(categories)], index)
+                for index in range(NUM_TOOLS)]
+
+    def _get_houdini_version_id(self, houdini_machine_config):
+        key = (houdini_machine_config.houdini_major_version,
+               houdini_machine_config.houdini_minor_version,
+               houdini_machine_config.houdini_build_number,
+               houdini_machine_config.product,
+               houdini_machine_config.is_apprentice)
+        if key not in self.houdini_version_ids:
+            self.houdini_version_ids[key] = get_houdini_version(
+                houdini_machine_config, using=self.using).id
+        return self.houdini_version_ids[key]
+
+    def _make_stack_trace(self, bug):
+        """
+        A stack trace of one of the bugs. The frames below the crashing ones
+        and the offsets change between crashes of the same bug, like in real
+        reports.
+        """
+        frames = []
+        for depth in range(NUM_FRAMES_PER_TRACE):
+            if depth < NUM_FRAMES_PER_TRACE // 2:
+                function = "UT_Module%d::function%d" % (
+                    bug % 40, bug * 7 + depth)
+            else:
+                function = "main_loop%d" % self.rng.randint(0, 5)
+            frames.append("%d: %s() + 0x%x" % (
+                depth, function, self.rng.randint(0, 0xfff)))
+        return "\n".join(frames)
+
+    def _make_ip_address(self, is_internal):
+        if is_internal and self.internal_network is not None:
+            network, netmask = self.internal_network
+            return _int_to_ip(
+                network | (self.rng.randint(1, 0xffffffff) & ~netmask
+                           & 0xffffffff))
+        return "8.%d.%d.%d" % (self.rng.randint(0, 255),
+            self.rng.randint(0, 255), self.rng.randint(1, 254))
+
+    def _make_machines(self, num_machines):
+        """
+        Create machines and one machine config each, and return a list of
+        (machine config, Houdini machine config, first seen date, activity
+        rate, crash rate) of the new machines.
+        """
+        hardware_ids = ["%s%d-%d" % (HARDWARE_ID_PREFIX, self.seed,
+                                     self.num_machines + index)
+                        for index in range(num_machines)]
+        self.num_machines += num_machines
+
+        Machine.objects.using(self.using).bulk_create(
+            [Machine(hardware_id=hardware_id) for hardware_id in hardware_ids])
+        machine_ids = dict(Machine.objects.using(self.using).filter(
+            hardware_id__in=hardware_ids).values_list("hardware_id", "id"))
+
+        machines = []
+        machine_configs = []
+        for hardware_id in hardware_ids:
+            is_internal = self.rng.random() < INTERNAL_FRACTION
+            first_seen = self.end_date - datetime.timedelta(
+                seconds=self.rng.randint(0, self.num_days * 86400 - 1))
+            machine_configs.append(MachineConfig(
+                machine_id=machine_ids[hardware_id],
+                config_hash=hardware_id,
+                ip_address=self._make_ip_address(is_internal),
+                operating_system=self.operating_systems.pick(self.rng),
+                creation_date=first_seen))
+            machines.append((is_internal, first_seen,
+                # Most machines are used now and then, a few every day.
+                min(1.0, 0.05 * self.rng.paretovariate(1.5)),
+                # Most machines rarely crash, a few crash all the time.
+                min(2.0, 0.02 * self.rng.paretovariate(1.2))))
+
+        MachineConfig.objects.using(self.using).bulk_create(machine_configs)
+        machine_config_ids = dict(MachineConfig.objects.using(self.using)
+            .filter(config_hash__in=hardware_ids)
+            .values_list("config_hash", "id"))
+
+        houdini_machine_configs = []
+        first_seens = []
+        result = []
+        for machine_config, machine in zip(machine_configs, machines):
+            is_internal, first_seen, activity_rate, crash_rate = machine
+            machine_config.id = machine_config_ids[machine_config.config_hash]
+            houdini_machine_config = HoudiniMachineConfig(
+                machine_config_id=machine_config.id,
+                houdini_major_version=self.major_versions.pick(self.rng),
+                houdini_minor_version=self.rng.choice((0, 0, 0, 1)),
+                houdini_build_number=str(self.rng.randint(100, 600)),
+                product=self.products.pick(self.rng),
+                is_apprentice=self.rng.random() < APPRENTICE_FRACTION,
+                is_internal=is_internal,
+                os_family=get_os_family(machine_config.operating_system))
+            houdini_machine_config.houdini_version_id = \
+                self._get_houdini_version_id(houdini_machine_config)
+            houdini_machine_configs.append(houdini_machine_config)
+            first_seens.append(HoudiniMachineFirstSeen(
+                machine_id=machine_config.machine_id, first_seen=first_seen,
+                is_internal=is_internal))
+            result.append((machine_config, houdini_machine_config,
+                           first_seen, activity_rate, crash_rate))
+
+        HoudiniMachineConfig.objects.using(self.using).bulk_create(
+            houdini_machine_configs)
+        HoudiniMachineFirstSeen.objects.using(self.using).bulk_create(
+            first_seens)
+        self.num_rows += 4 * num_machines
+        return result
+
+    def _make_upload_rows(self, machine_config, date, crash_rate, rows):
+        """
+        Add the rows of one session of a machine to the lists of rows of
+        each model.
+        """
+        def add(model, **fields):
+            row = model(stats_machine_config_id=machine_config.id,
+                        date=date, **fields)
+            if model in DAY_MODELS:
+                row.day = date.date()
+            rows[model].append(row)
+
+        number_of_seconds = int(self.rng.expovariate(1.0 / 3600)) + 1
+        add(Uptime, number_of_seconds=number_of_seconds,
+            idle_time=int(number_of_seconds * self.rng.random() * 0.3))
+
+        for index in range(int(self.rng.expovariate(1.0 / 8))):
+            add(HoudiniToolUsage, tool_name=self.tools.pick(self.rng),
+                tool_creation_mode=self.creation_modes.pick(self.rng),
+                count=int(self.rng.expovariate(1.0 / 3)) + 1,
+                is_builtin=self.rng.random() < 0.9,
+                is_asset=self.rng.random() < 0.05)
+
+        num_crashes = int(crash_rate) + (
+            1 if self.rng.random() < crash_rate % 1 else 0)
+        for index in range(num_crashes):
+            add(HoudiniCrash, type="crash",
+                stack_trace=self._make_stack_trace(self.bugs.pick(self.rng)))
+
+        add(HoudiniUsageCount, key="houdini/sessions", count=1)
+        if self.rng.random() < 0.3:
+            add(HoudiniSumAndCount, key="houdini/cook_time",
+                sum=self.rng.expovariate(1.0 / 30), count=1)
+        if self.rng.random() < 0.2:
+            add(HoudiniFlag, key="houdini/safe_mode")
+        if self.rng.random() < 0.1:
+            add(HoudiniLog, key="houdini/errors",
+                timestamp=self.rng.random() * number_of_seconds,
+                log_entry="Error %d" % self.rng.randint(1, 100))
+        if self.rng.random() < 0.1:
+            add(HoudiniString, key="houdini/renderer",
+                value=self.rng.choice(("Mantra", "Mantra PBR", "Other")))
+
+    def _write_rows(self, rows):
+        with atomic(using=self.using):
+            crash_groups.assign_crash_groups(
+                rows[HoudiniCrash], using=self.using)
+            for model, model_rows in rows.items():
+                if len(model_rows) != 0:
+                    model.objects.using(self.using).bulk_create(
+                        model_rows, batch_size=1000)
+                    self.num_rows += len(model_rows)
+
+    def generate(self, num_rows, progress=None):
+        """
+        Generate machines and uploads until about num_rows rows were written,
+        counting the machine and machine config rows, then rebuild the
+        rollups, sketches and warehouse tables. progress(num_rows) is called
+        after every chunk of machines.
+        """
+        target_num_rows = self.num_rows + num_rows
+        while self.num_rows < target_num_rows:
+            rows = dict((model, []) for model in UPLOAD_MODELS)
+            for machine_config, houdini_machine_config, first_seen, \
+                    activity_rate, crash_rate in self._make_machines(
+                        self.machines_per_chunk):
+                # The machines left once there are enough rows only sent
+                # their machine config, which happens in the real data too.
+                if self.num_rows + sum(len(model_rows) for model_rows in
+                                       rows.values()) >= target_num_rows:
+                    break
+                date = first_seen
+                while date < self.end_date:
+                    if self.rng.random() < activity_rate:
+                        self._make_upload_rows(
+                            machine_config, date, crash_rate, rows)
+                    date += datetime.timedelta(days=1)
+            self._write_rows(rows)
+            if progress is not None:
+                progress(self.num_rows)
+
+        self.rebuild_derived_tables()
+
+    def rebuild_derived_tables(self):
+        from_date = self.end_date - datetime.timedelta(days=self.num_days)
+        rollups.rebuild_tool_usage_daily(from_date, using=self.using)
+        rollups.rebuild_machine_activity_daily(from_date, using=self.using)
+        rollups.rebuild_machine_sketches(from_date, using=self.using)
+        rollups.rebuild_crash_group_stats(using=self.using)
+        rollups.rebuild_crash_group_daily(from_date, using=self.using)
+        warehouse.update_apprentice_usage(using=self.using)
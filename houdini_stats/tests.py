@@ -1,11 +1,25 @@
 """
-This file demonstrates writing tests using the unittest module. These will pass
-when you run "manage.py test".
-
-Replace this with more appropriate tests for your application.
+Tests of the Houdini stats app. Run them with "manage.py test houdini_stats".
 """
+import datetime
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
 
-from django.test import TestCase
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from stats_main.models import Machine, MachineConfig
+from houdini_stats.models import *
+from houdini_stats.ingestion import UploadBatch
+from houdini_stats import benchmark, caching, classification, crash_groups, \
+    hyperloglog, ingestion, instrumentation, minhash, parallel, queries, \
+    rollups, synthetic, warehouse
+from houdini_stats.reports import houdini as houdini_reports
+import settings
 
 
 class SimpleTest(TestCase):
@@ -14,3 +28,1280 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+#-------------------------------------------------------------------------------
+
+def _create_machine_config(hardware_id="test-machine", ip_address="8.8.8.8"):
+    machine = Machine(hardware_id=hardware_id)
+    machine.save(using="stats")
+    machine_config = MachineConfig(machine=machine, config_hash=hardware_id,
+                                   ip_address=ip_address)
+    machine_config.save(using="stats")
+    return machine_config
+
+
+class UploadBatchTest(TestCase):
+    multi_db = True
+
+    def test_one_insert_per_model(self):
+        """
+        Rows queued in an upload batch are written with one insert per model.
+        """
+        machine_config = _create_machine_config()
+        date = datetime.datetime(2014, 10, 1, 12, 0)
+
+        batch = UploadBatch(machine_config)
+        for i in range(20):
+            batch.add(HoudiniToolUsage, date=date, tool_name="tool%d" % i,
+                      tool_creation_mode=HoudiniToolUsage.SHELF, count=i + 1)
+            batch.add(HoudiniUsageCount, date=date, key="key%d" % i, count=i)
+        batch.add(Uptime, date=date, number_of_seconds=600, idle_time=60)
+        self.assertEqual(len(batch), 41)
+
+        with CaptureQueriesContext(connections["stats"]) as context:
+            batch.save()
+        inserts = [query["sql"] for query in context.captured_queries
+                   if query["sql"].lower().startswith("insert")]
+        for model in (HoudiniToolUsage, HoudiniUsageCount, Uptime):
+            table = "`%s`" % model._meta.db_table
+            self.assertEqual(len([sql for sql in inserts if table in sql]), 1)
+
+        self.assertEqual(len(batch), 0)
+        self.assertEqual(
+            HoudiniToolUsage.objects.using("stats").filter(
+                stats_machine_config=machine_config).count(), 20)
+        self.assertEqual(
+            HoudiniUsageCount.objects.using("stats").count(), 20)
+        self.assertEqual(Uptime.objects.using("stats").count(), 1)
+
+    def test_rows_saved_one_at_a_time_are_ingested(self):
+        """
+        Rows saved by stats_main with save() go through an upload batch.
+        """
+        machine_config = _create_machine_config()
+        date = datetime.datetime(2014, 10, 1, 12, 0)
+        crash = HoudiniCrash(stats_machine_config=machine_config, date=date,
+                             type="crash", stack_trace=CRASH_STACK_TRACE)
+        crash.save()
+
+        self.assertNotEqual(crash.id, None)
+        self.assertNotEqual(crash.group_id, None)
+        activity = HoudiniMachineActivityDaily.objects.using("stats").get(
+            day=date.date(), machine=machine_config.machine)
+        self.assertEqual(activity.num_crashes, 1)
+
+    def test_rows_of_an_upload_are_collected(self):
+        """
+        Rows saved one at a time inside collect_uploads() are written with
+        one insert per model when the block ends.
+        """
+        machine_config = _create_machine_config()
+        date = datetime.datetime(2014, 10, 1, 12, 0)
+
+        with CaptureQueriesContext(connections["stats"]) as context:
+            with ingestion.collect_uploads():
+                for i in range(3):
+                    Uptime(stats_machine_config=machine_config, date=date,
+                           number_of_seconds=600, idle_time=60).save()
+                self.assertEqual(Uptime.objects.using("stats").count(), 0)
+        inserts = [query["sql"] for query in context.captured_queries
+                   if query["sql"].lower().startswith("insert") and
+                      "`%s`" % Uptime._meta.db_table in query["sql"]]
+
+        self.assertEqual(len(inserts), 1)
+        activity = HoudiniMachineActivityDaily.objects.using("stats").get(
+            day=date.date(), machine=machine_config.machine)
+        self.assertEqual(activity.num_sessions, 3)
+
+    def test_collected_rows_are_dropped_on_errors(self):
+        machine_config = _create_machine_config()
+        try:
+            with ingestion.collect_uploads():
+                Uptime(stats_machine_config=machine_config,
+                       date=datetime.datetime(2014, 10, 1),
+                       number_of_seconds=600, idle_time=60).save()
+                raise ValueError("upload failed")
+        except ValueError:
+            pass
+
+        self.assertEqual(Uptime.objects.using("stats").count(), 0)
+        self.assertEqual(ingestion.get_collecting_batch(machine_config), None)
+
+    def test_rejects_unknown_model(self):
+        batch = UploadBatch(_create_machine_config())
+        self.assertRaises(ValueError, batch.add, HoudiniCrashGroup)
+
+    def test_updates_tool_usage_rollup(self):
+        """
+        Saving a batch adds its tool usage counts to the daily rollup.
+        """
+        machine_config = _create_machine_config()
+        date = datetime.datetime(2014, 10, 1, 12, 0)
+
+        for count in (3, 4):
+            batch = UploadBatch(machine_config)
+            batch.add(HoudiniToolUsage, date=date, tool_name="box",
+                      tool_creation_mode=HoudiniToolUsage.SHELF, count=count)
+            batch.save()
+
+        rollup = HoudiniToolUsageDaily.objects.using("stats").get(
+            day=date.date(), tool_name="box")
+        self.assertEqual(rollup.count, 7)
+        self.assertFalse(rollup.is_internal)
+
+    def test_stored_classification_is_used(self):
+        """
+        The rollups get the internal classification stored by
+        classify_machine_configs, not the one of the current networks.
+        """
+        machine_config = _create_machine_config()
+        HoudiniMachineConfig(machine_config=machine_config,
+                             is_internal=True).save(using="stats")
+        date = datetime.datetime(2014, 10, 1, 12, 0)
+
+        batch = UploadBatch(machine_config)
+        batch.add(HoudiniToolUsage, date=date, tool_name="box",
+                  tool_creation_mode=HoudiniToolUsage.SHELF, count=1)
+        batch.save()
+
+        self.assertTrue(HoudiniToolUsageDaily.objects.using("stats").get(
+            day=date.date(), tool_name="box").is_internal)
+
+    def test_updates_machine_activity_rollup(self):
+        """
+        Saving a batch adds its sessions and crashes to the daily machine
+        activity rollup.
+        """
+        machine_config = _create_machine_config()
+        date = datetime.datetime(2014, 10, 1, 12, 0)
+
+        for i in range(2):
+            batch = UploadBatch(machine_config)
+            batch.add(Uptime, date=date, number_of_seconds=600, idle_time=60)
+            batch.add(HoudiniCrash, date=date, stack_trace="trace",
+                      type="crash")
+            batch.save()
+
+        activity = HoudiniMachineActivityDaily.objects.using("stats").get(
+            day=date.date(), machine=machine_config.machine)
+        self.assertFalse(activity.is_internal)
+        self.assertEqual(activity.num_sessions, 2)
+        self.assertEqual(activity.total_seconds, 1200)
+        self.assertEqual(activity.total_idle_time, 120)
+        self.assertEqual(activity.num_crashes, 2)
+
+    def test_machine_activity_rollup_is_rebuilt(self):
+        """
+        The rebuild gives the ingested rows back, leaving out the machine
+        configs that have no Houdini version yet.
+        """
+        date = datetime.datetime(2014, 10, 1, 12, 0)
+        machine_config = _create_machine_config()
+        houdini_machine_config = HoudiniMachineConfig(
+            machine_config=machine_config, product="Houdini")
+        houdini_machine_config.houdini_version = get_houdini_version(
+            houdini_machine_config)
+        houdini_machine_config.save(using="stats")
+        batch = UploadBatch(machine_config)
+        batch.add(Uptime, date=date, number_of_seconds=600, idle_time=60)
+        batch.save()
+
+        unversioned_config = _create_machine_config(hardware_id="other")
+        HoudiniMachineConfig(machine_config=unversioned_config).save(
+            using="stats")
+        Uptime.objects.using("stats").bulk_create([Uptime(
+            stats_machine_config=unversioned_config, date=date,
+            day=date.date(), number_of_seconds=600, idle_time=60)])
+
+        def get_activity():
+            return [(row.day, row.machine_id, row.num_sessions,
+                     row.total_seconds) for row in
+                    HoudiniMachineActivityDaily.objects.using("stats")]
+
+        activity = get_activity()
+        self.assertEqual(activity, [
+            (date.date(), machine_config.machine_id, 1, 600)])
+
+        rollups.rebuild_machine_activity_daily()
+        self.assertEqual(get_activity(), activity)
+
+#-------------------------------------------------------------------------------
+
+CRASH_STACK_TRACE = """Caught signal 11
+
+AP_Interface::coreDumpChaser(UTsignalHandlerArg) <libHoudiniUI.so>
+UT_Signal::processSignal(int, siginfo*, void*) <libHoudiniUT.so>
+#0 0x7f3a2c1b4e2d GU_Detail::merge() + 0x21 (GU_Detail.C:123)
+#1 0x7f3a2c1b1000 SOP_Merge::cookMySop() + 0x1a </opt/hfs14.0.201/libSOP.so>
+#2 0x7f3a2c1b2000 main() + 0x10"""
+
+class CrashGroupTest(TestCase):
+    multi_db = True
+
+    def test_noise_is_normalized(self):
+        self.assertEqual(
+            crash_groups.get_normalized_frames(CRASH_STACK_TRACE),
+            ["GU_Detail::merge() (GU_Detail.C)",
+             "SOP_Merge::cookMySop() </opt/hfs/libSOP.so>",
+             "main()"])
+
+        other_build = CRASH_STACK_TRACE.replace("0x21", "0x8c") \
+            .replace(":123", ":140").replace("14.0.201", "14.0.258")
+        self.assertEqual(crash_groups.get_fingerprint(other_build),
+                         crash_groups.get_fingerprint(CRASH_STACK_TRACE))
+        self.assertNotEqual(
+            crash_groups.get_fingerprint(
+                CRASH_STACK_TRACE.replace("merge", "copy")),
+            crash_groups.get_fingerprint(CRASH_STACK_TRACE))
+        self.assertEqual(crash_groups.get_fingerprint("Caught signal 11"),
+                         None)
+
+    def test_crashes_are_grouped_at_ingest(self):
+        machine_config = _create_machine_config()
+        date = datetime.datetime(2014, 10, 1, 12, 0)
+
+        for offset in ("0x21", "0x22"):
+            batch = UploadBatch(machine_config)
+            batch.add(HoudiniCrash, date=date, type="crash",
+                      stack_trace=CRASH_STACK_TRACE.replace("0x21", offset))
+            batch.add(HoudiniCrash, date=date, type="crash", stack_trace="")
+            batch.save()
+
+        crashes = HoudiniCrash.objects.using("stats").filter(
+            stack_trace__startswith="Caught")
+        self.assertEqual(len(set(crash.group_id for crash in crashes)), 1)
+        self.assertEqual(HoudiniCrashGroup.objects.using("stats").count(), 1)
+        self.assertEqual(HoudiniCrash.objects.using("stats").filter(
+            stack_trace="", group=None).count(), 2)
+
+    def test_group_stats_are_updated_at_ingest(self):
+        machine_configs = [_create_machine_config("test-machine"),
+                           _create_machine_config("other-machine")]
+        dates = [datetime.datetime(2014, 10, day, 12, 0) for day in (1, 3, 2)]
+
+        for machine_config, date in zip(
+                [machine_configs[0]] + machine_configs, dates):
+            batch = UploadBatch(machine_config)
+            batch.add(HoudiniCrash, date=date, type="crash",
+                      stack_trace=CRASH_STACK_TRACE)
+            batch.save()
+
+        def get_stats():
+            group = HoudiniCrashGroup.objects.using("stats").get()
+            return (group.num_crashes, group.num_machines, group.first_seen,
+                    group.last_seen, group.latest_houdini_version_id)
+
+        stats = get_stats()
+        self.assertEqual(stats[:4], (3, 2, dates[0], dates[1]))
+        self.assertNotEqual(stats[4], None)
+
+        rollups.rebuild_crash_group_stats()
+        self.assertEqual(get_stats(), stats)
+
+    def test_daily_rollup_is_updated_at_ingest(self):
+        machine_config = _create_machine_config()
+        dates = [datetime.datetime(2014, 10, 1, hour, 0) for hour in (9, 17)]
+        dates.append(datetime.datetime(2014, 10, 2, 12, 0))
+
+        for date in dates:
+            batch = UploadBatch(machine_config)
+            batch.add(HoudiniCrash, date=date, type="crash",
+                      stack_trace=CRASH_STACK_TRACE)
+            batch.add(HoudiniCrash, date=date, type="crash", stack_trace="")
+            batch.save()
+
+        def get_daily_counts():
+            return [(row.day, row.group_id, row.num_crashes) for row in
+                    HoudiniCrashGroupDaily.objects.using("stats")
+                    .order_by("day")]
+
+        group_id = HoudiniCrashGroup.objects.using("stats").get().id
+        daily_counts = get_daily_counts()
+        self.assertEqual(daily_counts, [
+            (datetime.date(2014, 10, 1), group_id, 2),
+            (datetime.date(2014, 10, 2), group_id, 1)])
+
+        rollups.rebuild_crash_group_daily()
+        self.assertEqual(get_daily_counts(), daily_counts)
+
+    def _make_stack_trace(self, functions):
+        return "\n".join("#%d 0x%x %s() + 0x%x" % (
+            depth, 0x7f0000 + depth, function, depth)
+            for depth, function in enumerate(functions))
+
+    def test_near_duplicates_are_merged(self):
+        machine_config = _create_machine_config()
+        date = datetime.datetime(2014, 10, 1, 12, 0)
+        functions = ["GEO_Frame%d::cook" % depth for depth in range(16)]
+        inlined_functions = list(functions)
+        inlined_functions[3] = "GEO_Inlined::cook"
+        other_functions = ["SOP_Other%d::run" % depth for depth in range(16)]
+
+        for stack_functions in (functions, inlined_functions,
+                                other_functions):
+            batch = UploadBatch(machine_config)
+            batch.add(HoudiniCrash, date=date, type="crash",
+                      stack_trace=self._make_stack_trace(stack_functions))
+            batch.save()
+
+        group_ids = [crash.group_id for crash in
+                     HoudiniCrash.objects.using("stats").order_by("id")]
+        self.assertEqual(group_ids[0], group_ids[1])
+        self.assertNotEqual(group_ids[0], group_ids[2])
+        # The fingerprint of the inlined trace has its own group, merged
+        # into the first one.
+        self.assertEqual(HoudiniCrashGroup.objects.using("stats").filter(
+            merged_into=group_ids[0]).count(), 1)
+
+    def test_existing_groups_are_clustered(self):
+        functions = ["GEO_Frame%d::cook" % depth for depth in range(16)]
+        inlined_functions = list(functions)
+        inlined_functions[3] = "GEO_Inlined::cook"
+        machine_config = _create_machine_config()
+        groups = []
+        for stack_functions in (functions, inlined_functions):
+            stack_trace = self._make_stack_trace(stack_functions)
+            group = HoudiniCrashGroup(
+                fingerprint=crash_groups.get_fingerprint(stack_trace),
+                representative_stack_trace=stack_trace)
+            group.save(using="stats")
+            HoudiniCrash(stats_machine_config=machine_config, group=group,
+                         date=datetime.datetime(2014, 10, 1),
+                         stack_trace=stack_trace).save(using="stats")
+            groups.append(group)
+
+        crash_groups.cluster_crash_groups(chunk_size=1)
+
+        self.assertEqual(HoudiniCrashGroup.objects.using("stats").get(
+            id=groups[1].id).merged_into_id, groups[0].id)
+        self.assertEqual(HoudiniCrash.objects.using("stats").filter(
+            group=groups[0]).count(), 2)
+
+#-------------------------------------------------------------------------------
+
+class RegroupCrashesTest(TransactionTestCase):
+    """
+    Regrouping closes the database connections before starting its pool,
+    which would end the transaction of a TestCase.
+    """
+    multi_db = True
+
+    def test_crashes_are_regrouped(self):
+        # Inserted without going through ingestion, so they have no group.
+        machine_config = _create_machine_config()
+        date = datetime.datetime(2014, 10, 1)
+        HoudiniCrash.objects.using("stats").bulk_create([
+            HoudiniCrash(stats_machine_config=machine_config, date=date,
+                         day=date.date(),
+                         stack_trace=CRASH_STACK_TRACE.replace("0x21", offset))
+            for offset in ("0x21", "0x22", "0x23")])
+        progress = []
+
+        crash_groups.regroup_crashes(
+            processes=2, chunk_size=2,
+            progress=lambda *args: progress.append(args))
+
+        group_ids = set(HoudiniCrash.objects.using("stats").values_list(
+            "group_id", flat=True))
+        self.assertEqual(len(group_ids), 1)
+        self.assertNotEqual(group_ids, set([None]))
+        self.assertEqual([num_moved for last_id, num_read, num_moved in
+                          progress], [2, 3])
+
+        # The run finished, so the next one reads every crash again.
+        self.assertFalse(HoudiniWarehouseWatermark.objects.using("stats")
+                         .filter(table_name=crash_groups.REGROUP_CHECKPOINT)
+                         .exists())
+        progress = []
+        crash_groups.regroup_crashes(
+            processes=2, chunk_size=2,
+            progress=lambda *args: progress.append(args))
+        self.assertEqual([(num_read, num_moved) for last_id, num_read,
+                          num_moved in progress], [(2, 0), (3, 0)])
+
+#-------------------------------------------------------------------------------
+
+class MachineFirstSeenTest(TestCase):
+    multi_db = True
+
+    def test_earliest_config_is_kept(self):
+        machine_config = _create_machine_config()
+        earliest_date = datetime.datetime(2014, 9, 1)
+        for date, is_internal in ((datetime.datetime(2014, 10, 2), False),
+                                  (earliest_date, True),
+                                  (datetime.datetime(2014, 11, 1), False)):
+            rollups.update_machine_first_seen(
+                machine_config.machine_id, date, is_internal)
+
+        first_seen = HoudiniMachineFirstSeen.objects.using("stats").get(
+            machine=machine_config.machine)
+        self.assertEqual(first_seen.first_seen, earliest_date)
+        self.assertTrue(first_seen.is_internal)
+
+#-------------------------------------------------------------------------------
+
+class HoudiniVersionTest(TestCase):
+    multi_db = True
+
+    def test_build_numbers_are_integers(self):
+        self.assertEqual(classification.parse_build_number("392"), 392)
+        self.assertEqual(classification.parse_build_number(" 12.5"), 12)
+        self.assertEqual(classification.parse_build_number(0), 0)
+        self.assertEqual(classification.parse_build_number("beta"), 0)
+
+    def test_fixed_builds_are_parsed(self):
+        self.assertEqual(classification.parse_houdini_build("14.0.201"),
+                         (14, 0, 201))
+        self.assertEqual(classification.parse_houdini_build(" 13.0.582 "),
+                         (13, 0, 582))
+        self.assertEqual(classification.parse_houdini_build("201"), None)
+        self.assertEqual(classification.parse_houdini_build(""), None)
+
+    def test_same_version_is_shared(self):
+        houdini_versions = [
+            get_houdini_version(HoudiniMachineConfig(
+                houdini_major_version=14, houdini_minor_version=0,
+                houdini_build_number=build_number, product="Houdini"))
+            for build_number in ("392", "392", "1001")]
+
+        self.assertEqual(houdini_versions[0].id, houdini_versions[1].id)
+        self.assertNotEqual(houdini_versions[0].id, houdini_versions[2].id)
+        self.assertEqual(houdini_versions[2].houdini_build_number, 1001)
+
+#-------------------------------------------------------------------------------
+
+class ApprenticeUsageTest(TransactionTestCase):
+    """
+    Creating the warehouse table commits the transaction, so these tests
+    can't run inside one.
+    """
+    multi_db = True
+
+    def setUp(self):
+        self.machine_config = _create_machine_config()
+        HoudiniMachineConfig(
+            machine_config=self.machine_config, houdini_major_version=14,
+            is_apprentice=True).save(using="stats")
+        self.start_date = datetime.datetime(2014, 10, 1)
+
+    def tearDown(self):
+        connections["stats"].cursor().execute(
+            "drop table if exists " + warehouse.APPRENTICE_USAGE_TABLE)
+
+    def _add_uptime(self, date, number_of_seconds):
+        batch = UploadBatch(self.machine_config)
+        batch.add(Uptime, date=date, number_of_seconds=number_of_seconds)
+        batch.save()
+
+    def _get_usage(self):
+        cursor = connections["stats"].cursor()
+        cursor.execute("select start_date, usage_in_seconds from " +
+                       warehouse.APPRENTICE_USAGE_TABLE)
+        return cursor.fetchall()
+
+    def test_only_first_30_days_are_counted(self):
+        self._add_uptime(self.start_date, 100)
+        self._add_uptime(self.start_date + datetime.timedelta(days=29), 10)
+        warehouse.update_apprentice_usage(chunk_size=1)
+
+        self._add_uptime(self.start_date + datetime.timedelta(days=10), 20)
+        self._add_uptime(self.start_date + datetime.timedelta(days=31), 1000)
+        warehouse.update_apprentice_usage()
+
+        self.assertEqual([tuple(row) for row in self._get_usage()],
+                         [(self.start_date, 130)])
+
+    def test_late_uptimes_move_the_start_date(self):
+        self._add_uptime(self.start_date, 100)
+        warehouse.update_apprentice_usage()
+
+        earlier_date = self.start_date - datetime.timedelta(days=40)
+        self._add_uptime(earlier_date, 5)
+        warehouse.update_apprentice_usage()
+
+        self.assertEqual([tuple(row) for row in self._get_usage()],
+                         [(earlier_date, 5)])
+
+    def test_table_without_watermark_is_rebuilt(self):
+        self._add_uptime(self.start_date, 100)
+        warehouse.update_apprentice_usage()
+        HoudiniWarehouseWatermark.objects.using("stats").filter(
+            table_name=warehouse.APPRENTICE_USAGE_TABLE).delete()
+        warehouse.update_apprentice_usage()
+
+        self.assertEqual([tuple(row) for row in self._get_usage()],
+                         [(self.start_date, 100)])
+
+    def test_usage_histogram(self):
+        other_config = _create_machine_config(hardware_id="other-machine")
+        HoudiniMachineConfig(
+            machine_config=other_config, houdini_major_version=14,
+            is_apprentice=True).save(using="stats")
+        self._add_uptime(self.start_date, 3 * 60)
+        batch = UploadBatch(other_config)
+        batch.add(Uptime, date=self.start_date, number_of_seconds=300 * 60)
+        batch.save()
+        warehouse.update_apprentice_usage()
+
+        report = houdini_reports.BreakdownOfApprenticeUsageH14()
+        data = report.get_data(
+            (self.start_date, self.start_date + datetime.timedelta(days=1)),
+            "daily", {})
+        self.assertEqual(len(data), 121)
+        self.assertEqual(data[1], ("2 - 4", 1))
+        self.assertEqual(data[-1], ("240+", 1))
+        self.assertEqual(sum(count for label, count in data), 2)
+
+#-------------------------------------------------------------------------------
+
+class InternalNetworkClassificationTest(SimpleTestCase):
+    networks = [classification.parse_network("192.168.0.0/16"),
+                classification.parse_network("10.1.0.0/16"),
+                classification.parse_network("172.16.4.0/22")]
+
+    def test_internal_addresses(self):
+        for ip_address in ("192.168.0.1", "10.1.255.3", "172.16.7.250"):
+            self.assertTrue(
+                classification.is_internal_ip(ip_address, self.networks))
+
+    def test_external_addresses(self):
+        for ip_address in ("8.8.8.8", "10.2.0.1", "172.16.8.1", "", None,
+                           "not an ip"):
+            self.assertFalse(
+                classification.is_internal_ip(ip_address, self.networks))
+
+    def test_invalid_network(self):
+        self.assertRaises(ValueError, classification.parse_network,
+                          "10.0.0.0/33")
+
+#-------------------------------------------------------------------------------
+
+class OSFamilyClassificationTest(SimpleTestCase):
+    def test_os_families(self):
+        for operating_system, os_family in (
+                ("linux-x86_64-gcc4.4", "Linux"),
+                ("Ubuntu 14.04", "Linux"),
+                ("darwin-x86_64-clang5.1-MacOSX10.9", "Mac OS"),
+                ("windows-i686-cl17", "Windows"),
+                ("", "Unknown"),
+                (None, "Unknown")):
+            self.assertEqual(classification.get_os_family(operating_system),
+                             os_family)
+            # The second call is answered from the memoized families.
+            self.assertEqual(classification.get_os_family(operating_system),
+                             os_family)
+
+#-------------------------------------------------------------------------------
+
+# Tables whose full scans would make the reports slow as the data grows.
+FACT_TABLES = set(model._meta.db_table for model in (
+    Uptime, HoudiniCrash, HoudiniToolUsage, HoudiniUsageCount,
+    HoudiniSumAndCount, HoudiniFlag, HoudiniLog, HoudiniString))
+
+# Filter values used for the reports that have filters.
+DEFAULT_FILTER_VALUES = {
+    "num_bars_to_show": "10",
+    "ip_filter": "All",
+    "counting": "Exact",
+    "num_groups": "10",
+}
+
+def _iter_reports():
+    """
+    Yield an instance of every report class defined in reports/houdini.py that
+    can be created without arguments, leaving out the base classes.
+    """
+    for name, cls in benchmark.iter_report_classes():
+        yield cls()
+
+def _seed_stats_data(num_machines=50, num_days=730, end_date=None):
+    """
+    Fill the stats database with a few uploads per machine spread over
+    num_days days, so the optimizer has realistic choices to make.
+    """
+    end_date = end_date or datetime.datetime(2014, 10, 1)
+    for machine_index in range(num_machines):
+        machine_config = _create_machine_config(
+            hardware_id="machine%d" % machine_index,
+            ip_address=("192.168.0.%d" if machine_index % 5 == 0
+                        else "8.8.%d.1") % machine_index)
+        houdini_machine_config = HoudiniMachineConfig(
+            machine_config=machine_config,
+            houdini_major_version=13 + machine_index % 2,
+            houdini_build_number=str(200 + machine_index % 3),
+            product="Houdini",
+            is_internal=machine_index % 5 == 0)
+        houdini_machine_config.houdini_version = get_houdini_version(
+            houdini_machine_config)
+        houdini_machine_config.save(using="stats")
+
+        batch = UploadBatch(machine_config)
+        for day_index in range(machine_index % 7, num_days, 7):
+            date = end_date - datetime.timedelta(days=day_index)
+            batch.add(Uptime, date=date, number_of_seconds=3600,
+                      idle_time=60)
+            batch.add(HoudiniToolUsage, date=date, tool_name="box",
+                      tool_creation_mode=HoudiniToolUsage.VIEWER, count=2)
+            batch.add(HoudiniUsageCount, date=date, key="key", count=1)
+            batch.add(HoudiniSumAndCount, date=date, key="key", sum=1.0,
+                      count=1)
+            batch.add(HoudiniFlag, date=date, key="flag")
+            batch.add(HoudiniLog, date=date, key="log", timestamp=0.0,
+                      log_entry="entry")
+            batch.add(HoudiniString, date=date, key="key", value="value")
+            if day_index % 3 == 0:
+                batch.add(HoudiniCrash, date=date, stack_trace="trace")
+        batch.save()
+
+    cursor = connections["stats"].cursor()
+    for table in FACT_TABLES:
+        cursor.execute("analyze table " + table)
+
+class ReportTestCase(TestCase):
+    """
+    Base of the tests that run the report queries.
+    """
+    multi_db = True
+
+    def setUp(self):
+        if connections["stats"].vendor != "mysql":
+            self.skipTest("The report queries are written for MySQL.")
+
+        # Run the queries in this thread, where they are captured and can
+        # see the data of the test transaction, and don't answer them from
+        # the caches.
+        self.saved_settings = {}
+        for name, value in (("HOUDINI_STATS_REPORT_QUERY_THREADS", 1),
+                            ("HOUDINI_STATS_REPORT_CACHE_ENABLED", False)):
+            self.saved_settings[name] = getattr(settings, name, None)
+            setattr(settings, name, value)
+
+    def tearDown(self):
+        for name, value in self.saved_settings.items():
+            if value is None:
+                delattr(settings, name)
+            else:
+                setattr(settings, name, value)
+
+class ReportQueryPlanTest(ReportTestCase):
+    """
+    Run EXPLAIN on every query issued by the reports and fail if any of them
+    does a full table scan of a fact table.
+    """
+    def setUp(self):
+        super(ReportQueryPlanTest, self).setUp()
+        _seed_stats_data()
+
+    def _full_scans(self, sql):
+        cursor = connections["stats"].cursor()
+        cursor.execute("explain " + sql)
+        columns = [column[0].lower() for column in cursor.description]
+        table_index = columns.index("table")
+        type_index = columns.index("type")
+        return [row[table_index] for row in cursor.fetchall()
+                if row[type_index] == "ALL" and
+                   row[table_index] in FACT_TABLES]
+
+    def test_no_full_scans_of_fact_tables(self):
+        series_range = (datetime.datetime(2014, 9, 1),
+                        datetime.datetime(2014, 9, 30, 23, 59, 59))
+        failures = []
+        for report in _iter_reports():
+            # These read a warehouse table created outside the migrations,
+            # and creating it would commit the test transaction.
+            if isinstance(report, houdini_reports.BreakdownOfApprenticeUsage):
+                continue
+
+            with CaptureQueriesContext(connections["stats"]) as context:
+                report.get_data(series_range, "monthly",
+                                DEFAULT_FILTER_VALUES)
+
+            for query in context.captured_queries:
+                if not query["sql"].lstrip().lower().startswith("select"):
+                    continue
+                for table in self._full_scans(query["sql"]):
+                    failures.append("%s: full scan of %s" % (
+                        report.__class__.__name__, table))
+
+        self.assertEqual(failures, [])
+
+class ReportDataTest(ReportTestCase):
+    """
+    Check the data of the reports that read the rollup tables on a few
+    uploads.
+    """
+    series_range = (datetime.datetime(2014, 10, 1),
+                    datetime.datetime(2014, 10, 31, 23, 59, 59))
+    october_1 = datetime.datetime(2014, 10, 1, 12)
+    october_2 = datetime.datetime(2014, 10, 2, 12)
+
+    def _create_config(self, hardware_id, is_internal=False,
+                       build_number="201"):
+        """
+        Create a machine with one Houdini 14.0 config of the given build.
+        """
+        machine_config = _create_machine_config(hardware_id=hardware_id)
+        houdini_machine_config = HoudiniMachineConfig(
+            machine_config=machine_config, houdini_major_version=14,
+            houdini_minor_version=0, houdini_build_number=build_number,
+            product="Houdini", is_internal=is_internal)
+        houdini_machine_config.houdini_version = get_houdini_version(
+            houdini_machine_config)
+        houdini_machine_config.save(using="stats")
+        return machine_config
+
+    def _upload(self, machine_config, model, dates, **fields):
+        """
+        Save one upload with a row of the model on every date.
+        """
+        batch = UploadBatch(machine_config)
+        for date in dates:
+            batch.add(model, date=date, **fields)
+        batch.save()
+
+    def test_machines_actively_sending_stats(self):
+        for hardware_id, is_internal, dates in (
+                ("external1", False, [self.october_1, self.october_2]),
+                ("external2", False, [self.october_2]),
+                ("internal", True, [self.october_1])):
+            self._upload(self._create_config(hardware_id, is_internal),
+                         Uptime, dates, number_of_seconds=600, idle_time=0)
+
+        for counting in ("Exact", "Approximate"):
+            data = houdini_reports.MachinesActivelySendingStats().get_data(
+                self.series_range, "monthly",
+                dict(DEFAULT_FILTER_VALUES, counting=counting))
+            self.assertEqual([(row[1], row[-1]) for row in data], [(2, 1)])
+
+    def test_new_machines_over_time(self):
+        for hardware_id, is_internal, first_seen in (
+                ("external1", False, self.october_1),
+                ("external2", False, self.october_2),
+                ("internal", True, self.october_2),
+                ("old", False, datetime.datetime(2014, 9, 1))):
+            machine_config = self._create_config(hardware_id, is_internal)
+            rollups.update_machine_first_seen(
+                machine_config.machine_id, first_seen, is_internal)
+            # A later config doesn't make the machine new again.
+            rollups.update_machine_first_seen(
+                machine_config.machine_id,
+                first_seen + datetime.timedelta(days=10), is_internal)
+
+        data = houdini_reports.NewMachinesOverTime().get_data(
+            self.series_range, "monthly", DEFAULT_FILTER_VALUES)
+        self.assertEqual([(row[1], row[-1]) for row in data], [(2, 1)])
+
+    def test_most_popular_tools(self):
+        external_config = self._create_config("external")
+        internal_config = self._create_config("internal", is_internal=True)
+        for machine_config, tool_name, tool_creation_mode, count in (
+                (external_config, "box", HoudiniToolUsage.SHELF, 3),
+                (internal_config, "sphere", HoudiniToolUsage.VIEWER, 5),
+                (internal_config, "box", HoudiniToolUsage.VIEWER, 1)):
+            self._upload(machine_config, HoudiniToolUsage, [self.october_1],
+                         tool_name=tool_name,
+                         tool_creation_mode=tool_creation_mode, count=count)
+
+        def get_tools(report, **filter_values):
+            return [tuple(row) for row in report.get_data(
+                self.series_range, "monthly",
+                dict(DEFAULT_FILTER_VALUES, **filter_values))]
+
+        self.assertEqual(get_tools(houdini_reports.MostPopularTools()),
+                         [("sphere", 5), ("box", 4)])
+        self.assertEqual(
+            get_tools(houdini_reports.MostPopularTools(),
+                      ip_filter="External Machines"),
+            [("box", 3)])
+        self.assertEqual(
+            get_tools(houdini_reports.MostPopularTools(),
+                      num_bars_to_show="1"),
+            [("sphere", 5)])
+        self.assertEqual(get_tools(houdini_reports.MostPopularToolsShelf()),
+                         [("box", 3)])
+
+    def _upload_crashes(self):
+        """
+        Save two crashes of a group in build 201 and one in build 250, and
+        one crash of another group, from an internal machine. Return the two
+        groups.
+        """
+        other_stack_trace = "#0 0x1 SOP_Box::cook() + 0x1\n" \
+                            "#1 0x2 main() + 0x2"
+        self._upload(self._create_config("build201"), HoudiniCrash,
+                     [self.october_1, self.october_2], type="crash",
+                     stack_trace=CRASH_STACK_TRACE)
+        self._upload(self._create_config("build250", build_number="250"),
+                     HoudiniCrash, [self.october_2], type="crash",
+                     stack_trace=CRASH_STACK_TRACE)
+        self._upload(self._create_config("other", is_internal=True),
+                     HoudiniCrash, [self.october_1], type="crash",
+                     stack_trace=other_stack_trace)
+
+        def get_group(stack_trace):
+            crash = HoudiniCrash.objects.using("stats").filter(
+                stack_trace=stack_trace)[0]
+            return HoudiniCrashGroup.objects.using("stats").get(
+                id=crash.group_id)
+
+        return get_group(CRASH_STACK_TRACE), get_group(other_stack_trace)
+
+    def test_top_crash_groups_over_time(self):
+        self._upload_crashes()
+
+        data = houdini_reports.TopCrashGroupsOverTime().get_data(
+            self.series_range, "monthly",
+            dict(DEFAULT_FILTER_VALUES, num_groups="5"))
+        # The groups are ranked by their number of crashes.
+        self.assertEqual([tuple(row[1:]) for row in data], [(3, 1, 0, 0, 0)])
+
+        data = houdini_reports.TopCrashGroupsOverTime().get_data(
+            self.series_range, "monthly",
+            dict(DEFAULT_FILTER_VALUES, num_groups="5",
+                 ip_filter="Internal Machines"))
+        self.assertEqual([tuple(row[1:]) for row in data], [(1, 0, 0, 0, 0)])
+
+    def test_regressed_crash_groups(self):
+        group = self._upload_crashes()[0]
+        group.fixed_in_houdini_build = "14.0.220"
+        group.save(using="stats")
+
+        data = houdini_reports.RegressedCrashGroups().get_data(
+            self.series_range, "monthly", DEFAULT_FILTER_VALUES)
+        self.assertEqual(
+            [tuple(row) for row in data],
+            [("Group %s (fixed in 14.0.220)" % group.id, 1)])
+
+#-------------------------------------------------------------------------------
+
+class ReportDataCacheTest(TestCase):
+    # The ingest watermark may be read from the database.
+    multi_db = True
+
+    def setUp(self):
+        self.now = 1000.0
+        self.cache = caching.ReportDataCache(
+            max_entries=2, ttl=60, clock=lambda: self.now)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set("a", 1, None)
+        self.cache.set("b", 2, None)
+        self.cache.get("a")
+        self.cache.set("c", 3, None)
+
+        self.assertEqual(self.cache.get("a"), (1, None))
+        self.assertEqual(self.cache.get("b"), None)
+        self.assertEqual(self.cache.get("c"), (3, None))
+
+    def test_entries_expire(self):
+        self.cache.set("a", 1, None)
+        self.now += 59
+        self.assertEqual(self.cache.get("a"), (1, None))
+        self.now += 1
+        self.assertEqual(self.cache.get("a"), None)
+
+    def test_data_is_shared_between_processes(self):
+        calls = []
+
+        class Report(object):
+            def name(self):
+                return "shared_cache_test_report"
+
+            @caching.cached_report_data
+            def get_data(self, series_range, aggregation, filter_values):
+                calls.append(series_range)
+                return [("a", 1)]
+
+        series_range = (datetime.datetime(2000, 1, 1),
+                        datetime.datetime(2000, 1, 31))
+        Report().get_data(series_range, "daily", {})
+        # Another process only finds the data in the shared cache.
+        caching._report_data_cache.clear()
+
+        self.assertEqual(Report().get_data(series_range, "daily", {}),
+                         [("a", 1)])
+        self.assertEqual(len(calls), 1)
+
+#-------------------------------------------------------------------------------
+
+class IngestWatermarkTest(TestCase):
+    multi_db = True
+
+    def _check_recent_ranges_are_invalidated(self):
+        watermark = datetime.datetime(2014, 10, 1)
+        caching.record_ingest(watermark)
+        old_range = (datetime.datetime(2014, 1, 1),
+                     datetime.datetime(2014, 3, 1))
+        recent_range = (datetime.datetime(2014, 9, 1),
+                        datetime.datetime(2014, 10, 31))
+
+        self.assertFalse(
+            caching.is_affected_by_ingest(recent_range, watermark))
+
+        caching.record_ingest(watermark + datetime.timedelta(hours=1))
+        self.assertFalse(caching.is_affected_by_ingest(old_range, watermark))
+        self.assertTrue(caching.is_affected_by_ingest(recent_range, watermark))
+
+    def test_ingest_invalidates_recent_ranges_only(self):
+        self._check_recent_ranges_are_invalidated()
+
+    def test_prewarmed_data_survives_new_uploads(self):
+        calls = []
+
+        class Report(object):
+            def name(self):
+                return "prewarm_test_report"
+
+            @caching.cached_report_data
+            def get_data(self, series_range, aggregation, filter_values):
+                calls.append(series_range)
+                return [("a", len(calls))]
+
+        today = datetime.datetime.combine(datetime.date.today(),
+                                          datetime.time())
+        series_range = (today - datetime.timedelta(days=29),
+                        today + datetime.timedelta(hours=23))
+        caching.record_ingest(today)
+        caching.start_prewarming()
+        try:
+            Report().get_data(series_range, "daily", {})
+        finally:
+            caching._prewarming = False
+        caching.record_ingest(today + datetime.timedelta(hours=1))
+
+        self.assertEqual(Report().get_data(series_range, "daily", {}),
+                         [("a", 1)])
+        self.assertEqual(len(calls), 1)
+
+    def test_invalidated_series_are_queried_again(self):
+        calls = []
+
+        @caching.cached_closed_buckets("invalidation_test_series")
+        def get_series(series_range, aggregation):
+            calls.append(series_range)
+            return [(datetime.date(2000, 1, 1), 1),
+                    (datetime.date(2000, 2, 1), 2)]
+
+        series_range = (datetime.datetime(2000, 1, 1),
+                        datetime.datetime(2000, 2, 29))
+        get_series(series_range, "monthly")
+        get_series(series_range, "monthly")
+        caching.invalidate_caches()
+        get_series(series_range, "monthly")
+
+        # The finished January bucket is only queried again once the caches
+        # are invalidated.
+        self.assertEqual([call[0] for call in calls], [
+            datetime.datetime(2000, 1, 1), datetime.datetime(2000, 2, 1),
+            datetime.datetime(2000, 1, 1)])
+
+    def test_watermark_is_in_the_database_without_a_shared_cache(self):
+        saved_caches = getattr(settings, "CACHES", None)
+        settings.CACHES = {"default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        try:
+            self.assertFalse(caching.is_cache_shared())
+            self._check_recent_ranges_are_invalidated()
+            self.assertEqual(
+                HoudiniWarehouseWatermark.objects.using("stats").get(
+                    table_name=caching.WATERMARK_CACHE_KEY).last_date,
+                datetime.datetime(2014, 10, 1, 1))
+        finally:
+            if saved_caches is None:
+                del settings.CACHES
+            else:
+                settings.CACHES = saved_caches
+
+#-------------------------------------------------------------------------------
+
+class ClosedBucketCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.clock = 1000.0
+        self.cache = caching.ClosedBucketCache(
+            now=lambda: datetime.datetime(2014, 10, 20), max_series=2,
+            ttl=60, clock=lambda: self.clock)
+        self.queried_ranges = []
+
+    def _query(self, series_range):
+        """
+        Return one row per day in the range, like a daily report query with
+        zeros filled in.
+        """
+        self.queried_ranges.append(series_range)
+        start, end = series_range
+        day = datetime.datetime(start.year, start.month, start.day)
+        rows = []
+        while day <= end:
+            rows.append((day.date(), day.day))
+            day += datetime.timedelta(days=1)
+        return rows
+
+    def test_only_open_buckets_are_queried_again(self):
+        series_range = (datetime.datetime(2014, 9, 1),
+                        datetime.datetime(2014, 10, 20, 23, 59, 59))
+        first = self.cache.get_series("key", series_range, self._query)
+        second = self.cache.get_series("key", series_range, self._query)
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.queried_ranges), 2)
+        # With a 3 day settle period, the buckets from Oct 17 on are open.
+        self.assertEqual(self.queried_ranges[1],
+                         (datetime.datetime(2014, 10, 17), series_range[1]))
+
+    def test_least_recently_used_series_is_evicted(self):
+        series_range = (datetime.datetime(2014, 9, 1),
+                        datetime.datetime(2014, 9, 30, 23, 59, 59))
+        for key in ("a", "b", "a", "c", "a", "b"):
+            self.cache.get_series(key, series_range, self._query)
+
+        # The cached series only query their open last bucket, but "b" was
+        # evicted by "c", so it is queried in full again.
+        self.assertEqual(
+            [queried_range == series_range
+                for queried_range in self.queried_ranges],
+            [True, True, False, True, False, True])
+        self.assertEqual(list(self.cache.runs), ["a", "b"])
+
+    def test_series_expire(self):
+        series_range = (datetime.datetime(2014, 9, 1),
+                        datetime.datetime(2014, 9, 30, 23, 59, 59))
+        self.cache.get_series("key", series_range, self._query)
+        self.clock += 59
+        self.cache.get_series("key", series_range, self._query)
+        self.clock += 1
+        self.cache.get_series("key", series_range, self._query)
+
+        self.assertEqual(len(self.queried_ranges), 3)
+        self.assertEqual(self.queried_ranges[2], series_range)
+
+    def test_partial_buckets_at_range_edges_are_queried(self):
+        self.cache.get_series(
+            "key", (datetime.datetime(2014, 9, 1),
+                    datetime.datetime(2014, 10, 20)), self._query)
+
+        series_range = (datetime.datetime(2014, 9, 10, 12),
+                        datetime.datetime(2014, 9, 20, 12))
+        rows = self.cache.get_series("key", series_range, self._query)
+
+        self.assertEqual(rows, self._query(series_range))
+        self.assertEqual(self.queried_ranges[1:3], [
+            (series_range[0], datetime.datetime(2014, 9, 10, 23, 59, 59)),
+            (datetime.datetime(2014, 9, 20), series_range[1])])
+
+#-------------------------------------------------------------------------------
+
+class CompiledQueryTest(SimpleTestCase):
+    def test_values_are_bound(self):
+        query = queries.CompiledQuery("""
+            select name from t
+            where {% where_between "day" start_date end_date %}
+            and kind = '{{ kind }}' and mode in {{ modes }}
+            and name like 'a%' limit {{ limit }}""")
+        context_vars = {"start_date": "start", "end_date": "end",
+                        "kind": "1' or '1", "modes": (1, 2), "limit": 10}
+
+        statement = query._get_statement(context_vars)
+        self.assertNotIn("{", statement)
+        self.assertIn("day between %s and %s", statement)
+        self.assertIn("kind = %s and mode in (%s, %s)", statement)
+        self.assertIn("like 'a%%' limit %s", statement)
+        self.assertEqual(query.get_params(context_vars),
+                         ["start", "end", "1' or '1", 1, 2, 10])
+
+    def test_unknown_tags_are_rejected(self):
+        self.assertRaises(ValueError, queries.CompiledQuery,
+                          "select 1 {% if x %}")
+
+    def test_missing_buckets_are_filled_with_zeros(self):
+        rows = queries._fill_zeros(
+            [(datetime.date(2014, 3, 1), 5, 6)], 3,
+            datetime.datetime(2014, 1, 15), datetime.datetime(2014, 4, 2),
+            "monthly")
+        self.assertEqual(rows, [
+            (datetime.date(2014, 1, 1), 0, 0),
+            (datetime.date(2014, 2, 1), 0, 0),
+            (datetime.date(2014, 3, 1), 5, 6),
+            (datetime.date(2014, 4, 1), 0, 0)])
+
+    def test_month_end_ranges_do_not_drift(self):
+        rows = queries._fill_zeros(
+            [(datetime.date(2014, 3, 1), 5)], 2,
+            datetime.datetime(2014, 1, 31),
+            datetime.datetime(2014, 5, 31, 23, 59, 59), "monthly")
+        self.assertEqual(rows, [
+            (datetime.date(2014, 1, 1), 0),
+            (datetime.date(2014, 2, 1), 0),
+            (datetime.date(2014, 3, 1), 5),
+            (datetime.date(2014, 4, 1), 0),
+            (datetime.date(2014, 5, 1), 0)])
+
+        # A month dated on its last day is matched by its month, and doesn't
+        # move the other buckets.
+        rows = queries._fill_zeros(
+            [(datetime.date(2014, 3, 31), 5)], 2,
+            datetime.datetime(2014, 1, 31),
+            datetime.datetime(2014, 5, 31, 23, 59, 59), "monthly")
+        self.assertEqual(rows, [
+            (datetime.date(2014, 1, 1), 0),
+            (datetime.date(2014, 2, 1), 0),
+            (datetime.date(2014, 3, 31), 5),
+            (datetime.date(2014, 4, 1), 0),
+            (datetime.date(2014, 5, 1), 0)])
+
+        rows = queries._fill_zeros(
+            [(datetime.date(2013, 1, 1), 5)], 2,
+            datetime.datetime(2012, 2, 29),
+            datetime.datetime(2014, 12, 31, 23, 59, 59), "yearly")
+        self.assertEqual(rows, [
+            (datetime.date(2012, 1, 1), 0),
+            (datetime.date(2013, 1, 1), 5),
+            (datetime.date(2014, 1, 1), 0)])
+
+#-------------------------------------------------------------------------------
+
+class QueryInstrumentationTest(SimpleTestCase):
+    def test_labels_are_kept_in_parallel_queries(self):
+        with instrumentation.labelled(report="Report"):
+            with instrumentation.labelled(series="external"):
+                labels = parallel.run_in_parallel(instrumentation.get_labels,
+                                                  instrumentation.get_labels)
+        self.assertEqual(labels, [("Report", "external")] * 2)
+        self.assertEqual(instrumentation.get_labels(), (None, None))
+
+    def test_latest_records_are_read(self):
+        log_dir = tempfile.mkdtemp()
+        log_path = os.path.join(log_dir, "queries.log")
+        # The current file holds the latest records, then .1, .2, ...
+        for path, numbers in ((log_path, range(20, 30)),
+                              (log_path + ".1", range(10, 20)),
+                              (log_path + ".2", range(10))):
+            with open(path, "w") as log_file:
+                for number in numbers:
+                    log_file.write(json.dumps({"number": number}) + "\n")
+
+        saved_log_path = getattr(settings, "HOUDINI_STATS_QUERY_LOG", None)
+        settings.HOUDINI_STATS_QUERY_LOG = log_path
+        try:
+            records = list(instrumentation.read_query_log(15))
+        finally:
+            settings.HOUDINI_STATS_QUERY_LOG = saved_log_path
+            shutil.rmtree(log_dir)
+
+        self.assertEqual([record["number"] for record in records],
+                         list(range(29, 14, -1)))
+
+    def test_summary_percentiles(self):
+        records = [{"report": "Report", "series": None, "seconds": seconds,
+                    "rows": 10} for seconds in range(1, 101)]
+        records.append({"report": "Other", "series": "latest",
+                        "seconds": 0.5, "rows": 3})
+
+        summary = instrumentation.summarize_query_log(records)
+
+        self.assertEqual([row["report"] for row in summary],
+                         ["Report", "Other"])
+        self.assertEqual(summary[0]["count"], 100)
+        self.assertEqual(summary[0]["p50"], 51)
+        self.assertEqual(summary[0]["p95"], 95)
+        self.assertEqual(summary[0]["max"], 100)
+        self.assertEqual(summary[0]["average_rows"], 10)
+        self.assertEqual(summary[1]["series"], "latest")
+
+#-------------------------------------------------------------------------------
+
+class SyntheticDataTest(SimpleTestCase):
+    def test_picks_are_seeded_and_skewed(self):
+        tools = synthetic._zipf(["tool%d" % index for index in range(100)])
+        picks = [tools.pick(random.Random(seed)) for seed in range(1000)]
+
+        self.assertEqual(
+            picks, [tools.pick(random.Random(seed)) for seed in range(1000)])
+        self.assertEqual(max(set(picks), key=picks.count), "tool0")
+        self.assertGreater(picks.count("tool0"), picks.count("tool50") * 10)
+
+#-------------------------------------------------------------------------------
+
+class MinHashTest(SimpleTestCase):
+    def test_similarity_is_estimated(self):
+        values = ["value%d" % index for index in range(150)]
+        signature = minhash.get_signature(values[:100])
+        other_signature = minhash.get_signature(values[50:])
+
+        self.assertEqual(minhash.get_similarity(signature, signature), 1.0)
+        # The Jaccard similarity of the two sets is 50 / 150.
+        self.assertAlmostEqual(
+            minhash.get_similarity(signature, other_signature), 1 / 3.0,
+            delta=0.1)
+        self.assertEqual(
+            minhash.from_string(minhash.to_string(signature)), signature)
+        self.assertEqual(minhash.get_signature([]), None)
+
+#-------------------------------------------------------------------------------
+
+class RunInParallelTest(SimpleTestCase):
+    def test_results_are_returned_in_order(self):
+        def slow(value, delay):
+            time.sleep(delay)
+            return value
+
+        self.assertEqual(
+            parallel.run_in_parallel(lambda: slow(1, 0.2),
+                                     lambda: slow(2, 0.1),
+                                     lambda: slow(3, 0)),
+            [1, 2, 3])
+
+    def test_exceptions_are_raised_in_the_caller(self):
+        def fail():
+            raise ValueError("query failed")
+
+        self.assertRaises(ValueError, parallel.run_in_parallel,
+                          lambda: 1, fail)
+
+#-------------------------------------------------------------------------------
+
+class HyperLogLogTest(SimpleTestCase):
+    def _sketch(self, values):
+        sketch = hyperloglog.HyperLogLog()
+        for value in values:
+            sketch.add(value)
+        return sketch
+
+    def assertAboutEqual(self, estimate, expected):
+        # Allow three standard errors.
+        self.assertTrue(
+            abs(estimate - expected) <=
+                3 * hyperloglog.standard_error() * expected,
+            "%d is too far from %d" % (estimate, expected))
+
+    def test_count(self):
+        for num_values in (10, 1000, 100000):
+            self.assertAboutEqual(
+                self._sketch(range(num_values)).count(), num_values)
+
+    def test_count_of_a_sparse_sketch(self):
+        # Few registers are set, so the empty registers give the estimate.
+        sketch = self._sketch(["machine%d" % index for index in range(3)])
+        self.assertTrue(
+            sum(1 for register in sketch.registers if register == 0) >
+            sketch.num_registers - 3)
+        self.assertEqual(sketch.count(), 3)
+
+    def test_adding_a_value_again_does_not_change_the_sketch(self):
+        sketch = self._sketch(range(100))
+        self.assertFalse(sketch.add(50))
+
+    def test_merge_counts_the_union(self):
+        first = self._sketch(range(0, 20000))
+        second = self._sketch(range(10000, 30000))
+        self.assertAboutEqual(
+            hyperloglog.merge_all([first, second]).count(), 30000)
+
+        first.merge(second)
+        self.assertAboutEqual(first.count(), 30000)
+
+    def test_string_round_trip(self):
+        sketch = self._sketch(range(5000))
+        self.assertEqual(
+            hyperloglog.HyperLogLog.from_string(sketch.to_string()).registers,
+            sketch.registers)
+        self.assertEqual(hyperloglog.HyperLogLog.from_string("").count(), 0)
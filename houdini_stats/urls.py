@@ -4,7 +4,10 @@ try:
 except ImportError:
     from django.conf.urls.defaults import patterns, include, url
 
-urlpatterns = patterns('')
+urlpatterns = patterns('',
+    url(r'^query_timings/$', 'houdini_stats.views.query_timings',
+        name='houdini_stats_query_timings'),
+)
 
 
 
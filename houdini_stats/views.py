@@ -1 +1,19 @@
-# No views needed
\ No newline at end of file
+from django.contrib.admin.views.decorators import staff_member_required
+from django.shortcuts import render_to_response
+
+import settings
+from houdini_stats import instrumentation
+
+#-------------------------------------------------------------------------------
+
+@staff_member_required
+def query_timings(request):
+    """
+    Wall times of the report queries, from the query log.
+    """
+    return render_to_response("houdini_stats/query_timings.html", {
+        "log_path": getattr(settings, "HOUDINI_STATS_QUERY_LOG", None),
+        "max_records": getattr(
+            settings, "HOUDINI_STATS_QUERY_LOG_SUMMARY_RECORDS", 20000),
+        "summary": instrumentation.summarize_query_log(),
+    })
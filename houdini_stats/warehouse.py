@@ -0,0 +1,197 @@
+"""
+Incremental builders of the warehouse tables read by the reports.
+
+Warehouse tables hold per-machine facts that are too expensive to compute
+from the raw rows every time a report is shown. Instead of rebuilding them
+from scratch, each builder keeps a watermark with the id of the last raw row
+it processed and only reads the rows ingested since then, a chunk at a time.
+"""
+import datetime
+
+import django.db
+
+try:
+    from django.db.transaction import atomic
+except ImportError:
+    from django.db.transaction import commit_on_success as atomic
+
+from houdini_stats.models import HoudiniWarehouseWatermark
+
+#===============================================================================
+# Apprentice usage in the first 30 days
+
+APPRENTICE_USAGE_TABLE = "warehouse_ApprenticeUsageInFirst30Days"
+
+# Only the usage in this period after a machine started using an Apprentice
+# version is counted.
+APPRENTICE_USAGE_PERIOD = datetime.timedelta(days=30)
+
+#-------------------------------------------------------------------------------
+
+def create_apprentice_usage_table(using="stats"):
+    """
+    Create the Apprentice usage table if it doesn't exist. The table has one
+    row per machine and Houdini version, with the date the machine first
+    used that Apprentice version and the number of seconds Houdini was used
+    in the following 30 days.
+    """
+    cursor = django.db.connections[using].cursor()
+    cursor.execute("""
+        create table if not exists """ + APPRENTICE_USAGE_TABLE + """ (
+            machine_id integer not null,
+            houdini_major_version integer not null,
+            houdini_minor_version integer not null,
+            start_date datetime not null,
+            usage_in_seconds bigint unsigned not null,
+            primary key (machine_id, houdini_major_version,
+                         houdini_minor_version),
+            key version_start_date (houdini_major_version,
+                                    houdini_minor_version, start_date)
+        )""")
+
+def _get_watermark(table_name, using):
+    watermark, created = HoudiniWarehouseWatermark.objects.using(using) \
+        .get_or_create(table_name=table_name)
+    return watermark
+
+def _recompute_apprentice_usage(cursor, machine_id, major_version,
+                                minor_version, last_id):
+    """
+    Compute the start date and usage of a machine and Houdini version from
+    all its uptimes up to the given id. Used when the start date moves back
+    because of uptimes uploaded late.
+    """
+    version_uptimes = """
+        from houdini_stats_uptime u, stats_main_machineconfig mc,
+             houdini_stats_houdinimachineconfig hmc
+        where mc.id = u.stats_machine_config_id
+        and hmc.machine_config_id = mc.id
+        and mc.machine_id = %s
+        and hmc.is_apprentice = true
+        and hmc.houdini_major_version = %s
+        and hmc.houdini_minor_version = %s
+        and u.id <= %s"""
+    version_params = [machine_id, major_version, minor_version, last_id]
+
+    cursor.execute("select min(u.date) " + version_uptimes, version_params)
+    start_date = cursor.fetchone()[0]
+
+    cursor.execute(
+        "select coalesce(sum(u.number_of_seconds), 0) " + version_uptimes +
+        " and u.date < %s",
+        version_params + [start_date + APPRENTICE_USAGE_PERIOD])
+    return start_date, int(cursor.fetchone()[0])
+
+# The Apprentice uptimes with ids in a range, with their machine and version.
+_CHUNK_UPTIMES = """
+    select mc.machine_id, hmc.houdini_major_version as major_version,
+           hmc.houdini_minor_version as minor_version, u.date,
+           u.number_of_seconds
+    from houdini_stats_uptime u, stats_main_machineconfig mc,
+         houdini_stats_houdinimachineconfig hmc
+    where mc.id = u.stats_machine_config_id
+    and hmc.machine_config_id = mc.id
+    and u.id > %s and u.id <= %s
+    and hmc.is_apprentice = true"""
+
+def update_apprentice_usage(chunk_size=10000, using="stats", progress=None):
+    """
+    Add the Apprentice uptimes ingested since the last update to the
+    Apprentice usage table, reading chunk_size uptime ids at a time. Each
+    chunk is committed together with the watermark, so an interrupted update
+    resumes where it stopped. Without a watermark, the table is built again
+    from every uptime, since the rows it has can't be told apart from the
+    ones the update would add.
+
+    Uptimes are added in id order. Uploads that are still being written
+    when the update runs may get lower ids than rows already processed, so
+    don't run it while ingesting if every last uptime matters.
+    """
+    cursor = django.db.connections[using].cursor()
+    if not HoudiniWarehouseWatermark.objects.using(using).filter(
+            table_name=APPRENTICE_USAGE_TABLE).exists():
+        cursor.execute("drop table if exists " + APPRENTICE_USAGE_TABLE)
+    create_apprentice_usage_table(using)
+
+    cursor.execute("select max(id) from houdini_stats_uptime")
+    max_id = cursor.fetchone()[0] or 0
+
+    watermark = _get_watermark(APPRENTICE_USAGE_TABLE, using)
+    while watermark.last_id < max_id:
+        last_id = min(watermark.last_id + chunk_size, max_id)
+        chunk_range = [watermark.last_id, last_id]
+
+        with atomic(using=using):
+            # The machines and versions with uptimes before their start
+            # date, uploaded late, are recomputed from all their uptimes.
+            cursor.execute("""
+                select distinct c.machine_id, c.major_version,
+                       c.minor_version
+                from (""" + _CHUNK_UPTIMES + """) as c,
+                     """ + APPRENTICE_USAGE_TABLE + """ w
+                where w.machine_id = c.machine_id
+                and w.houdini_major_version = c.major_version
+                and w.houdini_minor_version = c.minor_version
+                and c.date < w.start_date""", chunk_range)
+            late_versions = cursor.fetchall()
+
+            # The others start at their known start date, or the date of
+            # their first uptime in the chunk, and only their uptimes in
+            # the following 30 days add to their usage.
+            cursor.execute("""
+                insert into """ + APPRENTICE_USAGE_TABLE + """
+                    (machine_id, houdini_major_version,
+                     houdini_minor_version, start_date, usage_in_seconds)
+                select u.machine_id, u.major_version, u.minor_version,
+                       s.start_date,
+                       sum(case when u.date < s.start_date + interval %s day
+                                then u.number_of_seconds else 0 end)
+                from (""" + _CHUNK_UPTIMES + """) as u,
+                     (select c.machine_id, c.major_version, c.minor_version,
+                             coalesce(w.start_date, min(c.date))
+                                 as start_date
+                      from (""" + _CHUNK_UPTIMES + """) as c
+                      left join """ + APPRENTICE_USAGE_TABLE + """ w
+                          on w.machine_id = c.machine_id
+                          and w.houdini_major_version = c.major_version
+                          and w.houdini_minor_version = c.minor_version
+                      group by c.machine_id, c.major_version,
+                               c.minor_version, w.start_date
+                      having w.start_date is null
+                          or min(c.date) >= w.start_date) as s
+                where s.machine_id = u.machine_id
+                and s.major_version = u.major_version
+                and s.minor_version = u.minor_version
+                group by u.machine_id, u.major_version, u.minor_version,
+                         s.start_date
+                on duplicate key update
+                    usage_in_seconds = usage_in_seconds +
+                                       values(usage_in_seconds)
+                """, [APPRENTICE_USAGE_PERIOD.days] + chunk_range * 2)
+
+            for machine_id, major_version, minor_version in late_versions:
+                start_date, usage_in_seconds = _recompute_apprentice_usage(
+                    cursor, machine_id, major_version, minor_version, last_id)
+                cursor.execute("""
+                    update """ + APPRENTICE_USAGE_TABLE + """
+                    set start_date = %s, usage_in_seconds = %s
+                    where machine_id = %s
+                    and houdini_major_version = %s
+                    and houdini_minor_version = %s""",
+                    [start_date, usage_in_seconds, machine_id, major_version,
+                     minor_version])
+
+            watermark.last_id = last_id
+            watermark.save(using=using)
+
+        if progress is not None:
+            progress(last_id)
+
+def rebuild_apprentice_usage(chunk_size=10000, using="stats", progress=None):
+    """
+    Drop the Apprentice usage table and build it again from every uptime.
+    """
+    HoudiniWarehouseWatermark.objects.using(using).filter(
+        table_name=APPRENTICE_USAGE_TABLE).delete()
+
+    update_apprentice_usage(chunk_size, using=using, progress=progress)
@@ -8,14 +8,60 @@ REPORT_MODULES += (
      'houdini_stats.reports.houdini',
 )
 
-# SESI internal machines ip patterns
-# You can modify this variable to set your own IP patterns for your internal 
-# machines
-IP_PATTERNS = ["192.168.%%", "10.1.%%"]
+# SESI internal networks, in CIDR notation
+# You can modify this variable to set your own networks for your internal 
+# machines. Machine configs are classified when they are saved, so run the
+# classify_machine_configs, rebuild_tool_usage_rollup,
+# rebuild_machine_activity_rollup, rebuild_machine_sketches and
+# rebuild_crash_group_rollup management commands after changing it.
+INTERNAL_NETWORKS = ["192.168.0.0/16", "10.1.0.0/16"]
 
-# Houdini versions to compare 
+# Houdini versions to compare. The menus list an Apprentice usage report
+# for each of them.
 HOUDINI_VERSIONS = [14, 13]
 
+# Maximum number of rows written in one INSERT statement when saving the data
+# of an upload (see houdini_stats/ingestion.py)
+HOUDINI_STATS_INGEST_BATCH_SIZE = 500
+
+# Report data cache (see houdini_stats/caching.py): maximum number of cached
+# results per process and how long they are kept, in seconds
+HOUDINI_STATS_REPORT_CACHE_SIZE = 200
+HOUDINI_STATS_REPORT_CACHE_TTL = 60 * 60
+
+# How long, in seconds, report data is also kept in the django cache, where
+# all the processes find it (0 disables it). The prewarm_reports management
+# command fills it, so use a backend shared by processes, like memcached.
+HOUDINI_STATS_SHARED_CACHE_TTL = 60 * 60 * 24
+
+# How long, in seconds, the report data computed by prewarm_reports is still
+# shown once new uploads change it. The prewarmed ranges end today, so
+# without it the first upload after the nightly run invalidates all of them.
+HOUDINI_STATS_PREWARM_STALE_TTL = 60 * 60 * 12
+
+# Maximum number of time series whose finished buckets are kept in memory by
+# each process, and how long, in seconds, they are kept. The management
+# commands that rebuild the rollups or regroup the crashes invalidate them.
+HOUDINI_STATS_CLOSED_BUCKET_CACHE_SIZE = 1000
+HOUDINI_STATS_CLOSED_BUCKET_CACHE_TTL = 60 * 60 * 24
+
+# The ingest watermark that invalidates the cached reports is also kept in
+# the django cache, unless its backend is private to each process (the
+# default LocMemCache, or DummyCache), in which case it is kept in the
+# houdini_stats_houdiniwarehousewatermark table, costing a query per cached
+# report shown. Configure a shared backend in CACHES, for example:
+#
+# CACHES = {
+#     "default": {
+#         "BACKEND": "django.core.cache.backends.memcached.MemcachedCache",
+#         "LOCATION": "127.0.0.1:11211",
+#     }
+# }
+
+# Number of days after which uploads are not expected to add data for a day
+# anymore. Cached results for older days are not invalidated by new uploads.
+HOUDINI_STATS_SETTLE_DAYS = 3
+
 # Default layout - horizontal menu by reports category 
 default_menu_and_report_options = OrderedDict([
     ("usage", {
@@ -57,8 +103,8 @@ default_menu_and_report_options = OrderedDict([
                  
             ]),             
             ("uptimes_apprentice", "Apprentice Uptimes", [
-                "BreakdownOfApprenticeUsageH13",
-                "BreakdownOfApprenticeUsageH14",
+                "BreakdownOfApprenticeUsageH%s" % version
+                for version in sorted(HOUDINI_VERSIONS)
             ]),
         ],
         "groups":['staff', 'r&d'],
@@ -82,6 +128,10 @@ default_menu_and_report_options = OrderedDict([
             ("crashes_by_product", "Crashes by Product",[
                 "CrashesByProduct",
             ]),
+            ("crash_groups", "Crash Groups", [
+                "TopCrashGroupsOverTime",
+                "RegressedCrashGroups",
+            ]),
         ],
         "groups":['staff', 'r&d'],
     }),
@@ -123,9 +173,8 @@ dropdown_menu_and_report_options = OrderedDict([
             ("uptime", "Session Information", [
                 "AverageSessionLength",
                 "AverageUsageByMachine",
-                "BreakdownOfApprenticeUsageH13",
-                "BreakdownOfApprenticeUsageH14",
-            ]),
+            ] + ["BreakdownOfApprenticeUsageH%s" % version
+                 for version in sorted(HOUDINI_VERSIONS)]),
             ("tools_usage", "Shelf & Tab menu Tools", [
                 "MostPopularTools",
                 "MostPopularToolsShelf",
@@ -146,6 +195,8 @@ dropdown_menu_and_report_options = OrderedDict([
                 "CrashesByOSInternalMachines",
                 "CrashesByProductExternalMachines",
                 "CrashesByProductInternalMachines",
+                "TopCrashGroupsOverTime",
+                "RegressedCrashGroups",
             ]),             
         ],
         "groups": ['staff', 'r&d'],
@@ -162,3 +213,33 @@ if "MENU_LAYOUT" not in globals():
 
 TOP_MENU_OPTIONS = OrderedDict(TOP_MENU_OPTIONS.items() + \
                                menu_layouts[MENU_LAYOUT].items())
+
+# Maximum number of report queries run at the same time, each on its own
+# database connection (see houdini_stats/parallel.py). 1 runs them serially.
+HOUDINI_STATS_REPORT_QUERY_THREADS = 4
+
+# File where the wall time of every report query is logged, one JSON line per
+# query (None disables it). It is rotated once it reaches the maximum size,
+# keeping the given number of old files, and summarized, with p50/p95 times
+# per report, by the staff only houdini_stats/query_timings/ page.
+HOUDINI_STATS_QUERY_LOG = None
+HOUDINI_STATS_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+HOUDINI_STATS_QUERY_LOG_BACKUP_COUNT = 5
+# Number of the latest queries summarized by the page, which reads the log
+# files backwards so it doesn't parse all of them.
+HOUDINI_STATS_QUERY_LOG_SUMMARY_RECORDS = 20000
+
+# Also log the EXPLAIN output of every report query. It runs an extra query
+# per report query, so only turn it on while investigating slow reports.
+HOUDINI_STATS_QUERY_LOG_EXPLAIN = False
+
+# Number of top stack trace frames, once normalized, that identify a crash
+# group (see houdini_stats/crash_groups.py). Changing it only affects the
+# crashes ingested afterwards.
+HOUDINI_STATS_CRASH_FINGERPRINT_FRAMES = 8
+
+# Minimum similarity, between 0 and 1, of the frames of two crash groups for
+# them to be merged as near duplicates, at ingest and by the
+# cluster_crash_groups management command. Below 0.5 most near duplicates
+# aren't found.
+HOUDINI_STATS_CRASH_SIMILARITY_THRESHOLD = 0.7